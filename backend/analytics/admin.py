@@ -1 +1,17 @@
 from django.contrib import admin
+from .models import Notification, SlowQuery
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['title', 'type', 'severity', 'timestamp', 'created_at']
+    list_filter = ['type', 'severity', 'created_at']
+    search_fields = ['title', 'message']
+    raw_id_fields = ['machine', 'spare_part', 'work_order']
+    readonly_fields = ['event_key', 'created_at']
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['statement', 'duration_ms', 'view', 'captured_at']
+    list_filter = ['view', 'captured_at']
+    search_fields = ['statement', 'fingerprint']
+    readonly_fields = ['fingerprint', 'statement', 'duration_ms', 'view', 'plan', 'captured_at']
@@ -0,0 +1,183 @@
+"""Pub/sub behind the live event stream (``/api/stream/``).
+
+Each event is ``(type, machine_pk, payload)`` with the payload already
+rendered as JSON, so it is encoded once no matter how many connections
+receive it. Without ``EVENT_BROKER_URL`` events only reach streams served by
+the same process. With a Redis URL every process publishes to one Redis
+channel and each process that serves streams runs a single listener that
+fans messages out locally, so events raised in Celery workers reach every
+web worker.
+
+Subscribers have bounded queues. A subscriber whose queue fills up is sent
+``OVERFLOW`` and dropped instead of buffering without limit; SSE clients
+reconnect on their own.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'factory_maintenance:events'
+EVENT_TYPES = ('reading', 'anomaly', 'work_order', 'notification')
+OVERFLOW = object()
+REDIS_RETRY_SECONDS = 1
+
+class Subscription:
+    def __init__(self, broker, machine_pks, event_types, loop):
+        self.broker = broker
+        self.machine_pks = machine_pks
+        self.event_types = event_types
+        self.loop = loop
+        self.queue = asyncio.Queue(settings.STREAM_QUEUE_SIZE)
+        self.closed = False
+    
+    def deliver(self, event):
+        """Queue ``event``; runs on the subscriber's event loop."""
+        if self.closed or event[0] not in self.event_types:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.closed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+    
+    async def get(self):
+        return await self.queue.get()
+    
+    def close(self):
+        self.closed = True
+        self.broker.unsubscribe(self)
+
+class LocalBroker:
+    """Fans events out to the subscribers of this process."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_machine = defaultdict(set)
+        self._everything = set()
+    
+    def subscribe(self, machine_pks=None, event_types=EVENT_TYPES):
+        """Subscribe the running event loop to events of ``machine_pks`` (default: all machines)."""
+        subscription = Subscription(self, machine_pks, frozenset(event_types), asyncio.get_running_loop())
+        with self._lock:
+            if machine_pks is None:
+                self._everything.add(subscription)
+            for machine_pk in machine_pks or ():
+                self._by_machine[machine_pk].add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._everything.discard(subscription)
+            for machine_pk in subscription.machine_pks or ():
+                subscribers = self._by_machine.get(machine_pk)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._by_machine[machine_pk]
+    
+    def dispatch(self, event):
+        """Deliver ``event`` to matching local subscribers; safe to call from any thread."""
+        with self._lock:
+            targets = set(self._everything)
+            if event[1] is None:
+                targets.update(*self._by_machine.values())
+            else:
+                targets.update(self._by_machine.get(event[1], ()))
+        
+        by_loop = defaultdict(list)
+        for subscription in targets:
+            by_loop[subscription.loop].append(subscription)
+        for loop, subscriptions in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver_all, subscriptions, event)
+            except RuntimeError:
+                # The loop has shut down; its subscriptions go with it.
+                for subscription in subscriptions:
+                    self.unsubscribe(subscription)
+    
+    def publish(self, event):
+        self.dispatch(event)
+    
+    def publish_many(self, events):
+        for event in events:
+            self.dispatch(event)
+
+class RedisBroker(LocalBroker):
+    """Publishes through a Redis channel so every process sees every event."""
+    
+    def __init__(self, url):
+        super().__init__()
+        import redis
+        
+        self._url = url
+        self._client = redis.Redis.from_url(url)
+        self._listeners = {}
+    
+    def subscribe(self, *args, **kwargs):
+        subscription = super().subscribe(*args, **kwargs)
+        listener = self._listeners.get(subscription.loop)
+        if listener is None or listener.done():
+            self._listeners[subscription.loop] = subscription.loop.create_task(self._listen())
+        return subscription
+    
+    def publish(self, event):
+        self.publish_many([event])
+    
+    def publish_many(self, events):
+        """Publish ``events`` in one pipelined round trip to Redis."""
+        try:
+            pipeline = self._client.pipeline(transaction=False)
+            for event in events:
+                pipeline.publish(CHANNEL, json.dumps(event))
+            pipeline.execute()
+        except Exception:
+            # Live updates are best effort; never fail the write that raised them.
+            logger.exception('Could not publish %d %s events', len(events), events[0][0])
+    
+    async def _listen(self):
+        import redis.asyncio as aioredis
+        
+        while True:
+            try:
+                client = aioredis.Redis.from_url(self._url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.dispatch(tuple(json.loads(message['data'])))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Event listener lost its Redis connection, reconnecting')
+                await asyncio.sleep(REDIS_RETRY_SECONDS)
+
+def _deliver_all(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.deliver(event)
+
+_broker = None
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = RedisBroker(settings.EVENT_BROKER_URL) if settings.EVENT_BROKER_URL else LocalBroker()
+    return _broker
+
+def publish(event_type, data, machine_pk=None):
+    """Send an event of ``event_type`` with JSON-serializable ``data`` to the streams."""
+    get_broker().publish((event_type, machine_pk, json.dumps(data, cls=DjangoJSONEncoder)))
+
+def publish_many(event_type, events):
+    """Send ``(data, machine_pk)`` events of ``event_type`` to the streams together."""
+    if events:
+        get_broker().publish_many([
+            (event_type, machine_pk, json.dumps(data, cls=DjangoJSONEncoder)) for data, machine_pk in events
+        ])
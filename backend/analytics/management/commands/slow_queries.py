@@ -0,0 +1,57 @@
+from datetime import timedelta
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg, Count, Max, Sum
+from django.utils import timezone
+from analytics.models import SlowQuery
+
+
+class Command(BaseCommand):
+    help = 'Summarize sampled slow queries by fingerprint, most total time first'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('fingerprint', nargs='?', help='Show one fingerprint with its latest plan')
+        parser.add_argument('--hours', type=int, default=24, help='Only queries from the last N hours (default: 24)')
+        parser.add_argument('--view', help='Only queries run by this view (URL name)')
+        parser.add_argument('--limit', type=int, default=20, help='Fingerprints to list (default: 20)')
+    
+    def handle(self, *args, **options):
+        queries = SlowQuery.objects.filter(captured_at__gte=timezone.now() - timedelta(hours=options['hours']))
+        if options['view']:
+            queries = queries.filter(view=options['view'])
+        if options['fingerprint']:
+            queries = queries.filter(fingerprint__startswith=options['fingerprint'])
+        
+        summary = list(
+            queries.values('fingerprint')
+            .annotate(calls=Count('id'), total_ms=Sum('duration_ms'), mean_ms=Avg('duration_ms'),
+                      max_ms=Max('duration_ms'), statement=Max('statement'),
+                      views=ArrayAgg('view', distinct=True, default=[]))
+            .order_by('-total_ms')[:options['limit']]
+        )
+        if options['fingerprint']:
+            if len(summary) != 1:
+                raise CommandError(f"{len(summary) or 'No'} fingerprints match {options['fingerprint']}")
+            self.show(summary[0], queries.exclude(plan='').first())
+            return
+        if not summary:
+            self.stdout.write(f"No slow queries in the last {options['hours']} hours")
+            return
+        
+        self.stdout.write(f"{'fingerprint':12} {'total ms':>10} {'calls':>6} {'mean ms':>9} {'max ms':>9}  views / statement")
+        for row in summary:
+            views = ', '.join(view or '-' for view in row['views'])
+            self.stdout.write(
+                f"{row['fingerprint'][:12]} {row['total_ms']:10.0f} {row['calls']:6} {row['mean_ms']:9.1f} "
+                f"{row['max_ms']:9.1f}  {views}\n{'':12} {row['statement'][:200]}"
+            )
+    
+    def show(self, row, sample):
+        self.stdout.write(f"Fingerprint {row['fingerprint']}: {row['calls']} calls, {row['total_ms']:.0f} ms total, "
+                          f"{row['mean_ms']:.1f} ms mean, {row['max_ms']:.1f} ms max")
+        self.stdout.write(f"Views: {', '.join(view or '-' for view in row['views'])}\n\n{row['statement']}\n")
+        if sample is None:
+            self.stdout.write('No plan captured yet; raise SLOW_QUERY_EXPLAIN_RATE to sample more.')
+        else:
+            self.stdout.write(f"Plan captured {timezone.localtime(sample.captured_at):%Y-%m-%d %H:%M:%S} "
+                              f"({sample.duration_ms:.1f} ms):\n{sample.plan}")
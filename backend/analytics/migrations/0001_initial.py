@@ -0,0 +1,63 @@
+# Generated by Django 5.1 on 2026-10-18 12:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('machines', '0010_machinehealthscore'),
+        ('maintenance', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('ANOMALY_DETECTED', 'Anomaly Detected'), ('OVERDUE_MAINTENANCE', 'Overdue Maintenance'), ('UPCOMING_MAINTENANCE', 'Upcoming Maintenance'), ('LOW_STOCK', 'Low Stock'), ('PENDING_WORK_ORDER', 'Pending Work Order')], max_length=30)),
+                ('severity', models.CharField(choices=[('CRITICAL', 'Critical'), ('HIGH', 'High'), ('MEDIUM', 'Medium'), ('LOW', 'Low')], max_length=10)),
+                ('title', models.CharField(max_length=200)),
+                ('message', models.TextField()),
+                ('event_key', models.CharField(max_length=100, unique=True)),
+                ('timestamp', models.DateTimeField(help_text='When the event happened')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('machine', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='machines.machine')),
+                ('spare_part', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='maintenance.sparepart')),
+                ('work_order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='maintenance.workorder')),
+            ],
+            options={
+                'db_table': 'notifications',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='NotificationRead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_at', models.DateTimeField(auto_now_add=True)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reads', to='analytics.notification')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_reads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'notification_reads',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['severity', '-id'], name='notificatio_severit_084fa1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['type', '-id'], name='notificatio_type_bc74b2_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='notificationread',
+            constraint=models.UniqueConstraint(fields=('user', 'notification'), name='unique_notification_read'),
+        ),
+    ]
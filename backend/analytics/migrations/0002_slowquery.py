@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(db_index=True, max_length=32)),
+                ('statement', models.TextField(help_text='The SQL with literals and parameters replaced by ?')),
+                ('duration_ms', models.FloatField()),
+                ('view', models.CharField(blank=True, help_text='URL name of the view that ran it', max_length=200)),
+                ('plan', models.TextField(blank=True, help_text='EXPLAIN (ANALYZE, BUFFERS) output, for sampled SELECTs')),
+                ('captured_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'slow_queries',
+                'ordering': ['-captured_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+"""Create the table of the database cache used when ``CACHE_URL`` is unset."""
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # A no-op for caches that are not database caches, or whose table exists.
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_slowquery'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
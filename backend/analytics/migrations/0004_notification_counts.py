@@ -0,0 +1,108 @@
+"""Per-severity counters of notifications, and of each user's reads, for unread counts.
+
+Row-level triggers keep the counters exact on every insert and delete of a
+notification or a read, including bulk inserts that skip conflicts and
+cascading deletes, and move them when a notification's severity changes.
+Either side of a notification's deletion may go first (foreign keys are
+deferred), so a read is counted off through whichever goes first while the
+other still exists.
+"""
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+COUNT_NOTIFICATIONS = """
+CREATE FUNCTION count_notifications() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        UPDATE notification_counts SET total = total - 1 WHERE severity = OLD.severity;
+        UPDATE notification_read_counts counts SET total = counts.total - 1
+        FROM notification_reads reads
+        WHERE reads.notification_id = OLD.id AND counts.user_id = reads.user_id
+          AND counts.severity = OLD.severity;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        INSERT INTO notification_counts (severity, total) VALUES (NEW.severity, 1)
+        ON CONFLICT (severity) DO UPDATE SET total = notification_counts.total + 1;
+        INSERT INTO notification_read_counts (user_id, severity, total)
+        SELECT user_id, NEW.severity, 1 FROM notification_reads WHERE notification_id = NEW.id
+        ON CONFLICT (user_id, severity) DO UPDATE SET total = notification_read_counts.total + 1;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER count_notifications AFTER INSERT OR DELETE OR UPDATE OF severity ON notifications
+FOR EACH ROW EXECUTE FUNCTION count_notifications();
+
+CREATE FUNCTION count_notification_reads() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO notification_read_counts (user_id, severity, total)
+        SELECT NEW.user_id, severity, 1 FROM notifications WHERE id = NEW.notification_id
+        ON CONFLICT (user_id, severity) DO UPDATE SET total = notification_read_counts.total + 1;
+    ELSE
+        UPDATE notification_read_counts counts SET total = counts.total - 1
+        FROM notifications
+        WHERE notifications.id = OLD.notification_id AND counts.user_id = OLD.user_id
+          AND counts.severity = notifications.severity;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER count_notification_reads AFTER INSERT OR DELETE ON notification_reads
+FOR EACH ROW EXECUTE FUNCTION count_notification_reads();
+
+-- Counted while writers are blocked, so nothing lands between the triggers and the backfill.
+LOCK TABLE notifications, notification_reads IN SHARE MODE;
+INSERT INTO notification_counts (severity, total)
+SELECT severity, COUNT(*) FROM notifications GROUP BY severity;
+INSERT INTO notification_read_counts (user_id, severity, total)
+SELECT reads.user_id, notifications.severity, COUNT(*)
+FROM notification_reads reads JOIN notifications ON notifications.id = reads.notification_id
+GROUP BY reads.user_id, notifications.severity;
+"""
+
+DROP_COUNTERS = """
+DROP TRIGGER count_notification_reads ON notification_reads;
+DROP FUNCTION count_notification_reads();
+DROP TRIGGER count_notifications ON notifications;
+DROP FUNCTION count_notifications();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_cache_table'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCount',
+            fields=[
+                ('severity', models.CharField(choices=[('CRITICAL', 'Critical'), ('HIGH', 'High'), ('MEDIUM', 'Medium'), ('LOW', 'Low')], max_length=10, primary_key=True, serialize=False)),
+                ('total', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'notification_counts',
+            },
+        ),
+        migrations.CreateModel(
+            name='NotificationReadCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('severity', models.CharField(choices=[('CRITICAL', 'Critical'), ('HIGH', 'High'), ('MEDIUM', 'Medium'), ('LOW', 'Low')], max_length=10)),
+                ('total', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_read_counts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'notification_read_counts',
+                'constraints': [models.UniqueConstraint(fields=('user', 'severity'), name='unique_notification_read_count')],
+            },
+        ),
+        migrations.RunSQL(COUNT_NOTIFICATIONS, DROP_COUNTERS),
+    ]
@@ -1 +1,103 @@
 from django.db import models
+from authentication.models import CustomUser
+from machines.models import Machine
+from maintenance.models import SparePart, WorkOrder
+
+class Notification(models.Model):
+    """A feed entry, created once when its event happens (see ``analytics/notifications.py``)."""
+    TYPE_CHOICES = [
+        ('ANOMALY_DETECTED', 'Anomaly Detected'),
+        ('OVERDUE_MAINTENANCE', 'Overdue Maintenance'),
+        ('UPCOMING_MAINTENANCE', 'Upcoming Maintenance'),
+        ('LOW_STOCK', 'Low Stock'),
+        ('PENDING_WORK_ORDER', 'Pending Work Order'),
+    ]
+    
+    SEVERITY_CHOICES = [
+        ('CRITICAL', 'Critical'),
+        ('HIGH', 'High'),
+        ('MEDIUM', 'Medium'),
+        ('LOW', 'Low'),
+    ]
+    
+    type = models.CharField(max_length=30, choices=TYPE_CHOICES)
+    severity = models.CharField(max_length=10, choices=SEVERITY_CHOICES)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    spare_part = models.ForeignKey(SparePart, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    work_order = models.ForeignKey(WorkOrder, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    
+    # Identifies the event, so re-running an evaluation never duplicates it.
+    event_key = models.CharField(max_length=100, unique=True)
+    timestamp = models.DateTimeField(help_text="When the event happened")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'notifications'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['severity', '-id']),
+            models.Index(fields=['type', '-id']),
+        ]
+    
+    def __str__(self):
+        return self.title
+
+class NotificationRead(models.Model):
+    """Marks a notification as read by one user; unread is the absence of a row."""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notification_reads')
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='reads')
+    read_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'notification_reads'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'notification'], name='unique_notification_read'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} read {self.notification_id}"
+
+class NotificationCount(models.Model):
+    """Notifications of one severity; kept by a database trigger (migration 0004)."""
+    severity = models.CharField(max_length=10, primary_key=True, choices=Notification.SEVERITY_CHOICES)
+    total = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'notification_counts'
+    
+    def __str__(self):
+        return f"{self.total} {self.severity} notifications"
+
+class NotificationReadCount(models.Model):
+    """Notifications of one severity read by a user; kept by a database trigger (migration 0004)."""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notification_read_counts')
+    severity = models.CharField(max_length=10, choices=Notification.SEVERITY_CHOICES)
+    total = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'notification_read_counts'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'severity'], name='unique_notification_read_count'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} read {self.total} {self.severity} notifications"
+
+class SlowQuery(models.Model):
+    """A query that took longer than ``SLOW_QUERY_MS`` (see ``analytics/slow_queries.py``)."""
+    fingerprint = models.CharField(max_length=32, db_index=True)
+    statement = models.TextField(help_text="The SQL with literals and parameters replaced by ?")
+    duration_ms = models.FloatField()
+    view = models.CharField(max_length=200, blank=True, help_text="URL name of the view that ran it")
+    plan = models.TextField(blank=True, help_text="EXPLAIN (ANALYZE, BUFFERS) output, for sampled SELECTs")
+    captured_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'slow_queries'
+        ordering = ['-captured_at']
+    
+    def __str__(self):
+        return f"{self.duration_ms:.0f} ms: {self.statement[:80]}"
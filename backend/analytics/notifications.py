@@ -1,103 +1,147 @@
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.response import Response
-from django.utils import timezone
+"""Notification feed: rows are created when their event happens, not per request.
+
+Anomalies and low stock are recorded from signals as they occur; due and
+overdue maintenance and pending work orders are evaluated once a day by
+``analytics.tasks.evaluate_notifications``. Every notification carries an
+``event_key``, so an event that is reported twice only produces one row.
+"""
 from datetime import timedelta
-from machines.models import Machine, MachineReading
-from maintenance.models import SparePart, WorkOrder
-from django.db.models import F
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from machines.models import Machine
+from maintenance.models import WorkOrder
+from .events import publish
+from .models import Notification, NotificationRead
+from .serializers import NotificationSerializer
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def get_notifications(request):
-    notifications = []
-    
-    today = timezone.now().date()
-    
-    overdue_machines = Machine.objects.filter(
-        next_maintenance_date__lt=today
-    ).values('id', 'machine_id', 'machine_name', 'next_maintenance_date')
-    
-    for machine in overdue_machines:
-        days_overdue = (today - machine['next_maintenance_date']).days
-        notifications.append({
-            'type': 'OVERDUE_MAINTENANCE',
-            'severity': 'HIGH',
-            'title': f"Maintenance Overdue: {machine['machine_id']}",
-            'message': f"{machine['machine_name']} is {days_overdue} days overdue for maintenance",
-            'machine_id': machine['machine_id'],
-            'timestamp': timezone.now().isoformat()
-        })
-    
-    upcoming_machines = Machine.objects.filter(
-        next_maintenance_date__gte=today,
-        next_maintenance_date__lte=today + timedelta(days=3)
-    ).values('id', 'machine_id', 'machine_name', 'next_maintenance_date')
-    
-    for machine in upcoming_machines:
-        days_until = (machine['next_maintenance_date'] - today).days
-        notifications.append({
-            'type': 'UPCOMING_MAINTENANCE',
-            'severity': 'MEDIUM',
-            'title': f"Maintenance Due Soon: {machine['machine_id']}",
-            'message': f"{machine['machine_name']} maintenance due in {days_until} days",
-            'machine_id': machine['machine_id'],
-            'timestamp': timezone.now().isoformat()
-        })
-    
-    recent_anomalies = MachineReading.objects.filter(
-        is_anomaly=True,
-        timestamp__gte=timezone.now() - timedelta(hours=24)
-    ).select_related('machine').values('machine__machine_id', 'machine__machine_name', 'anomaly_reason', 'timestamp')
-    
-    for anomaly in recent_anomalies:
-        notifications.append({
-            'type': 'ANOMALY_DETECTED',
-            'severity': 'CRITICAL',
-            'title': f"Anomaly Detected: {anomaly['machine__machine_id']}",
-            'message': anomaly['anomaly_reason'],
-            'machine_id': anomaly['machine__machine_id'],
-            'timestamp': anomaly['timestamp'].isoformat()
-        })
-    
-    low_stock_parts = SparePart.objects.filter(
-        quantity_in_stock__lte=F('minimum_stock_level')
-    ).values('part_id', 'part_name', 'quantity_in_stock', 'minimum_stock_level')
+UPCOMING_MAINTENANCE_DAYS = 3
+# Anomalies older than this when they are flagged, e.g. from a history
+# import, are not worth a notification.
+ANOMALY_MAX_AGE = timedelta(hours=24)
+
+def create_notifications(notifications):
+    """Insert ``notifications``, skipping events that already have one. Returns the new notifications."""
+    if not notifications:
+        return []
+    existing = set(Notification.objects.filter(
+        event_key__in=[notification.event_key for notification in notifications]
+    ).values_list('event_key', flat=True))
+    new = [notification for notification in notifications if notification.event_key not in existing]
+    # A concurrent writer may still win the race for a key; the unique
+    # constraint keeps that a no-op.
+    Notification.objects.bulk_create(new, ignore_conflicts=True)
+    if new:
+        transaction.on_commit(lambda: _stream([notification.event_key for notification in new]))
+    return new
+
+def _stream(event_keys):
+    created = Notification.objects.filter(event_key__in=event_keys).select_related('machine', 'spare_part', 'work_order')
+    for notification in created:
+        publish('notification', NotificationSerializer(notification).data, notification.machine_id)
+
+def notify_anomalies(anomalies, now=None):
+    """Create a notification per ``(machine_pk, reading_pk, timestamp, reason)`` flagged in the last day."""
+    now = now or timezone.now()
+    anomalies = [anomaly for anomaly in anomalies if anomaly[2] >= now - ANOMALY_MAX_AGE]
+    codes = dict(Machine.objects.filter(pk__in={anomaly[0] for anomaly in anomalies}).values_list('pk', 'machine_id'))
+    return create_notifications([
+        Notification(
+            type='ANOMALY_DETECTED',
+            severity='CRITICAL',
+            title=f"Anomaly Detected: {codes[machine_pk]}",
+            message=reason,
+            machine_id=machine_pk,
+            event_key=f'anomaly:{reading_pk}',
+            timestamp=timestamp,
+        )
+        for machine_pk, reading_pk, timestamp, reason in anomalies
+        if machine_pk in codes
+    ])
+
+def notify_low_stock(part, now=None):
+    """Record that ``part`` has just dropped to or below its minimum stock level."""
+    now = now or timezone.now()
+    return create_notifications([Notification(
+        type='LOW_STOCK',
+        severity='MEDIUM',
+        title=f"Low Stock: {part.part_name}",
+        message=f"Stock level: {part.quantity_in_stock} (Min: {part.minimum_stock_level})",
+        spare_part=part,
+        event_key=f'low_stock:{part.pk}:{now.isoformat()}',
+        timestamp=now,
+    )])
+
+def evaluate_maintenance(now=None):
+    """Daily: notify overdue and upcoming maintenance and work orders that are due but not started.
     
-    for part in low_stock_parts:
-        notifications.append({
-            'type': 'LOW_STOCK',
-            'severity': 'MEDIUM',
-            'title': f"Low Stock: {part['part_name']}",
-            'message': f"Stock level: {part['quantity_in_stock']} (Min: {part['minimum_stock_level']})",
-            'part_id': part['part_id'],
-            'timestamp': timezone.now().isoformat()
-        })
+    Overdue machines get one notification per day; upcoming maintenance and
+    pending work orders one per scheduled date.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    notifications = []
     
-    pending_work_orders = WorkOrder.objects.filter(
-        status='PENDING',
-        scheduled_date__lte=today
-    ).values('work_order_id', 'machine__machine_id', 'title', 'scheduled_date')
+    machines = Machine.objects.filter(
+        next_maintenance_date__lte=today + timedelta(days=UPCOMING_MAINTENANCE_DAYS)
+    ).values_list('pk', 'machine_id', 'machine_name', 'next_maintenance_date')
+    for pk, code, name, due in machines:
+        if due < today:
+            notifications.append(Notification(
+                type='OVERDUE_MAINTENANCE',
+                severity='HIGH',
+                title=f"Maintenance Overdue: {code}",
+                message=f"{name} is {(today - due).days} days overdue for maintenance",
+                machine_id=pk,
+                event_key=f'overdue:{pk}:{today}',
+                timestamp=now,
+            ))
+        else:
+            notifications.append(Notification(
+                type='UPCOMING_MAINTENANCE',
+                severity='MEDIUM',
+                title=f"Maintenance Due Soon: {code}",
+                message=f"{name} maintenance due in {(due - today).days} days",
+                machine_id=pk,
+                event_key=f'upcoming:{pk}:{due}',
+                timestamp=now,
+            ))
     
-    for wo in pending_work_orders:
-        notifications.append({
-            'type': 'PENDING_WORK_ORDER',
-            'severity': 'MEDIUM',
-            'title': f"Pending Work Order: {wo['work_order_id']}",
-            'message': f"{wo['title']} for {wo['machine__machine_id']} scheduled on {wo['scheduled_date']}",
-            'work_order_id': wo['work_order_id'],
-            'timestamp': timezone.now().isoformat()
-        })
+    work_orders = WorkOrder.objects.filter(status='PENDING', scheduled_date__lte=today).values_list(
+        'pk', 'work_order_id', 'title', 'machine__machine_id', 'machine_id', 'scheduled_date'
+    )
+    for pk, code, title, machine_code, machine_pk, scheduled in work_orders:
+        notifications.append(Notification(
+            type='PENDING_WORK_ORDER',
+            severity='MEDIUM',
+            title=f"Pending Work Order: {code}",
+            message=f"{title} for {machine_code} scheduled on {scheduled}",
+            machine_id=machine_pk,
+            work_order_id=pk,
+            event_key=f'pending_work_order:{pk}:{scheduled}',
+            timestamp=now,
+        ))
     
-    notifications.sort(key=lambda x: (
-        {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3}[x['severity']],
-        x['timestamp']
-    ), reverse=True)
+    return create_notifications(notifications)
+
+def purge_notifications(now=None):
+    """Delete notifications older than ``NOTIFICATION_RETENTION_DAYS``, with their read state."""
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS)
+    return Notification.objects.filter(created_at__lt=cutoff).delete()[0]
+
+def unread_counts(user):
+    """Unread notifications of ``user`` in total and by severity.
     
-    return Response({
-        'total': len(notifications),
-        'critical': len([n for n in notifications if n['severity'] == 'CRITICAL']),
-        'high': len([n for n in notifications if n['severity'] == 'HIGH']),
-        'medium': len([n for n in notifications if n['severity'] == 'MEDIUM']),
-        'notifications': notifications
-    })
+    Read from the per-severity counters that triggers keep (migration 0004),
+    so the cost does not grow with the notification history.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT counts.severity, counts.total - COALESCE(reads.total, 0)
+            FROM notification_counts counts
+            LEFT JOIN notification_read_counts reads ON reads.severity = counts.severity AND reads.user_id = %s
+        """, [user.pk])
+        unread = dict(cursor.fetchall())
+    by_severity = {severity.lower(): unread.get(severity, 0) for severity, _ in Notification.SEVERITY_CHOICES}
+    return {'unread': sum(by_severity.values()), **by_severity}
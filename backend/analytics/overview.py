@@ -0,0 +1,55 @@
+"""Fleet-wide counts for the dashboard overview, cached between changes.
+
+The counts are computed with one conditional-aggregation query per table and
+kept in the default cache until a signal in ``analytics.signals`` reports a
+change that could affect them.
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+from machines.models import Machine
+from maintenance.models import SparePart, WorkOrder
+
+OVERVIEW_CACHE_KEY = 'analytics:dashboard_overview'
+# Backstop only; signals invalidate the entry as soon as the data changes.
+OVERVIEW_CACHE_TIMEOUT = 60 * 60
+
+def build_overview():
+    machines = Machine.objects.aggregate(
+        total_machines=Count('pk'),
+        operational=Count('pk', filter=Q(status='OPERATIONAL')),
+        under_maintenance=Count('pk', filter=Q(status='UNDER_MAINTENANCE')),
+        down=Count('pk', filter=Q(status='DOWN')),
+        green=Count('pk', filter=Q(health_status='GREEN')),
+        yellow=Count('pk', filter=Q(health_status='YELLOW')),
+        red=Count('pk', filter=Q(health_status='RED')),
+        critical=Count('pk', filter=Q(health_status='CRITICAL')),
+    )
+    work_orders = WorkOrder.objects.aggregate(
+        pending_work_orders=Count('pk', filter=Q(status='PENDING')),
+        in_progress_work_orders=Count('pk', filter=Q(status='IN_PROGRESS')),
+        completed_work_orders=Count('pk', filter=Q(status='COMPLETED')),
+    )
+    parts = SparePart.objects.aggregate(
+        low_stock_parts=Count('pk', filter=Q(quantity_in_stock__lte=F('minimum_stock_level'))),
+    )
+    
+    return {
+        'total_machines': machines['total_machines'],
+        'operational': machines['operational'],
+        'under_maintenance': machines['under_maintenance'],
+        'down': machines['down'],
+        'health_status': {status: machines[status] for status in ('green', 'yellow', 'red', 'critical')},
+        **work_orders,
+        **parts,
+    }
+
+def get_overview():
+    overview = cache.get(OVERVIEW_CACHE_KEY)
+    if overview is None:
+        overview = build_overview()
+        cache.set(OVERVIEW_CACHE_KEY, overview, OVERVIEW_CACHE_TIMEOUT)
+    return overview
+
+def invalidate_overview(**kwargs):
+    """Drop the cached overview; usable directly as a signal receiver."""
+    cache.delete(OVERVIEW_CACHE_KEY)
@@ -0,0 +1,25 @@
+from rest_framework import serializers
+from machines.models import MachineHealthScore
+from .models import Notification
+
+class MachineHealthScoreSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='machine.id', read_only=True)
+    machine_id = serializers.CharField(source='machine.machine_id', read_only=True)
+    machine_name = serializers.CharField(source='machine.machine_name', read_only=True)
+    
+    class Meta:
+        model = MachineHealthScore
+        fields = ['id', 'machine_id', 'machine_name', 'health_score', 'status', 'trend',
+                  'readings_analyzed', 'anomalies_detected', 'model_version', 'scored_at']
+
+class NotificationSerializer(serializers.ModelSerializer):
+    machine_id = serializers.CharField(source='machine.machine_id', read_only=True, default=None)
+    part_id = serializers.CharField(source='spare_part.part_id', read_only=True, default=None)
+    work_order_id = serializers.CharField(source='work_order.work_order_id', read_only=True, default=None)
+    # Not annotated on notifications pushed to the live stream, which are new.
+    is_read = serializers.BooleanField(read_only=True, default=False)
+    
+    class Meta:
+        model = Notification
+        fields = ['id', 'type', 'severity', 'title', 'message', 'machine_id', 'part_id', 'work_order_id',
+                  'timestamp', 'created_at', 'is_read']
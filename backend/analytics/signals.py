@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.utils import timezone
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from machines.models import Machine, MachineReading, MachineReadingStats
+from machines.signals import anomalies_flagged, health_changed, readings_ingested
+from maintenance.models import SparePart, WorkOrder
+from .events import publish_many
+from .notifications import ANOMALY_MAX_AGE, notify_anomalies, notify_low_stock
+from .overview import invalidate_overview
+
+def _invalidate_on_commit(**kwargs):
+    # Invalidating before commit would let a concurrent request cache the
+    # old counts again.
+    transaction.on_commit(invalidate_overview)
+
+for model in (Machine, WorkOrder, SparePart):
+    post_save.connect(_invalidate_on_commit, sender=model, dispatch_uid=f'overview_{model.__name__}_save')
+    post_delete.connect(_invalidate_on_commit, sender=model, dispatch_uid=f'overview_{model.__name__}_delete')
+
+health_changed.connect(_invalidate_on_commit, dispatch_uid='overview_health_changed')
+
+@receiver(post_save, sender=MachineReading, dispatch_uid='overview_anomalous_reading')
+def invalidate_on_anomaly(sender, instance, **kwargs):
+    if instance.is_anomaly:
+        _invalidate_on_commit()
+
+@receiver(anomalies_flagged, dispatch_uid='notify_anomalies')
+def create_anomaly_notifications(sender, anomalies, **kwargs):
+    notify_anomalies(anomalies)
+
+def _publish_on_commit(event_type, events):
+    """Publish ``(data, machine_pk)`` events to the live stream, together, once the transaction commits."""
+    if events:
+        transaction.on_commit(lambda: publish_many(event_type, events))
+
+@receiver(readings_ingested, dispatch_uid='stream_readings')
+def stream_readings(sender, readings, **kwargs):
+    _publish_on_commit('reading', [
+        ({'id': reading.pk, 'machine': reading.machine_id, 'timestamp': reading.timestamp,
+          **{metric: getattr(reading, metric) for metric in MachineReadingStats.METRICS}}, reading.machine_id)
+        for reading in readings
+    ])
+
+@receiver(anomalies_flagged, dispatch_uid='stream_anomalies')
+def stream_anomalies(sender, anomalies, **kwargs):
+    # Like notifications, anomalies found in imported history are not news.
+    cutoff = timezone.now() - ANOMALY_MAX_AGE
+    _publish_on_commit('anomaly', [
+        ({'id': reading_pk, 'machine': machine_pk, 'timestamp': timestamp, 'reason': reason}, machine_pk)
+        for machine_pk, reading_pk, timestamp, reason in anomalies
+        if timestamp >= cutoff
+    ])
+
+@receiver(pre_save, sender=WorkOrder, dispatch_uid='work_order_previous_status')
+def remember_work_order_status(sender, instance, update_fields=None, **kwargs):
+    instance._previous_status = instance.status
+    if instance.pk and (update_fields is None or 'status' in update_fields):
+        instance._previous_status = WorkOrder.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+@receiver(post_save, sender=WorkOrder, dispatch_uid='stream_work_order_status')
+def stream_work_order_status(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_previous_status', instance.status)
+    if previous == instance.status:
+        return
+    _publish_on_commit('work_order', [(
+        {'id': instance.pk, 'work_order_id': instance.work_order_id, 'machine': instance.machine_id,
+         'status': instance.status, 'previous_status': previous},
+        instance.machine_id,
+    )])
+
+@receiver(pre_save, sender=SparePart, dispatch_uid='low_stock_previous_level')
+def remember_stock_level(sender, instance, **kwargs):
+    previous = SparePart.objects.filter(pk=instance.pk).values_list(
+        'quantity_in_stock', 'minimum_stock_level'
+    ).first() if instance.pk else None
+    instance._was_low_stock = previous is not None and previous[0] <= previous[1]
+
+@receiver(post_save, sender=SparePart, dispatch_uid='notify_low_stock')
+def create_low_stock_notification(sender, instance, **kwargs):
+    if instance.is_low_stock and not getattr(instance, '_was_low_stock', False):
+        notify_low_stock(instance)
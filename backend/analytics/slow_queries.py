@@ -0,0 +1,184 @@
+"""Slow-query sampling.
+
+``SlowQueryMiddleware`` runs each request's queries, and a Celery signal
+each task's, through an execute wrapper that times them. Queries slower
+than ``SLOW_QUERY_MS`` are logged and stored as ``SlowQuery`` rows
+with the view that ran them and a fingerprint of their SQL: literals and
+parameters replaced by ``?`` and value lists collapsed, so one ORM query
+groups together whatever its arguments. A ``SLOW_QUERY_EXPLAIN_RATE``
+fraction of the slow SELECTs is run again under ``EXPLAIN (ANALYZE,
+BUFFERS)`` and the plan stored with it. Writes are never explained, since
+ANALYZE executes the statement; that includes a ``WITH`` or ``SELECT``
+mentioning INSERT, UPDATE, DELETE or MERGE anywhere. ``manage.py
+slow_queries`` ranks the fingerprints by total time.
+
+The rows are written on a connection of their own in autocommit mode, so
+the queries of a request that fails and rolls back are kept too; those are
+often the ones worth looking at. It is opened on the first slow query of a
+request or task and closed when that ends.
+"""
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery.signals import task_postrun, task_prerun
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+from factory_maintenance.profiling import current_view, entered_in_view_thread, wrapping_queries
+from .models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+NORMALIZE = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%s|\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+READ = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+# Also catches data-modifying CTEs such as partitions.create_partition's
+# ``WITH moved AS (DELETE ... RETURNING *) INSERT ...``, and SELECT ... FOR UPDATE.
+WRITE = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE)\b', re.IGNORECASE)
+INSERT_SLOW_QUERY = f'''
+    INSERT INTO {SlowQuery._meta.db_table} (fingerprint, statement, duration_ms, view, plan, captured_at)
+    VALUES (%s, %s, %s, %s, %s, %s)
+'''
+
+# Set while a slow query is being recorded, so its own queries are not sampled.
+_recording = ContextVar('recording_slow_query', default=False)
+# Holds ``recorders``, the {alias: connection} of this thread used only to store slow queries.
+_local = threading.local()
+
+def normalize_sql(sql):
+    """``sql`` with literals and parameters replaced by ``?`` and value lists collapsed to ``(...)``."""
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+def fingerprint(statement):
+    return hashlib.md5(statement.encode(), usedforsecurity=False).hexdigest()
+
+def explainable(sql):
+    """Whether running ``sql`` under EXPLAIN ANALYZE only reads."""
+    return READ.match(sql) is not None and WRITE.search(sql) is None
+
+def recorder_connection(alias):
+    """This thread's connection for storing slow queries found on ``alias``, outside their transactions.
+    
+    It is closed by ``close_recorders()`` when the sampled request or task ends.
+    """
+    recorders = getattr(_local, 'recorders', None)
+    if recorders is None:
+        recorders = _local.recorders = {}
+    if alias not in recorders:
+        recorders[alias] = connections.create_connection(alias)
+    return recorders[alias]
+
+def store_slow_query(alias, statement, duration_ms, view, plan):
+    recorder = recorder_connection(alias)
+    try:
+        with recorder.cursor() as cursor:
+            cursor.execute(INSERT_SLOW_QUERY, [fingerprint(statement), statement, duration_ms, view, plan,
+                                               timezone.now()])
+    except DatabaseError:
+        # Reconnect next time rather than reuse a connection that may be broken.
+        recorder.close()
+        del _local.recorders[alias]
+        raise
+
+def sample_slow_query(execute, sql, params, many, context):
+    """Database execute wrapper recording queries slower than ``SLOW_QUERY_MS``."""
+    threshold = settings.SLOW_QUERY_MS
+    if not threshold or _recording.get():
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - started) * 1000
+    if duration_ms >= threshold:
+        record_slow_query(context['connection'], sql, params, many, duration_ms)
+    return result
+
+def record_slow_query(connection, sql, params, many, duration_ms):
+    statement = normalize_sql(sql)
+    view = current_view()
+    logger.warning('Slow query (%.0f ms) in %s: %s', duration_ms, view or 'no view', statement)
+    explain = not many and explainable(sql) and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE
+    token = _recording.set(True)
+    try:
+        plan = ''
+        if explain:
+            # The plan needs the caller's connection, which sees its uncommitted rows; a
+            # savepoint, so a failed EXPLAIN cannot break the caller's transaction.
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}', params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+        store_slow_query(connection.alias, statement, duration_ms, view, plan)
+    except DatabaseError:
+        logger.exception('Could not record slow query')
+    finally:
+        _recording.reset(token)
+
+def close_recorders():
+    """Close the connections this thread opened to store slow queries."""
+    for recorder in getattr(_local, 'recorders', {}).values():
+        recorder.close()
+    _local.recorders = {}
+
+@contextmanager
+def sampling_slow_queries():
+    """Record this thread's slow queries for the duration of the block."""
+    try:
+        with wrapping_queries(sample_slow_query):
+            yield
+    finally:
+        close_recorders()
+
+class SlowQueryMiddleware:
+    """Samples the slow queries of each request; see the module docstring."""
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with sampling_slow_queries():
+            return self.get_response(request)
+    
+    async def __acall__(self, request):
+        async with entered_in_view_thread(sampling_slow_queries()):
+            return await self.get_response(request)
+
+# {task id: ExitStack} of the tasks running in this process.
+_task_scopes = {}
+
+@task_prerun.connect
+def sample_task_queries(task_id, **kwargs):
+    _task_scopes[task_id] = stack = ExitStack()
+    stack.enter_context(sampling_slow_queries())
+
+@task_postrun.connect
+def stop_sampling_task_queries(task_id, **kwargs):
+    stack = _task_scopes.pop(task_id, None)
+    if stack is not None:
+        stack.close()
+
+def purge_slow_queries(now=None):
+    """Delete slow queries captured more than ``SLOW_QUERY_RETENTION_DAYS`` ago."""
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=settings.SLOW_QUERY_RETENTION_DAYS)
+    return SlowQuery.objects.filter(captured_at__lt=cutoff).delete()[0]
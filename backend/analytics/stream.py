@@ -0,0 +1,82 @@
+"""Server-Sent Events endpoint pushing live readings, anomalies, work-order changes and notifications.
+
+Must be served by an ASGI server: each connection is a coroutine waiting on
+its subscription, so one worker holds thousands of them. Browsers'
+``EventSource`` cannot send headers, so the JWT access token may be passed as
+``?token=``.
+"""
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from machines.models import Machine
+from .events import EVENT_TYPES, OVERFLOW, get_broker
+
+def _authenticate(request):
+    authentication = JWTAuthentication()
+    raw_token = request.GET.get('token')
+    try:
+        if raw_token is None:
+            result = authentication.authenticate(request)
+            return result[0] if result else None
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (AuthenticationFailed, InvalidToken):
+        return None
+
+def _machine_pks(codes):
+    machines = dict(Machine.objects.filter(machine_id__in=codes).values_list('machine_id', 'pk'))
+    unknown = sorted(set(codes) - machines.keys())
+    return list(machines.values()), unknown
+
+async def _events(broker, machine_pks, event_types):
+    subscription = broker.subscribe(machine_pks, event_types)
+    try:
+        yield f'retry: {settings.STREAM_RETRY_MS}\n\n'
+        while True:
+            try:
+                # Cheaper than wait_for(), which wraps every get() in a task.
+                async with asyncio.timeout(settings.STREAM_HEARTBEAT_SECONDS):
+                    event = await subscription.get()
+            except TimeoutError:
+                # Keeps proxies from closing an idle connection and lets the
+                # server notice clients that went away.
+                yield ': heartbeat\n\n'
+                continue
+            if event is OVERFLOW:
+                yield 'event: overflow\ndata: {}\n\n'
+                return
+            event_type, _, payload = event
+            yield f'event: {event_type}\ndata: {payload}\n\n'
+    finally:
+        subscription.close()
+
+async def event_stream(request):
+    """``GET /api/stream/?machines=CNC-001,CNC-002&events=reading,anomaly``"""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'The event stream requires an ASGI server'}, status=501)
+    
+    user = await sync_to_async(_authenticate)(request)
+    if user is None or not user.is_active:
+        return JsonResponse({'error': 'Authentication credentials were not provided or are invalid'}, status=401)
+    
+    event_types = EVENT_TYPES
+    if request.GET.get('events'):
+        event_types = request.GET['events'].split(',')
+        unknown = sorted(set(event_types) - set(EVENT_TYPES))
+        if unknown:
+            return JsonResponse({'error': f"Unknown events: {', '.join(unknown)}"}, status=400)
+    
+    machine_pks = None
+    if request.GET.get('machines'):
+        machine_pks, unknown = await sync_to_async(_machine_pks)(request.GET['machines'].split(','))
+        if unknown:
+            return JsonResponse({'error': f"Unknown machines: {', '.join(unknown)}"}, status=400)
+    
+    response = StreamingHttpResponse(_events(get_broker(), machine_pks, event_types), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,14 @@
+from celery import shared_task
+from .notifications import evaluate_maintenance, purge_notifications
+from .slow_queries import purge_slow_queries
+
+@shared_task
+def evaluate_notifications():
+    """Daily: notify due and overdue maintenance and expire old notifications."""
+    purge_notifications()
+    return len(evaluate_maintenance())
+
+@shared_task
+def expire_slow_queries():
+    """Daily: delete slow queries older than ``SLOW_QUERY_RETENTION_DAYS``."""
+    return purge_slow_queries()
@@ -1,3 +1,346 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from celery import shared_task
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from authentication.models import CustomUser
+from factory_maintenance.testing import create_machine
+from machines.models import MachineReading
+from machines.signals import anomalies_flagged, readings_ingested
+from machines.tasks import score_readings
+from maintenance.models import SparePart, SparePartUsage, WorkOrder
+from .events import publish
+from .models import Notification, NotificationRead, SlowQuery
+from .notifications import purge_notifications, unread_counts
+from .slow_queries import (explainable, normalize_sql, purge_slow_queries, recorder_connection,
+                           sampling_slow_queries)
+from .tasks import evaluate_notifications
 
-# Create your tests here.
+
+class DashboardOverviewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+        self.machine = create_machine(next_maintenance_date=timezone.localdate() + timedelta(days=20))
+        create_machine('CNC-002', machine_name='CNC Mill', status='DOWN',
+                       next_maintenance_date=timezone.localdate() - timedelta(days=1))
+        SparePart.objects.create(part_id='P-1', part_name='Belt', quantity_in_stock=1, unit_cost=10)
+
+    def overview(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get('/api/analytics/dashboard/').json()
+
+    def counted_queries(self):
+        """``(table queries, cache queries)`` run by ``overview()``, and its result."""
+        with CaptureQueriesContext(connection) as captured:
+            overview = self.overview()
+        cached = [query for query in captured if 'django_cache' in query['sql'] or 'SAVEPOINT' in query['sql']]
+        return len(captured) - len(cached), len(cached), overview
+
+    def test_counts_use_one_query_per_table_and_are_cached(self):
+        tables, _, overview = self.counted_queries()
+        self.assertEqual(tables, 3)
+        self.assertEqual((overview['total_machines'], overview['operational'], overview['down']), (2, 1, 1))
+        self.assertEqual(overview['health_status'], {'green': 1, 'yellow': 0, 'red': 1, 'critical': 0})
+        self.assertEqual(overview['low_stock_parts'], 1)
+
+        # The default cache is a database table here: a hit is one lookup.
+        self.assertEqual(self.counted_queries(), (0, 1, overview))
+
+    def test_writes_invalidate_the_cache(self):
+        self.overview()
+        with self.captureOnCommitCallbacks(execute=True):
+            WorkOrder.objects.create(work_order_id='WO-1', machine=self.machine, title='Belt', description='',
+                                     scheduled_date=timezone.localdate())
+        self.assertEqual(self.overview()['pending_work_orders'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for value in [70, 71, 70, 71, 70, 150]:
+                score_readings([MachineReading.objects.create(machine=self.machine, temperature=value).pk])
+        self.assertEqual(self.overview()['health_status']['critical'], 1)
+
+
+class NotificationFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(username='tech', password='pass')
+        self.client.force_authenticate(self.user)
+        self.machine = create_machine(next_maintenance_date=timezone.localdate() - timedelta(days=2))
+
+    def test_events_create_notifications_once(self):
+        for value in [70, 71, 70, 71, 70, 150]:
+            score_readings([MachineReading.objects.create(machine=self.machine, temperature=value).pk])
+        part = SparePart.objects.create(part_id='P-1', part_name='Belt', quantity_in_stock=8,
+                                        minimum_stock_level=5, unit_cost=10)
+        work_order = WorkOrder.objects.create(work_order_id='WO-1', machine=self.machine, title='Belt',
+                                              description='', scheduled_date=timezone.localdate())
+        for _ in range(3):
+            SparePartUsage.objects.create(work_order=work_order, spare_part=part, quantity_used=2)
+
+        self.assertEqual(evaluate_notifications(), 2)
+        self.assertEqual(evaluate_notifications(), 0)
+        self.assertEqual(
+            sorted(Notification.objects.values_list('type', flat=True)),
+            ['ANOMALY_DETECTED', 'LOW_STOCK', 'OVERDUE_MAINTENANCE', 'PENDING_WORK_ORDER'],
+        )
+
+    def test_feed_pages_by_cursor_and_tracks_read_state(self):
+        Notification.objects.bulk_create([
+            Notification(type='LOW_STOCK', severity='CRITICAL' if i % 5 == 0 else 'MEDIUM', title=f'N{i}',
+                         message='', event_key=f'test:{i}', timestamp=timezone.now())
+            for i in range(25)
+        ])
+
+        with self.assertNumQueries(1):
+            page = self.client.get('/api/analytics/notifications/').json()
+        self.assertEqual([n['title'] for n in page['results'][:2]], ['N24', 'N23'])
+        self.assertEqual(len(page['results']), 20)
+        rest = self.client.get(page['next']).json()
+        self.assertEqual([n['title'] for n in rest['results']], [f'N{i}' for i in range(4, -1, -1)])
+        self.assertIsNone(rest['next'])
+
+        newest = page['results'][0]['id']
+        self.client.post(f'/api/analytics/notifications/{newest}/read/')
+        with self.assertNumQueries(1):
+            counts = self.client.get('/api/analytics/notifications/unread-count/').json()
+        self.assertEqual((counts['unread'], counts['critical'], counts['medium']), (24, 5, 19))
+        self.assertTrue(self.client.get('/api/analytics/notifications/').json()['results'][0]['is_read'])
+
+        self.client.post('/api/analytics/notifications/read-all/?severity=CRITICAL')
+        unread = self.client.get('/api/analytics/notifications/?unread=true').json()['results']
+        self.assertEqual({n['severity'] for n in unread}, {'MEDIUM'})
+        self.assertEqual(self.client.get('/api/analytics/notifications/unread-count/').json()['unread'], 19)
+
+        other = APIClient()
+        other.force_authenticate(CustomUser.objects.create_user(username='other', password='pass'))
+        self.assertEqual(other.get('/api/analytics/notifications/unread-count/').json()['unread'], 25)
+
+    def test_unread_counters_follow_reads_edits_and_purges(self):
+        notifications = Notification.objects.bulk_create([
+            Notification(type='LOW_STOCK', severity=severity, title=f'N{i}', message='', event_key=f'test:{i}',
+                         timestamp=timezone.now())
+            for i, severity in enumerate(['HIGH', 'HIGH', 'HIGH', 'LOW', 'LOW'])
+        ])
+        NotificationRead.objects.create(user=self.user, notification=notifications[0])
+        NotificationRead.objects.create(user=self.user, notification=notifications[3])
+        notifications[1].severity = 'LOW'
+        notifications[1].save(update_fields=['severity'])
+        notifications[3].delete()
+
+        with CaptureQueriesContext(connection) as captured:
+            counts = unread_counts(self.user)
+        self.assertEqual(counts, {'unread': 3, 'critical': 0, 'high': 1, 'medium': 0, 'low': 2})
+        self.assertNotIn('FROM notifications', captured[0]['sql'])
+        other = CustomUser.objects.create_user(username='other', password='pass')
+        self.assertEqual(unread_counts(other)['unread'], 4)
+
+        # Foreign keys are deferred, so raw SQL may delete a read notification before its reads.
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM notifications WHERE id = %s', [notifications[0].pk])
+            cursor.execute('DELETE FROM notification_reads WHERE notification_id = %s', [notifications[0].pk])
+        self.assertEqual(unread_counts(self.user), {'unread': 3, 'critical': 0, 'high': 1, 'medium': 0, 'low': 2})
+        self.assertEqual(unread_counts(other)['unread'], 3)
+
+        purge_notifications(timezone.now() + timedelta(days=31))
+        self.assertEqual(unread_counts(self.user)['unread'], 0)
+        self.assertEqual(unread_counts(other)['unread'], 0)
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.token = str(AccessToken.for_user(CustomUser.objects.create_user(username='tech', password='pass')))
+        self.machines = [create_machine(f'CNC-00{index}') for index in (1, 2)]
+
+    async def open_stream(self, query=''):
+        response = await self.async_client.get(f'/api/stream/?token={self.token}{query}')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        self.assertTrue((await anext(events)).startswith(b'retry:'))
+        return events
+
+    async def test_pushes_events_of_the_requested_machines(self):
+        events = await self.open_stream('&machines=CNC-001&events=reading,work_order')
+        publish('reading', {'value': 1}, self.machines[1].pk)
+        publish('anomaly', {'value': 2}, self.machines[0].pk)
+        publish('reading', {'value': 3}, self.machines[0].pk)
+        chunk = await asyncio.wait_for(anext(events), 1)
+        self.assertEqual(chunk, b'event: reading\ndata: {"value": 3}\n\n')
+
+    @override_settings(STREAM_HEARTBEAT_SECONDS=0.01)
+    async def test_idle_streams_send_heartbeats(self):
+        events = await self.open_stream()
+        self.assertEqual(await asyncio.wait_for(anext(events), 1), b': heartbeat\n\n')
+
+    @override_settings(STREAM_QUEUE_SIZE=2)
+    async def test_slow_consumers_are_dropped(self):
+        events = await self.open_stream()
+        for value in range(3):
+            publish('reading', {'value': value}, self.machines[0].pk)
+        self.assertEqual(await asyncio.wait_for(anext(events), 1), b'event: overflow\ndata: {}\n\n')
+        with self.assertRaises(StopAsyncIteration):
+            await anext(events)
+
+    async def test_rejects_bad_requests(self):
+        response = await self.async_client.get('/api/stream/?token=invalid')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(f'/api/stream/?token={self.token}&machines=NOPE')
+        self.assertEqual(response.status_code, 400)
+
+    def test_changes_are_published_after_commit(self):
+        with mock.patch('analytics.signals.publish_many') as publish_event:
+            with self.captureOnCommitCallbacks(execute=True):
+                work_order = WorkOrder.objects.create(work_order_id='WO-1', machine=self.machines[0], title='Belt',
+                                                      description='', scheduled_date=timezone.localdate())
+            with self.captureOnCommitCallbacks(execute=True):
+                work_order.status = 'IN_PROGRESS'
+                work_order.save(update_fields=['status'])
+                work_order.save(update_fields=['title'])
+        statuses = [data['status'] for call in publish_event.call_args_list if call.args[0] == 'work_order'
+                    for data, _ in call.args[1]]
+        self.assertEqual(statuses, ['PENDING', 'IN_PROGRESS'])
+
+    def test_a_batch_is_published_at_once_and_old_anomalies_are_not(self):
+        machine = self.machines[0]
+        readings = MachineReading.objects.bulk_create([MachineReading(machine=machine, temperature=70)
+                                                       for _ in range(3)])
+        now = timezone.now()
+        anomalies = [(machine.pk, readings[0].pk, now, 'recent'), (machine.pk, readings[1].pk, now - timedelta(days=400), 'imported')]
+        with mock.patch('analytics.signals.publish_many') as publish_event:
+            with self.captureOnCommitCallbacks(execute=True):
+                readings_ingested.send(sender=MachineReading, readings=readings)
+                anomalies_flagged.send(sender=MachineReading, anomalies=anomalies)
+
+        published = {call.args[0]: call.args[1] for call in publish_event.call_args_list}
+        self.assertEqual(publish_event.call_count, 2)
+        self.assertEqual(len(published['reading']), 3)
+        self.assertEqual([data['reason'] for data, _ in published['anomaly']], ['recent'])
+
+    def test_redis_broker_pipelines_a_batch(self):
+        from .events import RedisBroker
+        broker = RedisBroker('redis://localhost:6379/15')
+        with mock.patch.object(broker, '_client') as client:
+            broker.publish_many([('reading', self.machines[0].pk, '{}')] * 5)
+        client.pipeline.assert_called_once_with(transaction=False)
+        self.assertEqual(client.pipeline.return_value.publish.call_count, 5)
+        client.pipeline.return_value.execute.assert_called_once_with()
+        client.publish.assert_not_called()
+
+
+class SlowQueryTests(TestCase):
+    def setUp(self):
+        self.addCleanup(self.delete_recorded_queries)
+
+    def delete_recorded_queries(self):
+        # They are committed on a connection of their own, outside the test's transaction.
+        recorder = recorder_connection(connection.alias)
+        with recorder.cursor() as cursor:
+            cursor.execute('DELETE FROM slow_queries')
+        recorder.close()
+
+    def test_fingerprints_ignore_literals_and_list_lengths(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM machines WHERE machine_id = 'CNC-001' AND id IN (1, 2, 3) LIMIT 21"),
+            normalize_sql("SELECT *\n  FROM machines WHERE machine_id = 'it''s' AND id IN (4) LIMIT 5"),
+        )
+        self.assertEqual(normalize_sql('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'),
+                         'INSERT INTO t (a, b) VALUES (...)')
+        self.assertEqual(normalize_sql('SELECT "T3"."id" FROM "machine_readings_2025_01" "T3"'),
+                         'SELECT "T3"."id" FROM "machine_readings_2025_01" "T3"')
+
+    @override_settings(SLOW_QUERY_MS=20, SLOW_QUERY_EXPLAIN_RATE=1)
+    def test_slow_selects_are_stored_with_their_plan(self):
+        with self.assertLogs('analytics.slow_queries', 'WARNING') as logs, sampling_slow_queries():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.execute('SELECT pg_sleep(%s)', [0.03])
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(connection.execute_wrappers, [])
+        slow = SlowQuery.objects.get()
+        self.assertEqual(slow.statement, 'SELECT pg_sleep(...)')
+        self.assertGreaterEqual(slow.duration_ms, 20)
+        self.assertEqual(slow.view, '')
+        self.assertIn('actual time=', slow.plan)
+
+    @override_settings(SLOW_QUERY_MS=20, SLOW_QUERY_EXPLAIN_RATE=1)
+    def test_queries_of_rolled_back_transactions_are_kept(self):
+        with self.assertLogs('analytics.slow_queries', 'WARNING'), self.assertRaises(ZeroDivisionError):
+            with sampling_slow_queries(), transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute('SELECT pg_sleep(%s)', [0.03])
+                1 / 0
+        self.assertEqual(SlowQuery.objects.get().statement, 'SELECT pg_sleep(...)')
+
+    def test_only_plain_reads_are_explained(self):
+        self.assertTrue(explainable('SELECT "machines"."id" FROM "machines"'))
+        self.assertTrue(explainable(' WITH recent AS (SELECT 1) SELECT * FROM recent'))
+        self.assertFalse(explainable(
+            'WITH moved AS (DELETE FROM machine_readings_default WHERE timestamp >= %s RETURNING *) '
+            'INSERT INTO machine_readings_2025_01 SELECT * FROM moved'
+        ))
+        self.assertFalse(explainable('SELECT "machines"."id" FROM "machines" FOR UPDATE'))
+        self.assertFalse(explainable('UPDATE "machines" SET "status" = %s'))
+
+    def test_records_the_view_and_never_explains_writes(self):
+        user = CustomUser.objects.create_user(username='tech', password='pass')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        with override_settings(SLOW_QUERY_MS=0.001, SLOW_QUERY_EXPLAIN_RATE=1):
+            with self.assertLogs('analytics.slow_queries', 'WARNING'):
+                client.post('/api/parts/', {'part_id': 'P-1', 'part_name': 'Belt', 'unit_cost': '10.00'})
+        recorded = SlowQuery.objects.filter(view='sparepart-list')
+        inserts = recorded.filter(statement__startswith='INSERT INTO "spare_parts"')
+        self.assertTrue(inserts.exists())
+        self.assertFalse(inserts.exclude(plan='').exists())
+        self.assertTrue(recorded.filter(statement__startswith='SELECT').exclude(plan='').exists())
+
+    @override_settings(SLOW_QUERY_MS=20)
+    def test_queries_outside_requests_and_tasks_are_not_sampled(self):
+        with self.assertNoLogs('analytics.slow_queries', 'WARNING'), connection.cursor() as cursor:
+            cursor.execute('SELECT pg_sleep(%s)', [0.03])
+
+    @override_settings(SLOW_QUERY_MS=20, SLOW_QUERY_EXPLAIN_RATE=0)
+    def test_tasks_are_sampled_and_close_their_recorder(self):
+        recorders = []
+
+        @shared_task
+        def sleep():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_sleep(%s)', [0.03])
+            recorders.append(recorder_connection(connection.alias))
+
+        with self.assertLogs('analytics.slow_queries', 'WARNING'):
+            sleep.delay()
+        self.assertEqual(SlowQuery.objects.get().statement, 'SELECT pg_sleep(...)')
+        self.assertIsNone(recorders[0].connection)
+        self.assertEqual(connection.execute_wrappers, [])
+
+    def test_summary_ranks_fingerprints_by_total_time(self):
+        SlowQuery.objects.bulk_create([
+            SlowQuery(fingerprint='a' * 32, statement='SELECT * FROM machines', duration_ms=300, view='machine-list'),
+            SlowQuery(fingerprint='b' * 32, statement='SELECT * FROM work_orders', duration_ms=400, view=''),
+            SlowQuery(fingerprint='a' * 32, statement='SELECT * FROM machines', duration_ms=200,
+                      view='machine-dashboard', plan='Seq Scan on machines'),
+        ])
+        out = StringIO()
+        call_command('slow_queries', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[1].startswith('aaaaaaaaaaaa        500      2     250.0'))
+        self.assertIn('machine-dashboard, machine-list', lines[1])
+        self.assertTrue(lines[3].startswith('bbbbbbbbbbbb        400      1'))
+
+        out = StringIO()
+        call_command('slow_queries', 'aaaa', stdout=out)
+        self.assertIn('Seq Scan on machines', out.getvalue())
+
+    def test_old_slow_queries_are_purged(self):
+        SlowQuery.objects.create(fingerprint='a' * 32, statement='SELECT 1', duration_ms=300)
+        self.assertEqual(purge_slow_queries(timezone.now() + timedelta(days=13)), 0)
+        self.assertEqual(purge_slow_queries(timezone.now() + timedelta(days=15)), 1)
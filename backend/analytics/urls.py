@@ -1,8 +1,12 @@
-from django.urls import path
+from django.urls import include, path
+from rest_framework.routers import SimpleRouter
 from . import views
-from .notifications import get_notifications
+
+router = SimpleRouter()
+router.register(r'notifications', views.NotificationViewSet, basename='notification')
 
 urlpatterns = [
     path('dashboard/', views.dashboard_overview, name='analytics-dashboard'),
-    path('notifications/', get_notifications, name='notifications'),
+    path('health-scores/', views.HealthScoreList.as_view(), name='health-scores'),
+    path('', include(router.urls)),
 ]
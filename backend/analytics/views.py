@@ -1,38 +1,65 @@
-from rest_framework.decorators import api_view, permission_classes
+from django.db.models import Exists, OuterRef
+from rest_framework import filters, generics, viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.db.models import Count, Sum, F
-from django.utils import timezone
-from machines.models import Machine
-from maintenance.models import WorkOrder, SparePart
+from django_filters.rest_framework import DjangoFilterBackend
+from machines.models import MachineHealthScore
+from .models import Notification, NotificationRead
+from .notifications import unread_counts
+from .overview import get_overview
+from .serializers import MachineHealthScoreSerializer, NotificationSerializer
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_overview(request):
-    machines = Machine.objects.all()
-    work_orders = WorkOrder.objects.all()
+    return Response(get_overview())
+
+class HealthScoreList(generics.ListAPIView):
+    """Latest fleet health scores, worst first; refreshed by ``manage.py score_fleet``."""
+    queryset = MachineHealthScore.objects.select_related('machine')
+    serializer_class = MachineHealthScoreSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['status', 'trend']
+    ordering_fields = ['health_score', 'scored_at', 'anomalies_detected']
+
+class NotificationPagination(CursorPagination):
+    ordering = '-id'
+
+class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
+    """The notification feed, newest first, with the caller's read state."""
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = NotificationPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['type', 'severity']
+    
+    def get_queryset(self):
+        queryset = Notification.objects.select_related('machine', 'spare_part', 'work_order').annotate(
+            is_read=Exists(NotificationRead.objects.filter(user=self.request.user, notification=OuterRef('pk')))
+        )
+        unread = self.request.query_params.get('unread')
+        if unread in ('true', '1'):
+            queryset = queryset.filter(is_read=False)
+        return queryset
     
-    health_counts = {'green': 0, 'yellow': 0, 'red': 0, 'critical': 0}
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        return Response(unread_counts(request.user))
     
-    for machine in machines:
-        status = machine.get_health_status()
-        if status == 'GREEN':
-            health_counts['green'] += 1
-        elif status == 'YELLOW':
-            health_counts['yellow'] += 1
-        elif status == 'RED':
-            health_counts['red'] += 1
-        elif status == 'CRITICAL':
-            health_counts['critical'] += 1
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        notification = self.get_object()
+        NotificationRead.objects.get_or_create(user=request.user, notification=notification)
+        return Response({'id': notification.pk, 'is_read': True})
     
-    return Response({
-        'total_machines': machines.count(),
-        'operational': machines.filter(status='OPERATIONAL').count(),
-        'under_maintenance': machines.filter(status='UNDER_MAINTENANCE').count(),
-        'down': machines.filter(status='DOWN').count(),
-        'health_status': health_counts,
-        'pending_work_orders': work_orders.filter(status='PENDING').count(),
-        'in_progress_work_orders': work_orders.filter(status='IN_PROGRESS').count(),
-        'completed_work_orders': work_orders.filter(status='COMPLETED').count(),
-        'low_stock_parts': SparePart.objects.filter(quantity_in_stock__lte=F('minimum_stock_level')).count(),
-    })
+    @action(detail=False, methods=['post'], url_path='read-all')
+    def read_all(self, request):
+        unread = self.filter_queryset(self.get_queryset()).filter(is_read=False).values_list('pk', flat=True)
+        reads = NotificationRead.objects.bulk_create(
+            [NotificationRead(user=request.user, notification_id=pk) for pk in unread],
+            ignore_conflicts=True,
+        )
+        return Response({'marked_read': len(reads)})
@@ -0,0 +1,65 @@
+"""Benchmark the fleet anomaly sweep (manage.py sweep_anomalies).
+
+Seeds readings spread over the sweep window with generate_series and times
+one sweep over all of them.
+
+    python -m benchmarks.anomaly_sweep --machines 500 --readings 2000000
+"""
+import argparse
+
+from benchmarks.common import benchmark_database, count_queries, timer
+
+from datetime import date, timedelta
+from django.db import connection
+from django.utils import timezone
+from machines.models import Machine
+from machines.sweep import sweep_anomalies
+
+
+def seed(machine_count, reading_count, hours):
+    machines = Machine.objects.bulk_create([
+        Machine(
+            machine_id=f'BENCH-{i:04d}',
+            machine_name=f'Bench Machine {i}',
+            machine_type='CNC',
+            location='Bench Floor',
+            installation_date=date(2020, 1, 1),
+            maintenance_frequency_days=30,
+        )
+        for i in range(machine_count)
+    ])
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO machine_readings (machine_id, timestamp, temperature, vibration_level, oil_pressure,
+                                          custom_readings, notes, is_anomaly, anomaly_reason)
+            SELECT m.id, now() - random() * %s * interval '1 hour',
+                   70 + 3 * (random() + random() + random() - 1.5), 2 + random() * 0.4,
+                   CASE WHEN random() < 0.2 THEN NULL ELSE 45 + random() * 4 END,
+                   '{}', '', false, ''
+            FROM generate_series(1, %s) AS g
+            JOIN LATERAL (SELECT id FROM machines ORDER BY id OFFSET g %% %s LIMIT 1) AS m ON true
+        """, [hours, reading_count, machine_count])
+        cursor.execute('ANALYZE machine_readings')
+    return machines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--machines', type=int, default=200)
+    parser.add_argument('--readings', type=int, default=1000000, help='Readings in the sweep window')
+    parser.add_argument('--hours', type=int, default=24, help='Width of the sweep window')
+    args = parser.parse_args()
+
+    with benchmark_database():
+        seed(args.machines, args.readings, args.hours)
+        print(f"Anomaly sweep: {args.readings} readings over {args.machines} machines, last {args.hours}h")
+
+        now = timezone.now()
+        with count_queries() as queries, timer() as elapsed:
+            swept, flagged = sweep_anomalies(now - timedelta(hours=args.hours), now)
+        print(f"  swept {swept} readings in {elapsed['seconds']:.1f}s, {queries['queries']} queries, "
+              f"{swept / elapsed['seconds'] * 60 / 1e6:.2f}M readings/min, {flagged} flagged")
+
+
+if __name__ == '__main__':
+    main()
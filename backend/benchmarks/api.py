@@ -0,0 +1,241 @@
+"""Benchmark latency and throughput of the hot API endpoints.
+
+Generates a fleet with ``manage.py generate_factory`` in a throwaway
+database, then calls each endpoint in-process through the test client with
+JWT authentication, as a real client would. Reports p50/p95/p99 latency,
+throughput and queries per request. ``--json`` writes the results, and
+``--baseline`` compares them with an earlier file. The run exits with
+status 1 when any timed request failed, or when an endpoint's p95 grew by
+more than ``--tolerance`` or it runs more queries than before.
+
+    python -m benchmarks.api --machines 500 --json baseline.json
+    python -m benchmarks.api --machines 500 --baseline baseline.json --json current.json
+"""
+import argparse
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from benchmarks.common import benchmark_database, count_queries, timer
+
+import numpy as np
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from analytics.notifications import evaluate_maintenance
+from authentication.models import CustomUser
+from machines.models import Machine
+
+# The metrics compared against a baseline; latency is in milliseconds.
+PERCENTILES = (50, 95, 99)
+# Run parameters that must match for a comparison to mean anything.
+COMPARABLE = ('machines', 'readings_per_machine', 'seed', 'requests', 'concurrency', 'bulk_size')
+
+
+def endpoints(machines, bulk_size, seed):
+    """``{name: (method, request factory)}``; each factory returns the path and JSON body of the next request."""
+    rng = random.Random(seed)
+    rotation = itertools.cycle(machines)
+
+    def reading(machine):
+        return {
+            'machine_id': machine.machine_id,
+            'temperature': round(rng.gauss(65, 8), 2),
+            'vibration_level': round(rng.gauss(2, 0.4), 3),
+            'oil_pressure': round(rng.gauss(60, 30), 2),
+        }
+
+    return {
+        'machines': ('get', lambda: ('/api/machines/', None)),
+        'machine-dashboard': ('get', lambda: ('/api/machines/dashboard/', None)),
+        'analytics-dashboard': ('get', lambda: ('/api/analytics/dashboard/', None)),
+        'notifications': ('get', lambda: ('/api/analytics/notifications/', None)),
+        'reading-log': ('post', lambda: ('/api/readings/log/', reading(next(rotation)))),
+        'reading-bulk': ('post', lambda: ('/api/readings/bulk/', {
+            'readings': [reading(rng.choice(machines)) for _ in range(bulk_size)]
+        })),
+        'health-score': ('get', lambda: (f'/api/machines/{next(rotation).pk}/health-score/', None)),
+        'report': ('get', lambda: (f'/api/machines/{next(rotation).pk}/report/', None)),
+    }
+
+
+def client_for(token):
+    client = APIClient(SERVER_NAME='localhost')
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return client
+
+
+def call(client, method, path, body):
+    if body is None:
+        return getattr(client, method)(path)
+    return getattr(client, method)(path, body, format='json')
+
+
+def measure(name, method, factory, token, requests, warmup, concurrency):
+    """Time ``requests`` calls spread over ``concurrency`` threads, after ``warmup`` untimed ones."""
+    client = client_for(token)
+    queries = None
+    for _ in range(max(warmup, 1)):
+        with count_queries() as counted:
+            response = call(client, method, *factory())
+        queries = counted['queries']
+    if response.status_code >= 400:
+        raise SystemExit(f'{name}: {method.upper()} returned {response.status_code}')
+
+    # Requests are built up front so the timings only cover the request itself.
+    planned = [factory() for _ in range(requests)]
+
+    def run(batch):
+        thread_client = client_for(token)
+        samples, errors = [], []
+        try:
+            for path, body in batch:
+                started = time.perf_counter()
+                response = call(thread_client, method, path, body)
+                samples.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+        finally:
+            if concurrency > 1:
+                connection.close()
+        return samples, errors
+
+    batches = [planned[index::concurrency] for index in range(concurrency)]
+    with timer() as elapsed:
+        if concurrency == 1:
+            results = [run(planned)]
+        else:
+            with ThreadPoolExecutor(concurrency) as pool:
+                results = list(pool.map(run, batches))
+
+    samples = np.array([sample for thread_samples, _ in results for sample in thread_samples]) * 1000
+    result = {f'p{percentile}_ms': round(float(np.percentile(samples, percentile)), 2) for percentile in PERCENTILES}
+    result.update({
+        'mean_ms': round(float(samples.mean()), 2),
+        'throughput_rps': round(len(samples) / elapsed['seconds'], 1),
+        'queries_per_request': queries,
+        'requests': len(samples),
+        'errors': sum(len(errors) for _, errors in results),
+        'error_statuses': sorted({status for _, errors in results for status in errors}),
+    })
+    return result
+
+
+def compare(results, meta, baseline, tolerance):
+    """Print the change against ``baseline`` per endpoint and return the names of those that regressed."""
+    regressions = []
+    print(f"\n  Compared with baseline from {baseline['meta'].get('created_at', 'unknown')} "
+          f"(tolerance {tolerance:.0%} on p95)")
+    differences = [f"{key} {baseline['meta'].get(key)} -> {value}" for key, value in meta.items()
+                   if key in COMPARABLE and baseline['meta'].get(key) != value]
+    if differences:
+        print(f"  Warning: the runs are not comparable ({', '.join(differences)})")
+    for name, result in results.items():
+        before = baseline['endpoints'].get(name)
+        if before is None:
+            print(f"  {name:20} not in baseline")
+            continue
+        changes = '  '.join(
+            f"p{percentile} {(result[f'p{percentile}_ms'] / before[f'p{percentile}_ms'] - 1):+7.1%}"
+            for percentile in PERCENTILES
+        )
+        slower = result['p95_ms'] > before['p95_ms'] * (1 + tolerance)
+        more_queries = (result['queries_per_request'] or 0) > (before['queries_per_request'] or 0)
+        verdict = ', '.join(reason for reason, failed in [('SLOWER', slower), ('MORE QUERIES', more_queries)]
+                            if failed) or 'ok'
+        print(f"  {name:20} {changes}  queries {before['queries_per_request']} -> "
+              f"{result['queries_per_request']}  {verdict}")
+        if slower or more_queries:
+            regressions.append(name)
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--machines', type=int, default=200)
+    parser.add_argument('--readings-per-machine', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=50, help='Timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per endpoint first')
+    parser.add_argument('--concurrency', type=int, default=1, help='Threads issuing requests')
+    parser.add_argument('--bulk-size', type=int, default=200, help='Readings per /readings/bulk/ request')
+    parser.add_argument('--only', nargs='+', help='Benchmark only these endpoints')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--baseline', help='Compare with results written by an earlier --json run')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 growth over the baseline')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+
+    with benchmark_database():
+        with timer() as elapsed:
+            call_command('generate_factory', '--machines', str(args.machines),
+                         '--readings-per-machine', str(args.readings_per_machine), '--seed', str(args.seed),
+                         '--drop-indexes', stdout=StringIO())
+            evaluate_maintenance()
+        user = CustomUser.objects.create_user(username='bench', password='bench', role='SUPERVISOR')
+        token = str(RefreshToken.for_user(user).access_token)
+        machines = list(Machine.objects.order_by('pk'))
+        print(f"API: {args.machines} machines x {args.readings_per_machine} readings "
+              f"(generated in {elapsed['seconds']:.1f}s), {args.requests} requests per endpoint, "
+              f"concurrency {args.concurrency}")
+
+        results = {}
+        for name, (method, factory) in endpoints(machines, args.bulk_size, args.seed).items():
+            if args.only and name not in args.only:
+                continue
+            result = results[name] = measure(name, method, factory, token, args.requests, args.warmup,
+                                             args.concurrency)
+            print(f"  {name:20} p50 {result['p50_ms']:8.1f}ms  p95 {result['p95_ms']:8.1f}ms  "
+                  f"p99 {result['p99_ms']:8.1f}ms  {result['throughput_rps']:7.1f} req/s  "
+                  f"{result['queries_per_request']} queries  {result['errors']} errors")
+
+    report = {
+        'meta': {
+            'created_at': timezone.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'machines': args.machines,
+            'readings_per_machine': args.readings_per_machine,
+            'seed': args.seed,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'bulk_size': args.bulk_size,
+        },
+        'endpoints': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\n  Wrote {args.json}")
+    # A failed request is usually fast, so errors would pass as a speed-up.
+    failed = [f"{name} ({result['errors']} x {', '.join(map(str, result['error_statuses']))})"
+              for name, result in results.items() if result['errors']]
+    if failed:
+        print(f"\n  Failed requests: {', '.join(failed)}")
+    regressions = compare(results, report['meta'], baseline, args.tolerance) if baseline is not None else []
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark ``POST /api/readings/bulk/``.
+
+Reports queries per batch and readings/sec for gateway-sized batches.
+
+    python -m benchmarks.bulk_ingest --machines 50 --batch-size 2000
+"""
+import argparse
+import random
+
+from benchmarks.common import benchmark_database, count_queries, timer
+
+from datetime import date
+from rest_framework.test import APIClient
+from authentication.models import CustomUser
+from machines.models import Machine, MachineReading
+
+
+def seed(machine_count, history_per_machine):
+    machines = Machine.objects.bulk_create([
+        Machine(
+            machine_id=f'BENCH-{i:04d}',
+            machine_name=f'Bench Machine {i}',
+            machine_type='CNC',
+            location='Bench Floor',
+            installation_date=date(2020, 1, 1),
+            maintenance_frequency_days=30,
+        )
+        for i in range(machine_count)
+    ])
+    rng = random.Random(42)
+    MachineReading.objects.bulk_create([
+        MachineReading(
+            machine=machine,
+            temperature=rng.gauss(70, 2),
+            vibration_level=rng.gauss(2, 0.2),
+            oil_pressure=rng.gauss(45, 1),
+        )
+        for machine in machines
+        for _ in range(history_per_machine)
+    ])
+    return machines
+
+
+def make_batch(machines, size, rng):
+    batch = []
+    for _ in range(size):
+        machine = rng.choice(machines)
+        batch.append({
+            'machine_id': machine.machine_id,
+            'temperature': round(rng.gauss(70, 3), 2),
+            'vibration_level': round(rng.gauss(2, 0.3), 3),
+            'oil_pressure': round(rng.gauss(45, 1.5), 2),
+        })
+    # One bad machine code and one invalid row so error reporting is exercised.
+    batch[0] = {'machine_id': 'UNKNOWN', 'temperature': 70}
+    batch[1] = {'machine_id': machines[0].machine_id, 'temperature': 'hot'}
+    return batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--machines', type=int, default=50)
+    parser.add_argument('--history', type=int, default=60, help='Existing readings per machine')
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--batches', type=int, default=3)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        machines = seed(args.machines, args.history)
+        user = CustomUser.objects.create_user(username='bench', password='bench')
+        client = APIClient()
+        client.force_authenticate(user)
+        rng = random.Random(7)
+
+        print(f"Bulk ingest: {args.batches} batches x {args.batch_size} readings "
+              f"over {args.machines} machines")
+        for n in range(args.batches):
+            batch = make_batch(machines, args.batch_size, rng)
+            with count_queries() as queries, timer() as elapsed:
+                response = client.post('/api/readings/bulk/', {'readings': batch}, format='json')
+            body = response.json()
+            print(f"  batch {n + 1}: status={response.status_code} created={body['created']} "
+                  f"failed={body['failed']} queries={queries['queries']} "
+                  f"time={elapsed['seconds']:.2f}s "
+                  f"rate={args.batch_size / elapsed['seconds']:.0f} readings/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'factory_maintenance.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def benchmark_database():
+    """Run the benchmark against a throwaway copy of the schema.
+
+    Uses the same machinery as ``manage.py test`` so benchmarks never touch
+    the development database.
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+@contextmanager
+def count_queries():
+    """Count every query issued on the default connection.
+
+    ``CaptureQueriesContext`` caps its log at 9000 entries, which the
+    unoptimised endpoints overflow, so count through an execute wrapper.
+    """
+    result = {'queries': 0}
+
+    def wrapper(execute, sql, params, many, context):
+        result['queries'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield result
+
+
+@contextmanager
+def timer():
+    result = {}
+    start = time.perf_counter()
+    yield result
+    result['seconds'] = time.perf_counter() - start
@@ -0,0 +1,62 @@
+"""Benchmark live-stream fan-out (analytics/events.py) with many open connections.
+
+Opens ``--connections`` stream generators in one event loop, as one ASGI
+worker would, publishes events from another thread and reports how long it
+takes until every connection has yielded them.
+
+    python -m benchmarks.event_stream --connections 5000 --events 100
+"""
+import argparse
+import asyncio
+import threading
+
+from benchmarks.common import timer
+
+from analytics.events import LocalBroker, publish
+from analytics.stream import _events
+import analytics.events
+
+
+async def run(connections, events, machines):
+    broker = analytics.events._broker = LocalBroker()
+    streams = [_events(broker, [index % machines], ('reading',)) for index in range(connections)]
+    for stream in streams:
+        await anext(stream)
+
+    async def consume(stream, expected):
+        for _ in range(expected):
+            await anext(stream)
+
+    per_connection = events // machines
+    consumers = [asyncio.ensure_future(consume(stream, per_connection)) for stream in streams]
+    await asyncio.sleep(0)
+
+    def produce():
+        for index in range(per_connection * machines):
+            publish('reading', {'machine': index % machines, 'temperature': 70.0}, index % machines)
+
+    with timer() as elapsed:
+        thread = threading.Thread(target=produce)
+        thread.start()
+        await asyncio.gather(*consumers)
+        thread.join()
+    delivered = connections * per_connection
+    print(f"  {delivered} deliveries in {elapsed['seconds']:.2f}s "
+          f"({delivered / elapsed['seconds']:,.0f} events/s, {elapsed['seconds'] / per_connection * 1000:.1f}ms per event)")
+    for stream in streams:
+        await stream.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--events', type=int, default=100, help='Events published in total')
+    parser.add_argument('--machines', type=int, default=1, help='Machines the connections are spread over')
+    args = parser.parse_args()
+
+    print(f"Event stream: {args.connections} connections over {args.machines} machines, {args.events} events")
+    asyncio.run(run(args.connections, args.events, args.machines))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Benchmark fleet-wide health scoring (manage.py score_fleet).
+
+Compares the old approach, one /health-score/-style fit per machine with its
+own readings query, against score_fleet's single streamed query and process
+pool.
+
+    python -m benchmarks.fleet_scoring --machines 500 --history 200 --workers 4
+"""
+import argparse
+
+from benchmarks.common import benchmark_database, count_queries, timer
+from benchmarks.bulk_ingest import seed
+
+from machines.fleet import score_fleet
+from machines.forest import TRAINING_DAYS, load_features
+from machines.isolation import fit_and_score
+from django.utils import timezone
+from datetime import timedelta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--machines', type=int, default=200)
+    parser.add_argument('--history', type=int, default=200, help='Readings per machine')
+    parser.add_argument('--workers', type=int, default=None, help='Pool size (default: one per core)')
+    parser.add_argument('--sample', type=int, default=20, help='Machines timed for the per-machine baseline')
+    args = parser.parse_args()
+
+    with benchmark_database():
+        machines = seed(args.machines, args.history)
+        print(f"Fleet scoring: {args.machines} machines x {args.history} readings")
+
+        sample = machines[:args.sample]
+        with count_queries() as queries, timer() as elapsed:
+            for machine in sample:
+                _, X = load_features(machine.pk, timezone.now() - timedelta(days=TRAINING_DAYS))
+                fit_and_score(machine.pk, X)
+        per_machine = elapsed['seconds'] / len(sample)
+        print(f"  per machine: {per_machine * 1000:.0f}ms each, {queries['queries'] // len(sample)} queries each, "
+              f"~{per_machine * args.machines:.1f}s projected for the fleet")
+
+        with count_queries() as queries, timer() as elapsed:
+            scored = score_fleet(workers=args.workers)
+        print(f"  score_fleet: {scored} machines in {elapsed['seconds']:.1f}s, {queries['queries']} queries, "
+              f"{scored / elapsed['seconds']:.1f} machines/s")
+
+
+if __name__ == '__main__':
+    main()
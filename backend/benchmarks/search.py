@@ -0,0 +1,88 @@
+"""Benchmark ?search= on work orders and machines.
+
+Seeds work orders with generate_series and compares SearchFilter's
+ILIKE '%term%' matching with RankedSearchFilter's indexed tsvector lookup,
+through the API, for a few typical search-box terms.
+
+    python -m benchmarks.search --machines 2000 --work-orders 300000
+"""
+import argparse
+import statistics
+
+from benchmarks.common import benchmark_database, count_queries, timer
+from benchmarks.bulk_ingest import seed
+
+from unittest import mock
+from django.db import connection
+from rest_framework.filters import SearchFilter
+from rest_framework.test import APIClient
+from authentication.models import CustomUser
+from maintenance.views import WorkOrderViewSet
+from machines.views import MachineViewSet
+
+TERMS = ['BENCH-0042', 'bearing', 'hydraulic seal', 'WO-0123']
+
+
+def seed_work_orders(count):
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO work_orders (work_order_id, machine_id, title, description, status, priority,
+                                     scheduled_date, labor_hours, labor_cost, parts_cost, completion_notes,
+                                     digital_signature, created_at, updated_at)
+            SELECT 'WO-' || lpad(g::text, 7, '0'), m.id,
+                   (ARRAY['Replace bearing', 'Hydraulic seal leak', 'Spindle alignment',
+                          'Coolant flush', 'Belt tension check'])[1 + g %% 5] || ' ' || g %% 97,
+                   '', 'PENDING', 'MEDIUM', current_date, 0, 0, 0, '', '', now(), now()
+            FROM generate_series(1, %s) AS g
+            JOIN LATERAL (SELECT id FROM machines ORDER BY id OFFSET g %% (SELECT count(*) FROM machines) LIMIT 1)
+                AS m ON true
+        """, [count])
+        cursor.execute('ANALYZE work_orders')
+        cursor.execute('ANALYZE machines')
+
+
+def time_searches(client, path, repeats):
+    results = {}
+    for term in TERMS:
+        samples = []
+        for _ in range(repeats):
+            with timer() as elapsed:
+                response = client.get(path, {'search': term})
+            samples.append(elapsed['seconds'])
+        results[term] = (statistics.median(samples), len(response.json()['results']))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--machines', type=int, default=2000)
+    parser.add_argument('--work-orders', type=int, default=300000)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        seed(args.machines, 0)
+        seed_work_orders(args.work_orders)
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(CustomUser.objects.create_user(username='bench', password='bench'))
+        print(f"Search: {args.machines} machines, {args.work_orders} work orders")
+
+        for path in ['/api/machines/', '/api/work-orders/']:
+            # The same views with SearchFilter's ILIKE matching put back.
+            with mock.patch.object(MachineViewSet, 'filter_backends', _plain(MachineViewSet)), \
+                    mock.patch.object(WorkOrderViewSet, 'filter_backends', _plain(WorkOrderViewSet)):
+                ilike = time_searches(client, path, args.repeats)
+            with count_queries() as queries:
+                ranked = time_searches(client, path, args.repeats)
+            print(f"  {path} ({queries['queries'] // (len(TERMS) * args.repeats)} queries per search)")
+            for term in TERMS:
+                print(f"    {term!r:18} ILIKE {ilike[term][0] * 1000:7.1f}ms   "
+                      f"tsvector {ranked[term][0] * 1000:6.1f}ms   ({ranked[term][1]} on first page)")
+
+
+def _plain(view):
+    return [SearchFilter if backend.__name__ == 'RankedSearchFilter' else backend for backend in view.filter_backends]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark JSON rendering and parsing with orjson against the json module.
+
+Serializes pages of readings and of work orders (with their parts and
+decimal costs) from a generate_factory fleet, then times
+rendering them with DRF's JSONRenderer and with ORJSONRenderer, per
+response size. The serializer time is shown too, for scale. Parsing is
+timed on /readings/bulk/ request bodies of the same sizes.
+
+    python -m benchmarks.serialization --sizes 20 100 1000 10000
+"""
+import argparse
+import statistics
+from io import BytesIO, StringIO
+
+from benchmarks.common import benchmark_database, timer
+
+from django.core.management import call_command
+from django.db.models import Prefetch
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from factory_maintenance.parsers import ORJSONParser
+from factory_maintenance.renderers import ORJSONRenderer, orjson
+from machines.models import MachineReading
+from machines.serializers import MachineReadingSerializer
+from maintenance.models import SparePartUsage, WorkOrder
+from maintenance.serializers import WorkOrderSerializer
+
+
+def payloads():
+    """``{name: (serializer class, queryset)}`` for the list responses measured."""
+    return {
+        'readings': (MachineReadingSerializer, MachineReading.objects.select_related('logged_by').order_by('-pk')),
+        'work-orders': (WorkOrderSerializer, WorkOrder.objects.select_related('machine', 'assigned_to', 'created_by')
+                        .prefetch_related(Prefetch('parts_used',
+                                                   SparePartUsage.objects.select_related('spare_part')))
+                        .order_by('-pk')),
+    }
+
+
+def median_ms(function, repeats):
+    samples = []
+    for _ in range(repeats):
+        with timer() as elapsed:
+            function()
+        samples.append(elapsed['seconds'])
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--machines', type=int, default=100)
+    parser.add_argument('--readings-per-machine', type=int, default=200)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20, 100, 1000, 10000],
+                        help='Items per response')
+    parser.add_argument('--repeats', type=int, default=7)
+    args = parser.parse_args()
+    if orjson is None:
+        raise SystemExit('orjson is not installed; ORJSONRenderer would fall back to json')
+
+    with benchmark_database():
+        call_command('generate_factory', '--machines', str(args.machines),
+                     '--readings-per-machine', str(args.readings_per_machine),
+                     '--work-orders', str(max(args.sizes)), '--drop-indexes', stdout=StringIO())
+        print(f"Serialization: {args.machines} machines x {args.readings_per_machine} readings, "
+              f"median of {args.repeats} runs")
+        print(f"  {'response':14} {'items':>6} {'size':>9}  {'serializer':>10}  {'json':>8}  {'orjson':>8}  speedup")
+
+        for name, (serializer_class, queryset) in payloads().items():
+            for size in args.sizes:
+                rows = list(queryset[:size])
+                if len(rows) < size:
+                    print(f"  {name:14} {size:6}  only {len(rows)} rows; generate a bigger fleet")
+                    break
+                with timer() as serializing:
+                    data = serializer_class(rows, many=True).data
+                body = ORJSONRenderer().render(data)
+                standard = median_ms(lambda: JSONRenderer().render(data), args.repeats)
+                fast = median_ms(lambda: ORJSONRenderer().render(data), args.repeats)
+                print(f"  {name:14} {size:6} {len(body) / 1024:7.0f}KB  {serializing['seconds'] * 1000:8.1f}ms  "
+                      f"{standard:6.2f}ms  {fast:6.2f}ms  {standard / fast:6.1f}x")
+
+        readings = MachineReadingSerializer(MachineReading.objects.order_by('-pk')[:max(args.sizes)], many=True).data
+        print(f"\n  {'request body':14} {'items':>6} {'size':>9}  {'':>10}  {'json':>8}  {'orjson':>8}  speedup")
+        for size in args.sizes:
+            body = JSONRenderer().render({'readings': [
+                {key: reading[key] for key in ('machine', 'temperature', 'vibration_level', 'oil_pressure')}
+                for reading in readings[:size]
+            ]})
+            standard = median_ms(lambda: JSONParser().parse(BytesIO(body)), args.repeats)
+            fast = median_ms(lambda: ORJSONParser().parse(BytesIO(body)), args.repeats)
+            print(f"  {'reading-bulk':14} {size:6} {len(body) / 1024:7.0f}KB  {'':>10}  "
+                  f"{standard:6.2f}ms  {fast:6.2f}ms  {standard / fast:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
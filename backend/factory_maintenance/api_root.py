@@ -24,12 +24,18 @@ def api_root(request, format=None):
                 'health': '/api/machines/{id}/health/',
                 'health_score': '/api/machines/{id}/health-score/',
                 'report': '/api/machines/{id}/report/',
+                'rollups': '/api/machines/{id}/rollups/?granularity=hour&from=&to=',
+                'series': '/api/machines/{id}/series/?metric=temperature&from=&to=&points=500',
                 'dashboard': '/api/machines/dashboard/',
+                'snapshot': '/api/machines/snapshot/',
             },
             'readings': {
                 'list': '/api/readings/',
                 'log': 'POST /api/readings/log/',
                 'bulk': 'POST /api/readings/bulk/',
+                'stream': 'POST /api/readings/stream/?upload_id=&offset=',
+                'stream_status': '/api/readings/stream/{upload_id}/',
+                'scoring_lag': '/api/readings/scoring-lag/',
             },
             'work_orders': {
                 'list': '/api/work-orders/',
@@ -42,9 +48,14 @@ def api_root(request, format=None):
                 'low_stock': '/api/parts/low-stock/',
                 'restock': 'POST /api/parts/{id}/restock/',
             },
+            'stream': '/api/stream/?machines={codes}&events={types}&token={access_token}',
             'analytics': {
                 'dashboard': '/api/analytics/dashboard/',
                 'notifications': '/api/analytics/notifications/',
+                'notifications_unread_count': '/api/analytics/notifications/unread-count/',
+                'notification_read': 'POST /api/analytics/notifications/{id}/read/',
+                'notifications_read_all': 'POST /api/analytics/notifications/read-all/',
+                'health_scores': '/api/analytics/health-scores/',
             }
         }
     })
@@ -0,0 +1,200 @@
+"""Keyset pagination for large, append-mostly tables.
+
+``PageNumberPagination`` counts the whole filtered table on every page and
+skips rows with ``OFFSET``, so deep pages and big tables get slower
+linearly. ``KeysetPagination`` instead remembers the sort key of the last
+row it returned and asks for rows past it, e.g.
+``(timestamp, id) < (last_timestamp, last_id)``, which an index on the
+sort column answers without reading the skipped rows. The primary key is
+always the last sort key so ties never repeat or drop rows.
+
+There is no exact count. Clients that want a total can pass
+``?count=estimate`` to get ``estimated_count`` from the planner statistics.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+def estimate_count(queryset):
+    """Approximate row count of ``queryset`` from PostgreSQL statistics, without scanning it.
+    
+    An unfiltered queryset uses ``pg_class.reltuples`` summed over the
+    table's partitions; anything else uses the planner's row estimate.
+    """
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute("""
+                SELECT sum(c.reltuples) FILTER (WHERE c.reltuples >= 0)
+                FROM pg_partition_tree(%s::regclass) AS t
+                JOIN pg_class AS c ON c.oid = t.relid
+                WHERE t.isleaf
+            """, [queryset.model._meta.db_table])
+            estimate = cursor.fetchone()[0]
+            if estimate is not None:
+                return int(estimate)
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on ``(ordering field, pk)``; subclasses set ``ordering``.
+    
+    An ``OrderingFilter`` on the view may pick another ordering, as long as
+    its fields are non-nullable. Without one, an ordering a filter backend
+    already put on the queryset (e.g. ``search_rank``) is kept.
+    """
+    ordering = None
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    
+    def get_ordering(self, request, queryset, view):
+        ordering = CursorPagination.get_ordering(self, request, queryset, view)
+        default = (self.ordering,) if isinstance(self.ordering, str) else tuple(self.ordering)
+        chosen = queryset.query.order_by
+        if ordering == default and chosen and all(isinstance(name, str) for name in chosen):
+            return tuple(chosen)
+        return ordering
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        
+        pk_name = queryset.model._meta.pk.name
+        ordering = [name.replace('pk', pk_name) if name.lstrip('-') == 'pk' else name
+                    for name in self.get_ordering(request, queryset, view)]
+        if ordering[-1].lstrip('-') != pk_name:
+            ordering.append(('-' if ordering[-1].startswith('-') else '') + pk_name)
+        self.keys = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        
+        self.estimated_count = None
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.estimated_count = estimate_count(queryset)
+        
+        values, self.reverse = self.decode_cursor(queryset.model, request)
+        if values is not None:
+            queryset = queryset.filter(self.after(values))
+        if self.reverse:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+        
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+        
+        # Walking backwards, the page we came from is always there; the
+        # other direction has more rows only when the extra row was fetched.
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = values is not None if not self.reverse else has_more
+        return self.page
+    
+    def after(self, values):
+        """Rows strictly past ``values`` in the current direction, lexicographically."""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.keys, values):
+            lookup = 'lt' if descending != self.reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        # Bounds the first key on its own so an index range scan can be used.
+        name, descending = self.keys[0]
+        first = Q(**{f"{name}__{'lte' if descending != self.reverse else 'gte'}": values[0]})
+        return first & condition
+    
+    def get_page_size(self, request):
+        try:
+            return min(max(int(request.query_params[self.page_size_query_param]), 1), self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+    
+    def decode_cursor(self, model, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            values = [
+                self.to_python(model, name, value)
+                for (name, _), value in zip(self.keys, cursor['v'], strict=True)
+            ]
+            return values, bool(cursor['r'])
+        except (TypeError, ValueError, KeyError, BinasciiError, ValidationError):
+            raise NotFound('Invalid cursor')
+    
+    def to_python(self, model, name, value):
+        try:
+            return model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            # An annotation such as search_rank; JSON already holds its value.
+            if not isinstance(value, (int, float, str)):
+                raise ValueError(name)
+            return value
+    
+    def encode_cursor(self, instance, reverse):
+        values = []
+        for name, _ in self.keys:
+            value = getattr(instance, name)
+            # DjangoJSONEncoder would drop microseconds and repeat or skip rows.
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        encoded = urlsafe_b64encode(json.dumps({'v': values, 'r': reverse}).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+    
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+    
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+    
+    def get_paginated_response(self, data):
+        body = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        if self.estimated_count is not None:
+            body['estimated_count'] = self.estimated_count
+        body['results'] = data
+        return Response(body)
+    
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'estimated_count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
+    
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query',
+             'schema': {'type': 'string'}, 'description': 'The pagination cursor value.'},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'schema': {'type': 'integer'}, 'description': 'Number of results to return per page.'},
+            {'name': self.count_query_param, 'required': False, 'in': 'query',
+             'schema': {'type': 'string', 'enum': ['estimate']},
+             'description': 'Include an approximate total from table statistics.'},
+        ]
@@ -0,0 +1,18 @@
+"""JSON request parsing with orjson; see ``factory_maintenance/renderers.py``."""
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from .renderers import ORJSONRenderer, orjson
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+    
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        # orjson only reads UTF-8 and always rejects NaN and infinity.
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8' or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
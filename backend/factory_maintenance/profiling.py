@@ -0,0 +1,275 @@
+"""Per-request timing: ``Server-Timing`` headers, ``/metrics`` and sampled cProfile dumps.
+
+``ProfilingMiddleware`` times every request and returns the breakdown in a
+``Server-Timing`` header, which browser dev tools show next to the request:
+
+* ``db``: time spent in database queries, with the query count;
+* ``app``: the view and everything it calls (authentication, queries,
+  serializers), up to the response it returns;
+* ``render``: rendering the response body, e.g. DRF's JSON renderer;
+* ``total``: the whole request, including the other middleware.
+
+Serializers run inside the view, so their time is part of ``app``; for DRF
+views ``app`` minus ``db`` is close to the serializer cost. Streaming
+responses, such as the event stream, are timed up to their headers; their
+body is never touched. Queries are counted by an execute wrapper installed
+on the database connections for the duration of the request only.
+
+The same numbers are aggregated per view into histograms kept in process
+memory and served at ``/metrics`` in the Prometheus text format, to the
+addresses in ``METRICS_ALLOWED_IPS`` only. Each worker process reports its
+own requests, so scrape every worker (or run one per container).
+
+With ``PROFILE_SLOW_REQUEST_MS`` set, a ``PROFILE_SAMPLE_RATE`` fraction of
+requests runs under cProfile, and the stats of those slower than the
+threshold are written to ``PROFILE_DIR`` for ``python -m pstats`` or
+snakeviz.
+"""
+import cProfile
+import ipaddress
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils import timezone
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+UNMATCHED_VIEW = 'unmatched'
+
+_current = ContextVar('request_timings', default=None)
+
+class RequestTimings:
+    """What one request spent where; times are ``perf_counter()`` seconds."""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = ''
+        self.view_finished = None
+        self.queries = 0
+        self.db_seconds = 0.0
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the current request's timings."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_seconds += time.perf_counter() - started
+        timings.queries += 1
+
+@contextmanager
+def wrapping_queries(wrapper):
+    """Run this thread's queries through the execute wrapper ``wrapper`` for the duration of the block.
+    
+    Wrappers are pushed and popped with ``connection.execute_wrapper()``, so
+    they nest with any other; a connection already wrapped is left alone.
+    """
+    with ExitStack() as stack:
+        for connection in connections.all():
+            if wrapper not in connection.execute_wrappers:
+                stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
+
+@asynccontextmanager
+async def entered_in_view_thread(scope):
+    """Enter the context manager ``scope`` in the thread running this request's synchronous views.
+    
+    Database connections belong to a thread, and under ASGI the views run in
+    a thread of their own rather than the event loop's.
+    """
+    await sync_to_async(scope.__enter__, thread_sensitive=True)()
+    try:
+        yield
+    finally:
+        await sync_to_async(scope.__exit__, thread_sensitive=True)(None, None, None)
+
+def current_view():
+    """URL name of the view serving the current request, or ``''`` outside one."""
+    timings = _current.get()
+    return timings.view if timings is not None else ''
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+    
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+class Metrics:
+    """Request counters and per-view histograms of this process."""
+    
+    HISTOGRAMS = {
+        'http_request_duration_seconds': ('Total request time.', DURATION_BUCKETS),
+        'http_request_db_duration_seconds': ('Time spent in database queries.', DURATION_BUCKETS),
+        'http_request_render_duration_seconds': ('Time spent rendering the response.', DURATION_BUCKETS),
+        'http_request_db_queries': ('Database queries per request.', QUERY_BUCKETS),
+    }
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.histograms = {name: {} for name in self.HISTOGRAMS}
+    
+    def observe(self, view, method, status, values):
+        """Count a request and add ``values`` (``{histogram name: value}``) to the view's histograms."""
+        with self._lock:
+            self.requests[view, method, status] += 1
+            for name, value in values.items():
+                histogram = self.histograms[name].get((view, method))
+                if histogram is None:
+                    histogram = self.histograms[name][view, method] = Histogram(self.HISTOGRAMS[name][1])
+                histogram.observe(value)
+    
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            for histograms in self.histograms.values():
+                histograms.clear()
+    
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = ['# HELP http_requests_total Requests served, by view, method and status.',
+                 '# TYPE http_requests_total counter']
+        with self._lock:
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            for name, (help_text, buckets) in self.HISTOGRAMS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (view, method), histogram in sorted(self.histograms[name].items()):
+                    labels = f'view="{view}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def metrics_view(request):
+    """The metrics, for scrapers in ``METRICS_ALLOWED_IPS``; the endpoint is off while that is empty."""
+    if not settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    address = ipaddress.ip_address(request.META['REMOTE_ADDR'])
+    if not any(address in ipaddress.ip_network(allowed, strict=False) for allowed in settings.METRICS_ALLOWED_IPS):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class ProfilingMiddleware:
+    """Times each request; see the module docstring. Should come first in ``MIDDLEWARE``."""
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profiler = self.sampled_profiler()
+        try:
+            with wrapping_queries(record_query):
+                if profiler is None:
+                    response = self.get_response(request)
+                else:
+                    response = self.profiled(request, profiler)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, timings, profiler)
+        return response
+    
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profiler = self.sampled_profiler()
+        try:
+            async with entered_in_view_thread(wrapping_queries(record_query)):
+                if profiler is None:
+                    response = await self.get_response(request)
+                else:
+                    # cProfile only sees its own thread, so the whole request is
+                    # driven from the thread that runs the (synchronous) views.
+                    response = await sync_to_async(self.profiled, thread_sensitive=True)(request, profiler)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, timings, profiler)
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = _current.get()
+        if timings is not None:
+            timings.view = request.resolver_match.view_name
+    
+    def process_template_response(self, request, response):
+        # Called with the response the view returned, just before it is rendered.
+        timings = _current.get()
+        if timings is not None:
+            timings.view_finished = time.perf_counter()
+        return response
+    
+    def sampled_profiler(self):
+        if settings.PROFILE_SLOW_REQUEST_MS and random.random() < settings.PROFILE_SAMPLE_RATE:
+            return cProfile.Profile()
+        return None
+    
+    def profiled(self, request, profiler):
+        get_response = async_to_sync(self.get_response) if self.is_async else self.get_response
+        profiler.enable()
+        try:
+            return get_response(request)
+        finally:
+            profiler.disable()
+    
+    def finish(self, request, response, timings, profiler):
+        finished = time.perf_counter()
+        total = finished - timings.started
+        view_finished = timings.view_finished or finished
+        render = finished - view_finished
+        entries = [
+            f'db;dur={timings.db_seconds * 1000:.1f};desc="{timings.queries} queries"',
+            f'app;dur={(view_finished - timings.started) * 1000:.1f}',
+            f'render;dur={render * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ]
+        response.headers['Server-Timing'] = ', '.join(entries)
+        
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else UNMATCHED_VIEW
+        metrics.observe(view, request.method, response.status_code, {
+            'http_request_duration_seconds': total,
+            'http_request_db_duration_seconds': timings.db_seconds,
+            'http_request_render_duration_seconds': render,
+            'http_request_db_queries': timings.queries,
+        })
+        if profiler is not None and total * 1000 >= settings.PROFILE_SLOW_REQUEST_MS:
+            self.dump(profiler, view, request.method, total)
+    
+    def dump(self, profiler, view, method, total):
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        name = re.sub(r'[^\w-]', '_', view)
+        path = os.path.join(settings.PROFILE_DIR,
+                            f'{timezone.now():%Y%m%dT%H%M%S%f}-{name}-{method}-{total * 1000:.0f}ms.prof')
+        profiler.dump_stats(path)
@@ -0,0 +1,33 @@
+"""JSON rendering with orjson, the default renderer of the API.
+
+orjson encodes dicts, lists, strings, numbers, dates and datetimes natively
+and several times faster than ``json.dumps``. Anything else (``Decimal``
+costs, timedeltas, UUIDs, lazy translations, numpy values) goes through
+DRF's ``JSONEncoder.default``, so the output is the same as
+``JSONRenderer``'s. The exceptions are NaN and infinity, which render as
+``null`` rather than failing the request.
+
+Without orjson installed, and for indented output (``?format=api`` or
+``Accept: application/json; indent=4``), ``JSONRenderer`` does the work.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        
+        ret = orjson.dumps(data, default=self.encoder_class().default,
+                           option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+        # Keep the output a strict JavaScript subset, as JSONRenderer does.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 from decouple import config, Csv
+from celery.schedules import crontab
 import os
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'factory_maintenance.profiling.ProfilingMiddleware',
+    'analytics.slow_queries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -141,11 +144,21 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    # orjson-backed JSON (see factory_maintenance/renderers.py); falls back to json without orjson.
+    'DEFAULT_RENDERER_CLASSES': [
+        'factory_maintenance.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'factory_maintenance.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
-        'rest_framework.filters.SearchFilter',
+        'factory_maintenance.search.RankedSearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
 }
@@ -159,5 +172,109 @@ SIMPLE_JWT = {
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
 }
 
+# Cache
+# Shared Redis cache when CACHE_URL is set, otherwise a table in the database
+# (created by the analytics migrations). Either way every process, including
+# Celery workers, sees the same entries, so signal invalidation reaches all.
+
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
+# Celery
+# Without a broker configured, tasks run eagerly in-process (memory broker),
+# so development and tests work without Redis.
+
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='memory://')
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=CELERY_BROKER_URL.startswith('memory://'), cast=bool)
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'refresh-machine-health': {
+        'task': 'machines.tasks.refresh_machine_health',
+        'schedule': crontab(hour=0, minute=5),
+    },
+    'evaluate-notifications': {
+        'task': 'analytics.tasks.evaluate_notifications',
+        'schedule': crontab(hour=0, minute=10),
+    },
+    'expire-slow-queries': {
+        'task': 'analytics.tasks.expire_slow_queries',
+        'schedule': crontab(hour=0, minute=15),
+    },
+    'manage-reading-partitions': {
+        'task': 'machines.tasks.manage_reading_partitions',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    'sweep-anomalies': {
+        'task': 'machines.tasks.sweep_anomalies',
+        'schedule': crontab(minute=20),
+    },
+    'refit-health-models': {
+        'task': 'machines.tasks.refit_health_models',
+        'schedule': crontab(minute='*/15'),
+    },
+    'score-fleet': {
+        'task': 'machines.tasks.score_fleet',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    'purge-minute-rollups': {
+        'task': 'machines.tasks.purge_minute_rollups',
+        'schedule': crontab(hour=1, minute=30),
+    },
+}
+
+# Reading partitions (see machines/partitions.py)
+
+READING_PARTITION_MONTHS_AHEAD = config('READING_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+READING_RETENTION_MONTHS = config('READING_RETENTION_MONTHS', default=0, cast=int)  # 0 keeps all history
+READING_RETENTION_MODE = config('READING_RETENTION_MODE', default='detach')  # 'detach' or 'drop'
+ROLLUP_MINUTE_RETENTION_DAYS = config('ROLLUP_MINUTE_RETENTION_DAYS', default=14, cast=int)
+
+# Health-score models (see machines/forest.py): refit after this many new
+# readings, or once the model is this old.
+HEALTH_MODEL_REFIT_READINGS = config('HEALTH_MODEL_REFIT_READINGS', default=500, cast=int)
+HEALTH_MODEL_MAX_AGE_HOURS = config('HEALTH_MODEL_MAX_AGE_HOURS', default=24, cast=int)
+
+# Hourly anomaly sweep (see machines/sweep.py): how far back each run looks.
+ANOMALY_SWEEP_HOURS = config('ANOMALY_SWEEP_HOURS', default=24, cast=int)
+
+# Notifications (see analytics/notifications.py) are deleted after this long.
+NOTIFICATION_RETENTION_DAYS = config('NOTIFICATION_RETENTION_DAYS', default=30, cast=int)
+
+# Live event stream (see analytics/events.py). Without a broker URL events
+# only reach streams served by the process that raised them.
+EVENT_BROKER_URL = config('EVENT_BROKER_URL', default='')
+STREAM_QUEUE_SIZE = config('STREAM_QUEUE_SIZE', default=256, cast=int)  # events buffered per connection
+STREAM_HEARTBEAT_SECONDS = config('STREAM_HEARTBEAT_SECONDS', default=15, cast=float)
+STREAM_RETRY_MS = 3000
+
+# Request profiling (see factory_maintenance/profiling.py): this fraction of
+# requests runs under cProfile, and those slower than the threshold are dumped.
+PROFILE_SLOW_REQUEST_MS = config('PROFILE_SLOW_REQUEST_MS', default=0, cast=int)  # 0 disables profiling
+PROFILE_SAMPLE_RATE = config('PROFILE_SAMPLE_RATE', default=0.1, cast=float)
+PROFILE_DIR = config('PROFILE_DIR', default=str(BASE_DIR / 'profiles'))
+# Addresses or networks allowed to scrape /metrics; empty turns the endpoint off.
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='', cast=Csv())
+
+# Slow-query sampling (see analytics/slow_queries.py): queries slower than
+# this are stored, and this fraction of the slow SELECTs is explained.
+SLOW_QUERY_MS = config('SLOW_QUERY_MS', default=0, cast=float)  # 0 disables sampling
+SLOW_QUERY_EXPLAIN_RATE = config('SLOW_QUERY_EXPLAIN_RATE', default=0.1, cast=float)
+SLOW_QUERY_RETENTION_DAYS = config('SLOW_QUERY_RETENTION_DAYS', default=14, cast=int)
+
 CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default='http://localhost:3000', cast=Csv())
 CORS_ALLOW_CREDENTIALS = True
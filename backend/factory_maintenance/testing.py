@@ -0,0 +1,207 @@
+"""Test helpers: a realistic seeded fleet and per-endpoint query and time budgets.
+
+``EndpointBudgetTestCase.assertWithinBudget`` fails when a request issues
+more queries than its budget or takes longer than its time budget, listing
+the queries it ran. Query budgets are exact ceilings on a fleet with many
+rows per table, so an N+1 shows up as soon as it is introduced. Time
+budgets are deliberately loose; set ``TIME_BUDGET_SCALE`` to stretch them
+on slow CI machines.
+"""
+import os
+import random
+import time
+from datetime import date, timedelta
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver
+from django.utils import timezone
+from analytics.models import Notification, NotificationRead
+from authentication.models import CustomUser
+from machines.forest import fit_health_model
+from machines.health import refresh_health_statuses
+from machines.models import Machine, MachineHealthScore, MachineReading, ReadingUpload
+from machines.rollups import rebuild_rollups
+from maintenance.models import SparePart, SparePartUsage, WorkOrder
+
+TIME_BUDGET_SCALE = float(os.environ.get('TIME_BUDGET_SCALE', 1))
+HTTP_METHODS = ('get', 'post', 'put', 'patch', 'delete')
+
+LOCATIONS = ['Shop Floor A', 'Shop Floor B', 'Assembly Line 1', 'Paint Shop']
+MACHINE_TYPES = ['CNC', 'Press', 'Conveyor', 'Compressor', 'Pump']
+PART_NAMES = ['Ball Bearing', 'Hydraulic Seal', 'Drive Belt', 'Oil Filter', 'Coolant Pump', 'Spindle Motor']
+
+def create_machine(machine_id='CNC-001', **fields):
+    """A CNC machine with every required field filled in; ``fields`` override them."""
+    return Machine.objects.create(**{
+        'machine_id': machine_id, 'machine_name': 'CNC Lathe', 'machine_type': 'CNC', 'location': 'Shop Floor A',
+        'installation_date': date(2020, 1, 1), 'maintenance_frequency_days': 30, **fields,
+    })
+
+def seed_fleet(machines=12, readings_per_machine=60, parts=10, work_orders=15, password='pass', seed=42):
+    """Create a small but realistic fleet and return its objects in a dict.
+
+    Every table an endpoint reads gets several rows per parent, so per-row
+    queries are visible in query counts: machines with spread maintenance
+    dates, three days of readings with some anomalies, rollups, a fitted
+    health model and fleet scores, spare parts compatible with several
+    machines, work orders in every status using several parts each, and
+    notifications, some of them read.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    today = timezone.localdate()
+    user = CustomUser.objects.create_user(username='technician', password=password, role='TECHNICIAN',
+                                          email='technician@example.com')
+
+    fleet = Machine.objects.bulk_create([
+        Machine(
+            machine_id=f'{MACHINE_TYPES[index % len(MACHINE_TYPES)][:3].upper()}-{index:03d}',
+            machine_name=f'{MACHINE_TYPES[index % len(MACHINE_TYPES)]} {index}',
+            machine_type=MACHINE_TYPES[index % len(MACHINE_TYPES)],
+            manufacturer=rng.choice(['Haas Automation', 'Schuler', 'Bosch Rexroth', 'Atlas Copco']),
+            location=LOCATIONS[index % len(LOCATIONS)],
+            installation_date=date(2020, 1, 1) + timedelta(days=30 * index),
+            maintenance_frequency_days=30,
+            last_maintenance_date=today - timedelta(days=rng.randint(5, 40)),
+            next_maintenance_date=today + timedelta(days=rng.randint(-5, 25)),
+            created_by=user,
+        )
+        for index in range(machines)
+    ])
+
+    readings = MachineReading.objects.bulk_create([
+        MachineReading(
+            machine=machine, logged_by=user, temperature=rng.gauss(70, 2), vibration_level=rng.gauss(2, 0.2),
+            oil_pressure=rng.gauss(45, 1), runtime_hours=1000 + index, is_anomaly=index % 25 == 24,
+            anomaly_reason='Temperature 2.4 sigma above the recent mean' if index % 25 == 24 else '',
+        )
+        for machine in fleet
+        for index in range(readings_per_machine)
+    ])
+    for index, reading in enumerate(readings):
+        reading.timestamp = now - timedelta(days=3) * (1 - (index % readings_per_machine) / readings_per_machine)
+        reading.scored_at = reading.timestamp
+    MachineReading.objects.bulk_update(readings, ['timestamp', 'scored_at'])
+    rebuild_rollups(now - timedelta(days=3), now)
+    Machine.objects.filter(pk=fleet[0].pk).update(last_anomaly_at=now - timedelta(hours=2))
+    refresh_health_statuses()
+    fit_health_model(fleet[0].pk)
+    MachineHealthScore.objects.bulk_create([
+        MachineHealthScore(
+            machine=machine, health_score=rng.randint(40, 100), status=rng.choice(['HEALTHY', 'WARNING', 'CRITICAL']),
+            trend=rng.choice(['IMPROVING', 'DECLINING']), readings_analyzed=readings_per_machine,
+            anomalies_detected=readings_per_machine // 25, model_version=1, scored_at=now,
+        )
+        for machine in fleet
+    ])
+
+    spare_parts = SparePart.objects.bulk_create([
+        SparePart(
+            part_id=f'PRT-{index:04d}', part_name=PART_NAMES[index % len(PART_NAMES)],
+            quantity_in_stock=rng.randint(0, 40), minimum_stock_level=5, unit_cost=rng.randint(5, 500),
+            supplier_name=rng.choice(['SKF', 'Parker', 'Gates']),
+        )
+        for index in range(parts)
+    ])
+    for index, part in enumerate(spare_parts):
+        part.compatible_machines.set(fleet[index % len(fleet):][:3])
+
+    statuses = ['PENDING', 'IN_PROGRESS', 'COMPLETED', 'CANCELLED']
+    orders = WorkOrder.objects.bulk_create([
+        WorkOrder(
+            work_order_id=f'WO-{index:04d}', machine=fleet[index % len(fleet)], title='Scheduled service',
+            description='Inspect, lubricate and replace worn parts', status=statuses[index % len(statuses)],
+            priority=rng.choice(['LOW', 'MEDIUM', 'HIGH', 'CRITICAL']), assigned_to=user, created_by=user,
+            scheduled_date=today + timedelta(days=index - work_orders // 2),
+        )
+        for index in range(work_orders)
+    ])
+    SparePartUsage.objects.bulk_create([
+        SparePartUsage(work_order=order, spare_part=spare_parts[(index + offset) % len(spare_parts)], quantity_used=2)
+        for index, order in enumerate(orders)
+        for offset in range(3)
+    ])
+
+    notifications = Notification.objects.bulk_create([
+        Notification(
+            type='ANOMALY_DETECTED', severity='HIGH', title=f'Anomaly on {machine.machine_id}',
+            message='Temperature 2.4 sigma above the recent mean', machine=machine,
+            event_key=f'anomaly:{machine.pk}:seed', timestamp=now,
+        )
+        for machine in fleet
+    ] + [
+        Notification(
+            type='LOW_STOCK', severity='MEDIUM', title=f'Low stock: {part.part_name}',
+            message=f'{part.quantity_in_stock} left', spare_part=part, event_key=f'low_stock:{part.pk}:seed',
+            timestamp=now,
+        )
+        for part in spare_parts
+    ])
+    NotificationRead.objects.bulk_create([
+        NotificationRead(user=user, notification=notification) for notification in notifications[::3]
+    ])
+
+    upload = ReadingUpload.objects.create(format='ndjson', uploaded_by=user)
+    return {
+        'user': user,
+        'machines': fleet,
+        'parts': spare_parts,
+        'work_orders': orders,
+        'notifications': notifications,
+        'upload': upload,
+    }
+
+def api_routes():
+    """Every ``(url name, http method)`` served under ``/api/``."""
+    routes = set()
+
+    def walk(patterns, prefix):
+        for pattern in patterns:
+            path = prefix + str(pattern.pattern)
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns, path)
+            elif path.startswith('api/') and pattern.name:
+                callback = pattern.callback
+                if getattr(callback, 'actions', None):
+                    methods = [method for method in callback.actions if method in HTTP_METHODS]
+                elif getattr(callback, 'cls', None):
+                    methods = [method for method in HTTP_METHODS if hasattr(callback.cls, method)]
+                else:
+                    methods = ['get']
+                routes.update((pattern.name, method) for method in methods)
+
+    walk(get_resolver().url_patterns, '')
+    return routes
+
+class EndpointBudgetTestCase(TestCase):
+    """Base class for tests asserting how many queries and how long a request may take."""
+
+    def assertWithinBudget(self, method, path, queries, seconds, status=None, **request):
+        """Issue the request, roll back what it wrote, and check it against its budget.
+
+        ``status`` is the expected status code; by default any 2xx or 3xx.
+        Returns the response.
+        """
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = getattr(self.client, method)(path, **request)
+                if response.streaming:
+                    # Streamed bodies do their work as they are read; keep the body readable.
+                    response.streaming_content = [b''.join(response.streaming_content)]
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+
+        label = f'{method.upper()} {path}'
+        if status is None:
+            self.assertLess(response.status_code, 400, f'{label} returned {response.status_code}: '
+                                                       f'{getattr(response, "data", "")}')
+        else:
+            self.assertEqual(response.status_code, status, f'{label} returned {response.status_code}')
+        if len(captured) > queries:
+            listing = '\n'.join(f'{index}. {query["sql"]}' for index, query in enumerate(captured, 1))
+            self.fail(f'{label} ran {len(captured)} queries, budget {queries}:\n{listing}')
+        budget = seconds * TIME_BUDGET_SCALE
+        self.assertLessEqual(elapsed, budget, f'{label} took {elapsed:.3f}s, budget {budget:.3f}s')
+        return response
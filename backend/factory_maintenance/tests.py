@@ -0,0 +1,273 @@
+import json
+import os
+import pstats
+import tempfile
+import uuid
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+from authentication.models import CustomUser
+from machines.models import Machine
+from .parsers import ORJSONParser
+from .profiling import metrics, record_query
+from .renderers import ORJSONRenderer
+from .testing import EndpointBudgetTestCase, api_routes, seed_fleet
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class EndpointBudgetTests(EndpointBudgetTestCase):
+    """Query and time budgets for every API endpoint, on a seeded fleet.
+
+    Raising a budget should be a conscious decision: check the listed
+    queries for a per-row lookup first.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fleet = seed_fleet()
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = \
+            f"Bearer {RefreshToken.for_user(self.fleet['user']).access_token}"
+
+    def budgets(self):
+        """``(url name, method, path, queries, seconds, request kwargs)`` for every route."""
+        fleet = self.fleet
+        machine = fleet['machines'][0]
+        reading = machine.readings.first()
+        order = fleet['work_orders'][0]
+        part = fleet['parts'][0]
+        notification = fleet['notifications'][1]
+        new_machine = {
+            'machine_id': 'NEW-001', 'machine_name': 'New Lathe', 'machine_type': 'CNC',
+            'location': 'Shop Floor A', 'installation_date': '2024-01-01', 'maintenance_frequency_days': 30,
+        }
+        new_order = {
+            'work_order_id': 'WO-NEW', 'machine': machine.pk, 'title': 'Replace belt',
+            'description': 'Belt is worn', 'scheduled_date': '2025-01-01',
+        }
+        new_part = {'part_id': 'PRT-NEW', 'part_name': 'Drive Belt', 'unit_cost': '25.00', 'quantity_in_stock': 10}
+        ndjson = '\n'.join(json.dumps({'machine_id': machine.machine_id, 'temperature': 70 + index})
+                           for index in range(20))
+        as_json = {'content_type': 'application/json'}
+        return [
+            ('api-root', 'get', '/api/', 1, 0.25, {}),
+            ('register', 'post', '/api/auth/register/', 3, 1.0, {'data': {
+                'username': 'newtech', 'email': 'new@example.com', 'password': 'Str0ng-pass!',
+                'password2': 'Str0ng-pass!', 'first_name': 'New', 'last_name': 'Tech'}}),
+            ('login', 'post', '/api/auth/login/', 2, 1.0, {'data': {'username': 'technician', 'password': 'pass'}}),
+            ('profile', 'get', '/api/auth/profile/', 1, 0.25, {}),
+            ('profile-update', 'put', '/api/auth/profile/update/', 2, 0.25,
+             {'data': json.dumps({'phone_number': '555-0100'}), **as_json}),
+            ('change-password', 'post', '/api/auth/change-password/', 2, 1.0, {'data': {
+                'old_password': 'pass', 'new_password': 'An0ther-pass!', 'new_password2': 'An0ther-pass!'}}),
+            ('token-refresh', 'post', '/api/auth/token/refresh/', 0, 0.25,
+             {'data': {'refresh': str(RefreshToken.for_user(fleet['user']))}}),
+            # A cold overview: its 3 counts plus the database cache's lookup, cull count and upsert.
+            ('analytics-dashboard', 'get', '/api/analytics/dashboard/', 10, 0.5, {}),
+            ('health-scores', 'get', '/api/analytics/health-scores/', 3, 0.25, {}),
+            ('notification-list', 'get', '/api/analytics/notifications/', 2, 0.25, {}),
+            ('notification-detail', 'get', f'/api/analytics/notifications/{notification.pk}/', 2, 0.25, {}),
+            ('notification-unread-count', 'get', '/api/analytics/notifications/unread-count/', 2, 0.25, {}),
+            ('notification-read', 'post', f'/api/analytics/notifications/{notification.pk}/read/', 6, 0.25, {}),
+            ('notification-read-all', 'post', '/api/analytics/notifications/read-all/', 3, 0.25, {}),
+            ('event-stream', 'get', '/api/stream/', 0, 0.25, {'status': 501}),
+            ('machine-list', 'get', '/api/machines/', 4, 0.5, {}),
+            ('machine-list', 'post', '/api/machines/', 4, 0.5, {'data': new_machine}),
+            ('machine-detail', 'get', f'/api/machines/{machine.pk}/', 3, 0.25, {}),
+            ('machine-detail', 'put', f'/api/machines/{machine.pk}/',
+             6, 0.5, {'data': json.dumps({**new_machine, 'machine_id': machine.machine_id}), **as_json}),
+            ('machine-detail', 'patch', f'/api/machines/{machine.pk}/', 5, 0.5,
+             {'data': json.dumps({'location': 'Shop Floor B'}), **as_json}),
+            ('machine-detail', 'delete', f'/api/machines/{machine.pk}/', 16, 1.0, {}),
+            ('machine-dashboard', 'get', '/api/machines/dashboard/', 6, 0.5, {}),
+            ('machine-snapshot', 'get', '/api/machines/snapshot/', 3, 0.5, {}),
+            ('machine-get-by-code', 'get', f'/api/machines/by-code/{machine.machine_id}/', 3, 0.25, {}),
+            ('machine-generate-qr', 'get', f'/api/machines/{machine.pk}/qr/', 3, 1.0, {}),
+            ('machine-health-status', 'get', f'/api/machines/{machine.pk}/health/', 4, 0.25, {}),
+            ('machine-health-score', 'get', f'/api/machines/{machine.pk}/health-score/', 5, 1.0, {}),
+            ('machine-pdf-report', 'get', f'/api/machines/{machine.pk}/report/', 4, 1.0, {}),
+            ('machine-rollups', 'get', f'/api/machines/{machine.pk}/rollups/', 3, 0.25, {}),
+            ('machine-series', 'get', f'/api/machines/{machine.pk}/series/', 4, 0.5, {}),
+            ('reading-list', 'get', '/api/readings/', 2, 0.5, {}),
+            ('reading-list', 'post', '/api/readings/', 5, 0.5, {'data': {'machine': machine.pk, 'temperature': 71}}),
+            ('reading-detail', 'get', f'/api/readings/{reading.pk}/', 2, 0.25, {}),
+            # Edits and deletes rebuild the reading's day of rollups: one delete and an insert per granularity.
+            ('reading-detail', 'put', f'/api/readings/{reading.pk}/', 12, 0.5,
+             {'data': json.dumps({'machine': machine.pk, 'temperature': 72}), **as_json}),
+            ('reading-detail', 'patch', f'/api/readings/{reading.pk}/', 11, 0.5,
+             {'data': json.dumps({'notes': 'Checked'}), **as_json}),
+            ('reading-detail', 'delete', f'/api/readings/{reading.pk}/', 11, 0.5, {}),
+            ('reading-log-reading', 'post', '/api/readings/log/', 6, 0.5,
+             {'data': {'machine_id': machine.machine_id, 'temperature': 71}}),
+            ('reading-bulk-log', 'post', '/api/readings/bulk/', 5, 1.0, {'data': json.dumps({'readings': [
+                {'machine_id': m.machine_id, 'temperature': 70} for m in fleet['machines']]}), **as_json}),
+            ('reading-stream-upload', 'post', '/api/readings/stream/', 10, 1.0,
+             {'data': ndjson, 'content_type': 'application/x-ndjson'}),
+            ('reading-stream-status', 'get', f"/api/readings/stream/{fleet['upload'].pk}/", 2, 0.25, {}),
+            ('reading-scoring-lag', 'get', '/api/readings/scoring-lag/', 2, 0.25, {}),
+            ('workorder-list', 'get', '/api/work-orders/', 2, 0.5, {}),
+            ('workorder-list', 'post', '/api/work-orders/', 5, 0.5, {'data': new_order}),
+            ('workorder-detail', 'get', f'/api/work-orders/{order.pk}/', 3, 0.25, {}),
+            ('workorder-detail', 'put', f'/api/work-orders/{order.pk}/', 8, 0.5,
+             {'data': json.dumps({**new_order, 'work_order_id': order.work_order_id}), **as_json}),
+            ('workorder-detail', 'patch', f'/api/work-orders/{order.pk}/', 6, 0.5,
+             {'data': json.dumps({'priority': 'HIGH'}), **as_json}),
+            ('workorder-detail', 'delete', f'/api/work-orders/{order.pk}/', 5, 0.5, {}),
+            ('workorder-start-work', 'post', f'/api/work-orders/{order.pk}/start/', 5, 0.5, {}),
+            ('workorder-complete-work', 'post', f'/api/work-orders/{order.pk}/complete/', 6, 0.5,
+             {'data': {'completion_notes': 'Done', 'labor_hours': 2}}),
+            ('workorder-add-parts', 'post', f'/api/work-orders/{order.pk}/parts/', 19, 0.5,
+             {'data': json.dumps({'parts': [{'spare_part': p.pk, 'quantity_used': 1} for p in fleet['parts'][:3]]}),
+              **as_json}),
+            ('sparepart-list', 'get', '/api/parts/', 4, 0.5, {}),
+            ('sparepart-list', 'post', '/api/parts/', 6, 0.5, {'data': new_part}),
+            ('sparepart-detail', 'get', f'/api/parts/{part.pk}/', 3, 0.25, {}),
+            ('sparepart-detail', 'put', f'/api/parts/{part.pk}/', 8, 0.5,
+             {'data': json.dumps({**new_part, 'part_id': part.part_id}), **as_json}),
+            ('sparepart-detail', 'patch', f'/api/parts/{part.pk}/', 9, 0.5,
+             {'data': json.dumps({'quantity_in_stock': 1}), **as_json}),
+            ('sparepart-detail', 'delete', f'/api/parts/{part.pk}/', 9, 0.5, {}),
+            ('sparepart-low-stock', 'get', '/api/parts/low-stock/', 3, 0.5, {}),
+            ('sparepart-restock', 'post', f'/api/parts/{part.pk}/restock/', 5, 0.5,
+             {'data': json.dumps({'quantity': 10}), **as_json}),
+        ]
+
+    def test_every_route_has_a_budget(self):
+        budgeted = {(name, method) for name, method, *_ in self.budgets()}
+        self.assertEqual(api_routes() - budgeted, set())
+
+    def test_endpoints_stay_within_budget(self):
+        for name, method, path, queries, seconds, request in self.budgets():
+            with self.subTest(f'{method.upper()} {name}'):
+                self.assertWithinBudget(method, path, queries, seconds, **request)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='tech', password='pass', role='TECHNICIAN')
+        Machine.objects.create(machine_id='CNC-001', machine_name='Lathe', machine_type='CNC', location='Shop A',
+                               installation_date='2023-01-01', maintenance_frequency_days=30,
+                               created_by=cls.user)
+
+    def setUp(self):
+        metrics.reset()
+        self.auth = {'headers': {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}}
+
+    def server_timing(self, response):
+        entries = {}
+        for entry in response.headers['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            entries[name] = dict(param.split('=', 1) for param in params)
+        return entries
+
+    def test_server_timing_reports_queries_and_stages(self):
+        response = self.client.get('/api/machines/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        timing = self.server_timing(response)
+        self.assertEqual(set(timing), {'db', 'app', 'render', 'total'})
+        queries = int(timing['db']['desc'].strip('"').split()[0])
+        self.assertGreater(queries, 0)
+        self.assertLessEqual(float(timing['app']['dur']) + float(timing['render']['dur']),
+                             float(timing['total']['dur']) + 0.1)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_metrics_aggregate_per_view(self):
+        self.client.get('/api/machines/', **self.auth)
+        self.client.get('/api/machines/', **self.auth)
+        self.client.get('/no-such-page/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('http_requests_total{view="machine-list",method="GET",status="200"} 2', body)
+        self.assertIn('http_requests_total{view="unmatched",method="GET",status="404"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{view="machine-list",method="GET"} 2', body)
+        self.assertIn('http_request_db_queries_bucket{view="machine-list",method="GET",le="+Inf"} 2', body)
+
+    def test_query_recorder_only_wraps_the_request(self):
+        counted = []
+
+        def counting(execute, sql, params, many, context):
+            counted.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(counting):
+            response = self.client.get('/api/machines/', **self.auth)
+            self.assertIs(connection.execute_wrappers[-1], counting)
+        self.assertNotIn(counting, connection.execute_wrappers)
+        self.assertNotIn(record_query, connection.execute_wrappers)
+        self.assertEqual(self.server_timing(response)['db']['desc'], f'"{len(counted)} queries"')
+
+    def test_metrics_are_only_served_to_allowed_addresses(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8']):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+
+    def test_async_requests_are_timed(self):
+        response = async_to_sync(self.async_client.get)('/api/machines/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(self.server_timing(response)['db']['desc'], '"0 queries"')
+
+    def test_slow_sampled_requests_are_profiled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PROFILE_SLOW_REQUEST_MS=1, PROFILE_SAMPLE_RATE=1, PROFILE_DIR=directory):
+                self.client.get('/api/machines/', **self.auth)
+                async_to_sync(self.async_client.get)('/api/machines/', **self.auth)
+            dumps = sorted(os.listdir(directory))
+            self.assertEqual(len(dumps), 2)
+            for dump in dumps:
+                self.assertRegex(dump, r'-machine-list-GET-\d+ms\.prof$')
+                functions = {name for _, _, name in pstats.Stats(os.path.join(directory, dump)).stats}
+                self.assertIn('list', functions)
+
+
+class ORJSONTests(SimpleTestCase):
+    payload = {
+        'unit_cost': Decimal('12.50'),
+        'utc': datetime(2025, 1, 15, 14, 30, 5, 123456, tzinfo=dt_timezone.utc),
+        'local': timezone.localtime(datetime(2025, 1, 15, 14, 30, tzinfo=dt_timezone.utc)),
+        'naive': datetime(2025, 1, 15, 14, 30),
+        'day': date(2025, 1, 15),
+        'at': time(6, 15),
+        'labor': timedelta(hours=1, minutes=30),
+        'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'specifications': {'spindle': {'rpm': 12000, 'axes': ['x', 'y', 'z']}, 'coolant': None},
+        'custom_readings': {'humidity': 41.5, 'note': 'Ölstand\u2028geprüft'},
+        'label': gettext_lazy('Pending'),
+        'counts': {1: 3, 2: 0},
+    }
+
+    def test_renders_what_json_renderer_renders(self):
+        self.assertEqual(ORJSONRenderer().render(self.payload), JSONRenderer().render(self.payload))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_indented_output_uses_json_renderer(self):
+        rendered = ORJSONRenderer().render(self.payload, 'application/json; indent=4')
+        self.assertEqual(rendered, JSONRenderer().render(self.payload, 'application/json; indent=4'))
+
+    def test_parses_json(self):
+        parser = ORJSONParser()
+        self.assertEqual(parser.parse(BytesIO('{"cost": 1.5, "name": "Wälzlager"}'.encode())),
+                         {'cost': 1.5, 'name': 'Wälzlager'})
+        for body in [b'{"cost": ', b'{"cost": NaN}']:
+            with self.assertRaises(ParseError):
+                parser.parse(BytesIO(body))
+
+    def test_falls_back_without_orjson(self):
+        with mock.patch('factory_maintenance.renderers.orjson', None), \
+                mock.patch('factory_maintenance.parsers.orjson', None):
+            self.assertEqual(ORJSONRenderer().render(self.payload), JSONRenderer().render(self.payload))
+            self.assertEqual(ORJSONParser().parse(BytesIO(b'{"a": [1, 2]}')), {'a': [1, 2]})
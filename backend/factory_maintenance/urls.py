@@ -22,6 +22,8 @@ from rest_framework.routers import DefaultRouter
 from machines.views import MachineViewSet, MachineReadingViewSet
 from maintenance.views import WorkOrderViewSet, SparePartViewSet
 from factory_maintenance.api_root import api_root
+from factory_maintenance.profiling import metrics_view
+from analytics.stream import event_stream
 
 router = DefaultRouter()
 router.register(r'machines', MachineViewSet, basename='machine')
@@ -31,9 +33,11 @@ router.register(r'parts', SparePartViewSet, basename='sparepart')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', api_root, name='api-root'),
     path('api/auth/', include('authentication.urls')),
     path('api/analytics/', include('analytics.urls')),
+    path('api/stream/', event_stream, name='event-stream'),
     path('api/', include(router.urls)),
 ]
 
@@ -1,13 +1,16 @@
 from django.contrib import admin
+from django.db import transaction
 from .models import Machine, MachineReading
+from .health import refresh_last_anomalies
+from .rollups import refresh_rollups
 
 @admin.register(Machine)
 class MachineAdmin(admin.ModelAdmin):
     list_display = ['machine_id', 'machine_name', 'machine_type', 'location', 'status', 
-                    'next_maintenance_date', 'get_health_status']
-    list_filter = ['status', 'machine_type', 'location']
+                    'next_maintenance_date', 'health_status']
+    list_filter = ['status', 'health_status', 'machine_type', 'location']
     search_fields = ['machine_id', 'machine_name', 'manufacturer']
-    readonly_fields = ['created_at', 'updated_at', 'created_by']
+    readonly_fields = ['created_at', 'updated_at', 'created_by', 'health_status', 'last_anomaly_at']
     
     fieldsets = (
         ('Basic Information', {
@@ -17,7 +20,8 @@ class MachineAdmin(admin.ModelAdmin):
             'fields': ('location', 'status', 'installation_date', 'warranty_expiry')
         }),
         ('Maintenance', {
-            'fields': ('maintenance_frequency_days', 'last_maintenance_date', 'next_maintenance_date')
+            'fields': ('maintenance_frequency_days', 'last_maintenance_date', 'next_maintenance_date',
+                       'health_status', 'last_anomaly_at')
         }),
         ('Additional', {
             'fields': ('specifications', 'manual_document', 'machine_photo', 'qr_code')
@@ -36,5 +40,29 @@ class MachineReadingAdmin(admin.ModelAdmin):
     search_fields = ['machine__machine_id', 'notes']
     readonly_fields = ['timestamp', 'logged_by']
     date_hierarchy = 'timestamp'
+    
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        previous = MachineReading.objects.values_list('machine_id', 'timestamp', 'is_anomaly').get(pk=obj.pk)
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            refresh_rollups({previous[:2], (obj.machine_id, obj.timestamp)})
+            if previous[2] or obj.is_anomaly:
+                refresh_last_anomalies({previous[0], obj.machine_id})
+    
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            refresh_rollups([(obj.machine_id, obj.timestamp)])
+            if obj.is_anomaly:
+                refresh_last_anomalies([obj.machine_id])
+    
+    def delete_queryset(self, request, queryset):
+        readings = list(queryset.values_list('machine_id', 'timestamp', 'is_anomaly'))
+        with transaction.atomic():
+            super().delete_queryset(request, queryset)
+            refresh_rollups([(machine_pk, timestamp) for machine_pk, timestamp, _ in readings])
+            refresh_last_anomalies({machine_pk for machine_pk, _, is_anomaly in readings if is_anomaly})
 
 
@@ -0,0 +1,147 @@
+"""Fleet-wide health scoring.
+
+Readings of every machine are streamed from one server-side query ordered by
+machine, split into per-machine NumPy arrays and fitted and scored in a
+process pool. Models and scores are written back in batches as results
+arrive, so memory stays bounded by the number of machines in flight.
+"""
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+from .forest import FEATURES, MIN_TRAINING_ROWS, TRAINING_DAYS, sklearn_version
+from .isolation import fit_and_score
+from .models import MachineHealthScore
+
+FETCH_SIZE = 20000
+PERSIST_BATCH_SIZE = 200
+IN_FLIGHT_PER_WORKER = 4
+
+def iter_machine_features(start, end, machine_pks=None):
+    """Yield ``(machine_pk, first_timestamp, last_timestamp, X)`` for each machine with readings in range."""
+    machine_filter = 'AND machine_id = ANY(%s)' if machine_pks is not None else ''
+    params = [start, end] + ([list(machine_pks)] if machine_pks is not None else [])
+    
+    pending_pk, pending_rows = None, []
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(f"""
+            SELECT machine_id, timestamp, {', '.join(FEATURES)} FROM machine_readings
+            WHERE timestamp >= %s AND timestamp <= %s {machine_filter}
+            ORDER BY machine_id, timestamp
+        """, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            machine_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            bounds = [0, *(np.flatnonzero(np.diff(machine_ids)) + 1), len(rows)]
+            for lower, upper in zip(bounds, bounds[1:]):
+                group = rows[lower:upper]
+                if group[0][0] == pending_pk:
+                    pending_rows.extend(group)
+                    continue
+                if pending_rows:
+                    yield _features(pending_pk, pending_rows)
+                pending_pk, pending_rows = group[0][0], list(group)
+    if pending_rows:
+        yield _features(pending_pk, pending_rows)
+
+def _features(machine_pk, rows):
+    X = np.array([row[2:] for row in rows], dtype=float)
+    # Missing values count as 0, as in the per-machine endpoint.
+    return machine_pk, rows[0][1], rows[-1][1], np.nan_to_num(X, nan=0.0)
+
+MODEL_COLUMNS = ('machine_id', 'version', 'model_data', 'sklearn_version', 'window_start', 'window_end',
+                 'training_rows', 'score_min', 'score_max', 'trend', 'anomalies_detected', 'trained_at')
+
+def _upsert_models(rows):
+    """Insert or replace health models from ``MODEL_COLUMNS`` tuples; returns ``{machine_pk: version}``.
+    
+    The version is incremented by the upsert itself, like ``fit_health_model``
+    does, so a refit landing during a fleet run never shares a version with it.
+    """
+    values = ', '.join([f"({', '.join(['%s'] * len(MODEL_COLUMNS))})"] * len(rows))
+    updates = ', '.join(f'{column} = EXCLUDED.{column}' for column in MODEL_COLUMNS[2:])
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO machine_health_models ({', '.join(MODEL_COLUMNS)}) VALUES {values}
+            ON CONFLICT (machine_id) DO UPDATE SET version = machine_health_models.version + 1, {updates}
+            RETURNING machine_id, version
+        """, [value for row in rows for value in row])
+        return dict(cursor.fetchall())
+
+def _persist(results, windows, now):
+    """Upsert the models and scores of a batch of worker results."""
+    health_models = []
+    for machine_pk, model_data, score_min, score_max, summary in results:
+        window_start, window_end, training_rows = windows.pop(machine_pk)
+        health_models.append((
+            machine_pk, 1, model_data, sklearn_version(), window_start, window_end, training_rows,
+            score_min, score_max, summary['trend'], summary['anomalies_detected'], now,
+        ))
+    
+    with transaction.atomic():
+        versions = _upsert_models(health_models)
+        scores = [
+            MachineHealthScore(
+                machine_id=machine_pk, health_score=summary['health_score'], status=summary['status'],
+                trend=summary['trend'], readings_analyzed=summary['readings_analyzed'],
+                anomalies_detected=summary['anomalies_detected'], model_version=versions[machine_pk],
+                scored_at=now,
+            )
+            for machine_pk, _, _, _, summary in results
+        ]
+        MachineHealthScore.objects.bulk_create(
+            scores, update_conflicts=True, unique_fields=['machine'],
+            update_fields=['health_score', 'status', 'trend', 'readings_analyzed', 'anomalies_detected',
+                           'model_version', 'scored_at'],
+        )
+
+def score_fleet(machine_pks=None, workers=None, now=None):
+    """Refit every machine's health model and store its latest health score.
+    
+    Machines are fitted in a pool of ``workers`` processes (default: one per
+    core); ``workers=1`` runs in-process. Machines with fewer than
+    ``MIN_TRAINING_ROWS`` recent readings are skipped. Returns the number of
+    machines scored.
+    """
+    now = now or timezone.now()
+    workers = workers or os.cpu_count() or 1
+    windows = {}
+    batch = []
+    scored = 0
+    
+    def collect(result):
+        nonlocal batch, scored
+        batch.append(result)
+        scored += 1
+        if len(batch) >= PERSIST_BATCH_SIZE:
+            _persist(batch, windows, now)
+            batch = []
+    
+    groups = (
+        group for group in iter_machine_features(now - timedelta(days=TRAINING_DAYS), now, machine_pks)
+        if len(group[3]) >= MIN_TRAINING_ROWS
+    )
+    if workers == 1:
+        for machine_pk, window_start, window_end, X in groups:
+            windows[machine_pk] = (window_start, window_end, len(X))
+            collect(fit_and_score(machine_pk, X))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = set()
+            for machine_pk, window_start, window_end, X in groups:
+                windows[machine_pk] = (window_start, window_end, len(X))
+                in_flight.add(pool.submit(fit_and_score, machine_pk, X))
+                if len(in_flight) >= workers * IN_FLIGHT_PER_WORKER:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future.result())
+            for future in wait(in_flight).done:
+                collect(future.result())
+    
+    if batch:
+        _persist(batch, windows, now)
+    return scored
@@ -0,0 +1,125 @@
+"""Persisted IsolationForest models behind the machine health score.
+
+Models are fitted in the background on the last ``TRAINING_DAYS`` of
+readings and stored in ``MachineHealthModel``; requests only load a model and
+score readings with it. A model is refit once ``HEALTH_MODEL_REFIT_READINGS``
+readings have arrived after its training window or it is older than
+``HEALTH_MODEL_MAX_AGE_HOURS``.
+"""
+import pickle
+from datetime import timedelta
+from functools import lru_cache
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from .isolation import fit_forest, summarize
+from .models import MachineHealthModel, MachineReading
+
+TRAINING_DAYS = 30
+MIN_TRAINING_ROWS = 10
+FEATURES = ['temperature', 'vibration_level', 'oil_pressure']
+
+def sklearn_version():
+    import sklearn
+    return sklearn.__version__
+
+def load_features(machine_pk, start, end=None):
+    """Return ``(timestamps, X)`` for a machine's readings in ``[start, end]``, oldest first."""
+    readings = MachineReading.objects.filter(machine_id=machine_pk, timestamp__gte=start)
+    if end is not None:
+        readings = readings.filter(timestamp__lte=end)
+    rows = list(readings.order_by('timestamp').values_list('timestamp', *FEATURES))
+    timestamps = [row[0] for row in rows]
+    X = np.array([[value or 0 for value in row[1:]] for row in rows], dtype=float).reshape(-1, len(FEATURES))
+    return timestamps, X
+
+def latest_features(machine_pk, start):
+    """Return ``X`` holding the machine's newest reading since ``start``, or no rows."""
+    row = (MachineReading.objects.filter(machine_id=machine_pk, timestamp__gte=start)
+           .order_by('-timestamp').values_list(*FEATURES).first())
+    return np.array([[value or 0 for value in row]] if row else [], dtype=float).reshape(-1, len(FEATURES))
+
+def fit_health_model(machine_pk, now=None):
+    """Fit and store a model on the machine's recent readings.
+    
+    Returns the saved ``MachineHealthModel``, or ``None`` when there are fewer
+    than ``MIN_TRAINING_ROWS`` readings to train on.
+    """
+    now = now or timezone.now()
+    timestamps, X = load_features(machine_pk, now - timedelta(days=TRAINING_DAYS), now)
+    if len(X) < MIN_TRAINING_ROWS:
+        return None
+    
+    model, score_min, score_max = fit_forest(X)
+    summary = summarize(model, score_min, score_max, X)
+    
+    fields = {
+        'model_data': pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL),
+        'sklearn_version': sklearn_version(),
+        'window_start': timestamps[0],
+        'window_end': timestamps[-1],
+        'training_rows': len(X),
+        'score_min': score_min,
+        'score_max': score_max,
+        'trend': summary['trend'],
+        'anomalies_detected': summary['anomalies_detected'],
+        'trained_at': now,
+    }
+    # The row is locked and its version incremented in the database, so
+    # concurrent refits never store the same version twice.
+    health_model, created = MachineHealthModel.objects.update_or_create(
+        machine_id=machine_pk,
+        defaults={**fields, 'version': F('version') + 1},
+        create_defaults={**fields, 'version': 1},
+    )
+    if not created:
+        health_model.refresh_from_db(fields=['version'])
+    return health_model
+
+@lru_cache(maxsize=256)
+def _unpickle(machine_pk, version):
+    data = MachineHealthModel.objects.filter(machine_id=machine_pk, version=version).values_list('model_data', flat=True).first()
+    return pickle.loads(data) if data is not None else None
+
+def get_health_model(machine_pk):
+    """Return ``(metadata, estimator)`` for the machine, or ``(None, None)`` if it has no usable model.
+    
+    Models pickled by another scikit-learn version are treated as missing
+    until they are refit.
+    """
+    health_model = MachineHealthModel.objects.defer('model_data').filter(machine_id=machine_pk).first()
+    if health_model is None or health_model.sklearn_version != sklearn_version():
+        return None, None
+    estimator = _unpickle(machine_pk, health_model.version)
+    return (health_model, estimator) if estimator is not None else (None, None)
+
+def machines_due_for_refit(now=None):
+    """Machines with recent readings whose model is missing, stale or behind on readings."""
+    now = now or timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT m.id FROM machines m
+            LEFT JOIN machine_health_models h ON h.machine_id = m.id
+            WHERE EXISTS (SELECT 1 FROM machine_readings r WHERE r.machine_id = m.id AND r.timestamp >= %(since)s)
+              AND (
+                h.machine_id IS NULL
+                OR h.trained_at < %(stale)s
+                OR h.sklearn_version <> %(sklearn)s
+                OR (
+                    SELECT COUNT(*) FROM (
+                        SELECT 1 FROM machine_readings r
+                        WHERE r.machine_id = m.id AND r.timestamp > h.window_end
+                        LIMIT %(refit)s
+                    ) AS fresh
+                ) >= %(refit)s
+              )
+            ORDER BY m.id
+        """, {
+            'since': now - timedelta(days=TRAINING_DAYS),
+            'stale': now - timedelta(hours=settings.HEALTH_MODEL_MAX_AGE_HOURS),
+            'sklearn': sklearn_version(),
+            'refit': settings.HEALTH_MODEL_REFIT_READINGS,
+        })
+        return [row[0] for row in cursor.fetchall()]
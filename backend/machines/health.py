@@ -0,0 +1,76 @@
+"""Bulk maintenance of the denormalized ``Machine.health_status``.
+
+``Machine.save`` recomputes the status of a single machine; these helpers keep
+it current when anomalies are written in bulk, cleared or deleted, and when the
+date rolls over.
+"""
+from datetime import timedelta
+from django.db import connection
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from .models import Machine
+from .signals import health_changed
+
+HEALTH_SEVERITY = ['CRITICAL', 'RED', 'YELLOW', 'GREEN', 'UNKNOWN']
+
+def health_status_expression(now=None):
+    """SQL version of ``Machine.compute_health_status``."""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    return Case(
+        When(next_maintenance_date__isnull=True, then=Value('UNKNOWN')),
+        When(last_anomaly_at__gte=now - timedelta(days=Machine.ANOMALY_WINDOW_DAYS), then=Value('CRITICAL')),
+        When(next_maintenance_date__lt=today, then=Value('RED')),
+        When(next_maintenance_date__lte=today + timedelta(days=7), then=Value('YELLOW')),
+        default=Value('GREEN'),
+    )
+
+def health_rank_expression():
+    """Sort key that orders machines from the most to the least severe status."""
+    return Case(
+        *[When(health_status=status, then=Value(rank)) for rank, status in enumerate(HEALTH_SEVERITY)],
+        default=Value(len(HEALTH_SEVERITY)),
+    )
+
+def refresh_health_statuses(machine_pks=None, now=None):
+    """Recompute stored statuses in one statement; returns how many changed."""
+    expression = health_status_expression(now)
+    machines = Machine.objects.all()
+    if machine_pks is not None:
+        machines = machines.filter(pk__in=machine_pks)
+    changed = machines.exclude(health_status=expression).update(health_status=expression)
+    if changed:
+        health_changed.send(sender=Machine, machine_pks=machine_pks)
+    return changed
+
+def record_anomalies(anomaly_times):
+    """Move ``last_anomaly_at`` forward for ``{machine_pk: timestamp}`` and refresh their statuses."""
+    if not anomaly_times:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE machines AS m SET last_anomaly_at = GREATEST(m.last_anomaly_at, u.timestamp)
+            FROM unnest(%s::bigint[], %s::timestamptz[]) AS u(id, timestamp)
+            WHERE m.id = u.id
+        """, [list(anomaly_times), list(anomaly_times.values())])
+    refresh_health_statuses(list(anomaly_times))
+
+def refresh_last_anomalies(machine_pks):
+    """Reset ``last_anomaly_at`` to the latest flagged reading of each machine and refresh their statuses.
+    
+    ``record_anomalies`` only moves it forward; this is for readings whose
+    anomaly flag was cleared, or which were deleted or moved to another machine.
+    """
+    machine_pks = list(machine_pks)
+    if not machine_pks:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE machines AS m SET last_anomaly_at = (
+                SELECT r.timestamp FROM machine_readings AS r
+                WHERE r.machine_id = m.id AND r.is_anomaly
+                ORDER BY r.timestamp DESC LIMIT 1
+            )
+            WHERE m.id = ANY(%s)
+        """, [machine_pks])
+    refresh_health_statuses(machine_pks)
@@ -0,0 +1,133 @@
+import codecs
+import csv
+import itertools
+import json
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from .models import Machine, MachineReading, ReadingUpload
+from .serializers import BulkMachineReadingSerializer
+from .tasks import enqueue_scoring
+
+BULK_CREATE_BATCH_SIZE = 1000
+STREAM_CHUNK_SIZE = 1000
+
+class UploadConflict(Exception):
+    pass
+
+def ingest_readings(rows, user):
+    """Validate and insert a batch of readings in a fixed number of queries.
+
+    Each row identifies its machine by code (``machine_id``). Machines are
+    resolved with one query, rows are validated in memory and the valid rows
+    are written with ``bulk_create`` in a single transaction. Anomaly scoring
+    is queued for the whole batch once it commits.
+
+    Returns ``(created, errors)``: the saved ``MachineReading`` objects and one
+    error entry per rejected row, tagged with the row's ``index``.
+    """
+    codes = {row.get('machine_id') for row in rows if isinstance(row, dict)}
+    machines = Machine.objects.in_bulk([code for code in codes if isinstance(code, str)], field_name='machine_id')
+    
+    validator = BulkMachineReadingSerializer()
+    readings = []
+    errors = []
+    
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({'index': index, 'machine_id': None, 'error': 'Invalid reading'})
+            continue
+        
+        machine_id = row.get('machine_id')
+        machine = machines.get(machine_id) if isinstance(machine_id, str) else None
+        if machine is None:
+            errors.append({'index': index, 'machine_id': machine_id, 'error': 'Machine not found'})
+            continue
+        
+        try:
+            validated_data = validator.run_validation(row)
+        except ValidationError as exc:
+            errors.append({'index': index, 'machine_id': machine_id, 'errors': exc.detail})
+            continue
+        
+        readings.append(MachineReading(machine=machine, logged_by=user, **validated_data))
+    
+    if readings:
+        with transaction.atomic():
+            MachineReading.objects.bulk_create(readings, batch_size=BULK_CREATE_BATCH_SIZE)
+            enqueue_scoring(readings)
+    
+    return readings, errors
+
+def iter_ndjson_rows(stream):
+    """Yield one reading per non-blank line of a newline-delimited JSON stream.
+    
+    Lines that are not valid JSON are yielded as ``None`` so they are reported
+    as rejected rows without shifting the offsets of the rows after them.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+def iter_csv_rows(stream):
+    """Yield one reading per record of a CSV stream with a header row.
+    
+    Empty cells are left out so optional metrics are read as missing.
+    """
+    for record in csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig')):
+        yield {
+            key.strip(): value
+            for key, value in record.items()
+            if key and isinstance(value, str) and value.strip()
+        }
+
+def ingest_stream(upload, rows, offset, user, chunk_size=None):
+    """Ingest ``rows`` into ``upload`` in fixed-size chunks, yielding an acknowledgement per chunk.
+    
+    ``rows`` starts at row ``offset`` of the upload. Rows the upload has
+    already acknowledged are skipped, so a client can resume by resending
+    from any offset up to ``acknowledged_offset``. Each chunk is read before
+    its transaction opens, then inserted and acknowledged atomically.
+    
+    Raises ``UploadConflict`` if ``offset`` is past the acknowledged offset or
+    another request advances the upload concurrently, and ``ValueError`` if
+    it is negative.
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    if offset < 0:
+        # It would skip that many unacknowledged rows on top of the acknowledged ones.
+        raise ValueError(f'offset must not be negative, got {offset}')
+    if offset > upload.acknowledged_offset:
+        raise UploadConflict(f'offset {offset} is past the acknowledged offset {upload.acknowledged_offset}')
+    
+    rows = itertools.islice(rows, upload.acknowledged_offset - offset, None)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        
+        position = upload.acknowledged_offset
+        with transaction.atomic():
+            locked = ReadingUpload.objects.select_for_update().get(pk=upload.pk)
+            if locked.acknowledged_offset != position:
+                raise UploadConflict('upload was advanced by another request')
+            
+            readings, errors = ingest_readings(chunk, user)
+            for error in errors:
+                error['index'] += position
+            
+            upload.acknowledged_offset = position + len(chunk)
+            upload.created_count = locked.created_count + len(readings)
+            upload.failed_count = locked.failed_count + len(errors)
+            upload.save(update_fields=['acknowledged_offset', 'created_count', 'failed_count', 'updated_at'])
+        
+        yield {
+            'offset': upload.acknowledged_offset,
+            'created': len(readings),
+            'failed': len(errors),
+            'errors': errors,
+        }
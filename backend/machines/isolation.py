@@ -0,0 +1,61 @@
+"""IsolationForest fitting and health scoring on plain NumPy arrays.
+
+Nothing here touches Django, so these functions can run in worker processes.
+"""
+import pickle
+import numpy as np
+
+def fit_forest(X):
+    """Fit a forest on ``X``; returns ``(estimator, score_min, score_max)`` over the training rows."""
+    from sklearn.ensemble import IsolationForest
+    
+    model = IsolationForest(contamination=0.1, random_state=42)
+    model.fit(X)
+    scores = model.decision_function(X)
+    return model, float(scores.min()), float(scores.max())
+
+def classify(health_score):
+    """Return ``(status, message, predicted_days)``; ``predicted_days`` is None when healthy."""
+    if health_score < 60:
+        return 'CRITICAL', 'Immediate maintenance recommended', 3
+    elif health_score < 80:
+        return 'WARNING', 'Schedule maintenance soon', 7
+    return 'HEALTHY', 'Machine operating normally', None
+
+def scale_score(score, score_min, score_max):
+    """Scale a decision score to 0-100 by the training score range."""
+    if score_max == score_min:
+        return 100
+    return min(max(int(((score - score_min) / (score_max - score_min)) * 100), 0), 100)
+
+def verdict(health_score):
+    status, message, predicted_days = classify(health_score)
+    return {'health_score': health_score, 'status': status, 'message': message, 'predicted_days': predicted_days}
+
+def score_latest(estimator, score_min, score_max, X):
+    """Health score, status, message and predicted days of the last row of ``X``."""
+    return verdict(scale_score(estimator.decision_function(X[-1:])[0], score_min, score_max))
+
+def summarize(estimator, score_min, score_max, X):
+    """Score ``X`` (oldest first) and derive the health score of its latest row.
+    
+    Also returns the trend and outlier count over all of ``X``.
+    """
+    scores = estimator.decision_function(X)
+    mid = len(scores) // 2
+    return {
+        **verdict(scale_score(scores[-1], score_min, score_max)),
+        'trend': 'IMPROVING' if mid and np.mean(scores[mid:]) > np.mean(scores[:mid]) else 'DECLINING',
+        'readings_analyzed': len(X),
+        # IsolationForest.predict marks rows with a negative decision score as outliers.
+        'anomalies_detected': int((scores < 0).sum()),
+    }
+
+def fit_and_score(machine_pk, X):
+    """Worker entry point: fit a forest on ``X`` and score its latest row.
+    
+    Returns ``(machine_pk, pickled_model, score_min, score_max, summary)``.
+    """
+    model, score_min, score_max = fit_forest(X)
+    summary = summarize(model, score_min, score_max, X)
+    return machine_pk, pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL), score_min, score_max, summary
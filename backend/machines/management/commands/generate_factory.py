@@ -0,0 +1,424 @@
+import random
+import struct
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+import numpy as np
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from authentication.models import CustomUser
+from machines import partitions
+from machines.health import record_anomalies, refresh_health_statuses
+from machines.models import Machine, MachineReadingStats
+from machines.rollups import rebuild_rollups
+from machines.utils import flag_anomalies
+from maintenance.models import SparePart, WorkOrder
+
+METRICS = MachineReadingStats.METRICS
+# Readings are copied in binary format from numpy rows of these fixed-width
+# fields; empty ones (None) are just a zero length.
+READING_FIELDS = [
+    ('machine_id', '>i8'), ('timestamp', '>i8'), ('temperature', '>f8'), ('vibration_level', '>f8'),
+    ('oil_pressure', '>f8'), ('runtime_hours', '>i4'), ('custom_readings', 'S3'), ('notes', None),
+    ('is_anomaly', '?'), ('anomaly_reason', None), ('scored_at', '>i8'),
+]
+COPY_SQL = f"COPY machine_readings ({', '.join(name for name, _ in READING_FIELDS)}) FROM STDIN (FORMAT BINARY)"
+EMPTY_JSONB = b'\x01{}'
+PG_EPOCH = datetime(2000, 1, 1, tzinfo=ZoneInfo('UTC'))
+BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + bytes(8)
+BINARY_TRAILER = struct.pack('>h', -1)
+WORK_ORDER_COLUMNS = ('work_order_id', 'machine_id', 'title', 'description', 'status', 'priority',
+                      'assigned_to_id', 'created_by_id', 'scheduled_date', 'started_at', 'completed_at',
+                      'labor_hours', 'labor_cost', 'parts_cost', 'completion_notes', 'digital_signature',
+                      'created_at', 'updated_at')
+USAGE_COLUMNS = ('work_order_id', 'spare_part_id', 'quantity_used', 'notes', 'recorded_at')
+# Readings are generated and copied this many at a time, whole machines per batch.
+BATCH_ROWS = 500000
+
+# (type, code prefix, (temperature, vibration, oil pressure) baseline, maintenance days)
+MACHINE_TYPES = [
+    ('CNC', 'CNC', (68.0, 2.2, 45.0), 30),
+    ('Injection Molding', 'INJ', (82.0, 1.6, 120.0), 45),
+    ('Hydraulic Press', 'PRS', (58.0, 3.1, 180.0), 60),
+    ('Conveyor', 'CNV', (42.0, 1.2, 12.0), 90),
+    ('Air Compressor', 'CMP', (75.0, 2.8, 95.0), 30),
+    ('Industrial Pump', 'PMP', (55.0, 1.9, 60.0), 45),
+]
+MANUFACTURERS = ['Haas Automation', 'DMG Mori', 'Engel', 'Schuler', 'Bosch Rexroth', 'Atlas Copco', 'Grundfos']
+LOCATIONS = ['Shop Floor A', 'Shop Floor B', 'Assembly Line 1', 'Assembly Line 2', 'Paint Shop', 'Warehouse']
+PARTS = [
+    ('Ball Bearing', 'SKF', 40, 400),
+    ('Hydraulic Seal Kit', 'Parker', 25, 300),
+    ('Drive Belt', 'Gates', 15, 150),
+    ('Oil Filter', 'Mann+Hummel', 5, 60),
+    ('Coolant Pump', 'Grundfos', 200, 1500),
+    ('Spindle Motor', 'Siemens', 800, 6000),
+    ('Pressure Valve', 'Bosch Rexroth', 60, 700),
+    ('Proximity Sensor', 'Omron', 20, 250),
+]
+# Injected faults: how each one bends the (temperature, vibration, oil pressure) signals at full severity.
+FAULTS = [
+    ('Bearing wear', (6.0, 2.5, 0.0)),
+    ('Coolant loss', (18.0, 0.2, 0.0)),
+    ('Hydraulic leak', (4.0, 0.3, -0.35)),
+    ('Misalignment', (3.0, 1.8, 0.0)),
+]
+BASELINES = {machine_type: baseline for machine_type, _, baseline, _ in MACHINE_TYPES}
+PREVENTIVE_TITLES = ['Scheduled service', 'Lubrication and inspection', 'Filter replacement', 'Calibration check']
+
+
+def row_dtype(fields):
+    """The numpy layout of one binary COPY tuple of ``(column, dtype)`` fields."""
+    layout = [('field_count', '>i2')]
+    for name, dtype in fields:
+        layout.append((f'{name}_length', '>i4'))
+        if dtype:
+            layout.append((name, dtype))
+    return np.dtype(layout)
+
+
+def fill_lengths(rows, fields):
+    rows['field_count'] = len(fields)
+    for name, dtype in fields:
+        rows[f'{name}_length'] = np.dtype(dtype).itemsize if dtype else 0
+
+
+READING_ROW = row_dtype(READING_FIELDS)
+
+
+class Command(BaseCommand):
+    help = ('Generate a deterministic synthetic factory: machines with drifting sensor readings and injected '
+            'faults, spare parts, and work orders with their parts usage, written with COPY')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--machines', type=int, default=100)
+        parser.add_argument('--readings-per-machine', type=int, default=2000)
+        parser.add_argument('--interval-minutes', type=int, default=15, help='Minutes between readings of a machine')
+        parser.add_argument('--work-orders', type=int, default=None, help='Total work orders (default: 10 per machine)')
+        parser.add_argument('--parts', type=int, default=200)
+        parser.add_argument('--technicians', type=int, default=10)
+        parser.add_argument('--fault-rate', type=float, default=0.1,
+                            help='Share of machines given an injected fault')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--end', type=datetime.fromisoformat, default=None,
+                            help='Time of the last reading (default: start of today); fix it to reproduce a dataset')
+        parser.add_argument('--prefix', default='GEN', help='Prefix for generated machine, part and work order codes')
+        parser.add_argument('--drop-indexes', action='store_true',
+                            help='Drop secondary indexes and foreign keys of machine_readings during the load '
+                                 'and rebuild them afterwards. Queries on machine_readings are slow until the '
+                                 'rebuild finishes.')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Do not rebuild baselines, rollups and health statuses afterwards')
+    
+    def handle(self, *args, **options):
+        self.prefix = options['prefix']
+        if Machine.objects.filter(machine_id__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f'Machines prefixed {self.prefix}- already exist; pass another --prefix')
+        
+        self.rng = random.Random(options['seed'])
+        self.np_rng = np.random.default_rng(options['seed'])
+        self.tz = ZoneInfo(settings.TIME_ZONE)
+        end = options['end'] or timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.end = end if end.tzinfo else end.replace(tzinfo=self.tz)
+        self.interval = timedelta(minutes=options['interval_minutes'])
+        self.start = self.end - self.interval * (options['readings_per_machine'] - 1)
+        self.today = self.end.astimezone(self.tz).date()
+        started = time.monotonic()
+        
+        self.technicians = self._step('Created technicians', self._create_technicians, options['technicians'])
+        machines = self._step('Created machines', self._create_machines, options['machines'])
+        parts = self._step('Created spare parts', self._create_parts, options['parts'], machines)
+        partitions.create_partitions(self.start, self.end)
+        
+        index_definitions = partitions.drop_indexes() if options['drop_indexes'] else []
+        try:
+            count, latest_anomalies = self._step('Copied readings', self._copy_readings, machines,
+                                                 options['readings_per_machine'], options['fault_rate'])
+        finally:
+            if index_definitions:
+                self._step('Rebuilt indexes', partitions.restore_indexes, index_definitions)
+        work_orders = options['work_orders']
+        if work_orders is None:
+            work_orders = 10 * len(machines)
+        orders, usages = self._step('Copied work orders', self._copy_work_orders, machines, parts, work_orders)
+        
+        with connection.cursor() as cursor:
+            for table in ('machine_readings', 'work_orders', 'spare_part_usage'):
+                cursor.execute(f'ANALYZE {table}')
+        
+        if not options['skip_derived'] and count:
+            codes = [machine.machine_id for machine in machines]
+            self._step('Rebuilt baselines', call_command, 'rebuild_reading_stats', *codes, stdout=self.stdout)
+            self._step('Rebuilt rollups', rebuild_rollups, self.start, self.end + timedelta(microseconds=1),
+                       machine_pks=[machine.pk for machine in machines])
+            record_anomalies(latest_anomalies)
+            refresh_health_statuses([machine.pk for machine in machines])
+        
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(machines)} machines, {count} readings, {len(parts)} parts, {orders} work orders '
+            f'and {usages} part usages in {elapsed:.1f}s'
+        ))
+    
+    def _step(self, label, func, *args, **kwargs):
+        started = time.monotonic()
+        result = func(*args, **kwargs)
+        self.stdout.write(f'{label} in {time.monotonic() - started:.1f}s')
+        return result
+    
+    def _copy(self, table, columns, rows):
+        """COPY ``rows`` into ``table`` and return how many were written."""
+        copied = 0
+        with connection.cursor() as cursor:
+            with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+                    copied += 1
+        return copied
+    
+    def _create_technicians(self, count):
+        prefix = self.prefix.lower()
+        users = [
+            CustomUser(username=f'{prefix}-tech-{index:02d}', first_name='Technician', last_name=str(index),
+                       email=f'{prefix}-tech-{index:02d}@example.com', role='TECHNICIAN')
+            for index in range(count)
+        ]
+        for user in users:
+            user.set_unusable_password()
+        existing = set(CustomUser.objects.filter(username__in=[user.username for user in users])
+                       .values_list('username', flat=True))
+        CustomUser.objects.bulk_create([user for user in users if user.username not in existing])
+        return list(CustomUser.objects.filter(username__in=[user.username for user in users]).order_by('username'))
+    
+    def _create_machines(self, count):
+        rng = self.rng
+        machines = []
+        for index in range(count):
+            machine_type, code, _, frequency = MACHINE_TYPES[index % len(MACHINE_TYPES)]
+            last_maintenance = self.today - timedelta(days=rng.randint(0, frequency))
+            machines.append(Machine(
+                machine_id=f'{self.prefix}-{code}-{index:05d}',
+                machine_name=f'{machine_type} {index}',
+                machine_type=machine_type,
+                manufacturer=rng.choice(MANUFACTURERS),
+                model_number=f'{code}{rng.randint(100, 999)}',
+                location=LOCATIONS[rng.randrange(len(LOCATIONS))],
+                installation_date=self.today - timedelta(days=rng.randint(365, 365 * 12)),
+                maintenance_frequency_days=frequency,
+                last_maintenance_date=last_maintenance,
+                next_maintenance_date=last_maintenance + timedelta(days=frequency),
+            ))
+        return Machine.objects.bulk_create(machines, batch_size=5000)
+    
+    def _create_parts(self, count, machines):
+        rng = self.rng
+        parts = []
+        for index in range(count):
+            name, supplier, low, high = PARTS[index % len(PARTS)]
+            minimum = rng.randint(2, 20)
+            parts.append(SparePart(
+                part_id=f'{self.prefix}-PRT-{index:05d}',
+                part_name=name if index < len(PARTS) else f'{name} {index // len(PARTS)}',
+                supplier_name=supplier,
+                minimum_stock_level=minimum,
+                # About one part in eight is at or below its minimum.
+                quantity_in_stock=rng.randint(0, minimum) if rng.random() < 0.125 else rng.randint(minimum + 1, 200),
+                unit_cost=Decimal(rng.randint(low * 100, high * 100)) / 100,
+            ))
+        parts = SparePart.objects.bulk_create(parts, batch_size=5000)
+        
+        # Each part fits a handful of machines of one type.
+        by_type = {}
+        for machine in machines:
+            by_type.setdefault(machine.machine_type, []).append(machine.pk)
+        self.compatible = {}
+        rows = []
+        for index, part in enumerate(parts):
+            candidates = by_type.get(MACHINE_TYPES[index % len(MACHINE_TYPES)][0]) if by_type else None
+            if not candidates:
+                continue
+            for machine_pk in rng.sample(candidates, min(len(candidates), rng.randint(3, 12))):
+                rows.append((part.pk, machine_pk))
+                self.compatible.setdefault(machine_pk, []).append(part)
+        self._copy(SparePart.compatible_machines.through._meta.db_table, ('sparepart_id', 'machine_id'), rows)
+        return parts
+    
+    def _signals(self, machine, count, fault_rate):
+        """Sensor arrays for one machine, its injected fault if any, and the mask of faulty readings.
+        
+        Each metric is the machine type's baseline, offset per machine, plus a
+        slow random-walk drift, a daily cycle and noise. An injected fault
+        ramps its signature in over its duration and ends with a repair.
+        """
+        rng = self.np_rng
+        baseline = np.array(BASELINES[machine.machine_type]) * rng.normal(1.0, 0.04, 3)
+        noise = baseline * np.array([0.015, 0.06, 0.012])
+        days = np.arange(count) * (self.interval.total_seconds() / 86400)
+        daily = np.sin(2 * np.pi * (days + rng.random()))
+        
+        signals = []
+        for metric in range(3):
+            drift = np.cumsum(rng.normal(0, noise[metric] * 0.02, count))
+            signals.append(baseline[metric] + drift + daily * noise[metric] * 0.5 + rng.normal(0, noise[metric], count))
+        
+        fault = None
+        faulty = np.zeros(count, dtype=bool)
+        if count > 20 and rng.random() < fault_rate:
+            name, signature = FAULTS[int(rng.integers(len(FAULTS)))]
+            onset = int(rng.integers(count // 3, count))
+            length = max(int(count * rng.uniform(0.01, 0.05)), 4)
+            stop = min(onset + length, count)
+            ramp = np.linspace(0, 1, length)[:stop - onset] ** 2
+            for metric, shift in enumerate(signature):
+                # Temperature shifts in degrees; vibration and pressure scale with their baseline.
+                signals[metric][onset:stop] += ramp * shift * (1.0 if metric == 0 else baseline[metric])
+            faulty[onset:stop] = True
+            fault = (name, onset, stop, stop == count)
+        
+        values = {
+            'temperature': np.round(signals[0], 2),
+            'vibration_level': np.round(np.maximum(signals[1], 0.01), 3),
+            'oil_pressure': np.round(np.maximum(signals[2], 0.1), 2),
+        }
+        return values, fault, faulty
+    
+    def _copy_readings(self, machines, per_machine, fault_rate):
+        """Generate readings and COPY them in binary format, a batch of machines at a time.
+        
+        Rows are laid out with numpy rather than encoded one by one, which is
+        what keeps the load fast; only anomalies, whose reason varies in
+        length, are packed individually. Readings are scored with the
+        vectorized 2-sigma rule first, so ``is_anomaly`` is what live scoring
+        would have flagged. Returns the row count and ``{machine_pk: latest
+        anomaly time}``.
+        """
+        self.faults = {}
+        latest_anomalies = {}
+        interval = int(self.interval.total_seconds() * 1_000_000)
+        first = int((self.start - PG_EPOCH).total_seconds() * 1_000_000)
+        micros = first + np.arange(per_machine, dtype=np.int64) * interval
+        epochs = self.start.timestamp() + np.arange(per_machine) * self.interval.total_seconds()
+        hours = (np.arange(per_machine) * self.interval.total_seconds() / 3600).astype(np.int32)
+        reason_offset = READING_ROW.fields['anomaly_reason_length'][1]
+        per_batch = max(BATCH_ROWS // max(per_machine, 1), 1)
+        copied = 0
+        
+        for batch_start in range(0, len(machines), per_batch):
+            started = time.monotonic()
+            chunks = []
+            for machine in machines[batch_start:batch_start + per_batch]:
+                values, fault, faulty = self._signals(machine, per_machine, fault_rate)
+                if fault:
+                    self.faults[machine.pk] = fault
+                flags, reasons = flag_anomalies(epochs, values, ~faulty)
+                
+                rows = np.zeros(per_machine, dtype=READING_ROW)
+                fill_lengths(rows, READING_FIELDS)
+                rows['machine_id'] = machine.pk
+                rows['timestamp'] = rows['scored_at'] = micros
+                for metric in METRICS:
+                    rows[metric] = values[metric]
+                # Machines run about 16 hours a day since installation.
+                rows['runtime_hours'] = max((self.start.date() - machine.installation_date).days, 0) * 16 + hours
+                rows['custom_readings'] = EMPTY_JSONB
+                rows['is_anomaly'] = flags
+                chunks.append(rows[~flags].tobytes())
+                
+                flagged = np.flatnonzero(flags)
+                if len(flagged):
+                    latest_anomalies[machine.pk] = self.start + self.interval * int(flagged[-1])
+                for index, row in zip(flagged.tolist(), rows[flagged]):
+                    raw, reason = row.tobytes(), reasons[index].encode()
+                    chunks.append(raw[:reason_offset] + struct.pack('>i', len(reason)) + reason
+                                  + raw[reason_offset + 4:])
+            
+            with transaction.atomic(), connection.cursor() as cursor:
+                with cursor.copy(COPY_SQL) as copy:
+                    copy.write(b''.join([BINARY_HEADER, *chunks, BINARY_TRAILER]))
+            
+            count = min(per_batch, len(machines) - batch_start) * per_machine
+            copied += count
+            self.stdout.write(f'  {batch_start + count // per_machine}/{len(machines)} machines, '
+                              f'{count / max(time.monotonic() - started, 1e-9):,.0f} rows/s')
+        return copied, latest_anomalies
+    
+    def _copy_work_orders(self, machines, parts, total):
+        """COPY ``total`` work orders and the parts used on the completed ones.
+        
+        Each injected fault gets a corrective order, repaired when the fault
+        ends. The rest are preventive: one pending at each machine's next
+        maintenance date, then completed ones every maintenance interval back
+        from its last. Returns the number of work orders and part usages.
+        """
+        rng = self.rng
+        orders = []
+        # (work_order_id, spare part, quantity, recorded_at) for completed orders.
+        usages = []
+        by_pk = {machine.pk: machine for machine in machines}
+        
+        def add(machine, title, description, status, priority, scheduled, finished=None, part_count=0):
+            code = f'{self.prefix}-WO-{len(orders):07d}'
+            technician = rng.choice(self.technicians) if self.technicians else None
+            started_at = completed_at = None
+            labor_hours, parts_cost = 0.0, Decimal('0.00')
+            notes = ''
+            when = datetime.combine(scheduled, datetime.min.time(), tzinfo=self.tz) + timedelta(hours=8)
+            if status in ('IN_PROGRESS', 'COMPLETED'):
+                started_at = when
+            if status == 'COMPLETED':
+                labor_hours = round(rng.uniform(0.5, 8), 1)
+                completed_at = finished or when + timedelta(hours=labor_hours)
+                notes = 'Work completed as planned'
+                compatible = self.compatible.get(machine.pk, [])
+                for part in rng.sample(compatible, min(len(compatible), part_count)):
+                    quantity = rng.randint(1, 4)
+                    usages.append((code, part, quantity, completed_at))
+                    parts_cost += part.unit_cost * quantity
+            labor_cost = (Decimal(labor_hours) * 45).quantize(Decimal('0.01'))
+            orders.append((
+                code, machine.pk, title, description, status, priority,
+                technician.pk if technician else None, technician.pk if technician else None, scheduled,
+                started_at, completed_at, labor_hours, labor_cost, parts_cost, notes, '',
+                min(when - timedelta(days=7), self.end), min(completed_at or when, self.end),
+            ))
+        
+        for machine_pk, (name, onset, stop, ongoing) in self.faults.items():
+            if len(orders) >= total:
+                break
+            machine = by_pk[machine_pk]
+            detected = self.start + self.interval * onset
+            repaired = self.start + self.interval * (stop - 1)
+            add(machine, f'{name} on {machine.machine_id}', f'{name} detected from sensor readings',
+                'IN_PROGRESS' if ongoing else 'COMPLETED', 'CRITICAL' if ongoing else 'HIGH',
+                detected.astimezone(self.tz).date(), finished=None if ongoing else repaired,
+                part_count=rng.randint(1, 3))
+        
+        slot = 0
+        while len(orders) < total and machines:
+            machine = machines[slot % len(machines)]
+            cycle = slot // len(machines)
+            title = PREVENTIVE_TITLES[cycle % len(PREVENTIVE_TITLES)]
+            if cycle == 0:
+                add(machine, title, 'Upcoming preventive maintenance', 'PENDING', 'MEDIUM',
+                    machine.next_maintenance_date)
+            else:
+                frequency = timedelta(days=machine.maintenance_frequency_days)
+                scheduled = machine.last_maintenance_date - frequency * (cycle - 1)
+                status = 'CANCELLED' if rng.random() < 0.03 else 'COMPLETED'
+                add(machine, title, 'Preventive maintenance', status, rng.choice(['LOW', 'MEDIUM']), scheduled,
+                    part_count=rng.randint(0, 2))
+            slot += 1
+        
+        with transaction.atomic():
+            self._copy(WorkOrder._meta.db_table, WORK_ORDER_COLUMNS, orders)
+            order_pks = dict(WorkOrder.objects.filter(work_order_id__startswith=f'{self.prefix}-WO-')
+                             .values_list('work_order_id', 'pk'))
+            # Historical usage: stock levels were set when the parts were created.
+            self._copy('spare_part_usage', USAGE_COLUMNS, (
+                (order_pks[code], part.pk, quantity, '', recorded_at) for code, part, quantity, recorded_at in usages
+            ))
+        return len(orders), len(usages)
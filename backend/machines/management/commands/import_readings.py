@@ -0,0 +1,246 @@
+import csv
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import numpy as np
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from machines import partitions
+from machines.health import record_anomalies
+from machines.models import Machine, MachineReading, MachineReadingStats
+from machines.rollups import rebuild_rollups
+from machines.signals import anomalies_flagged
+from machines.utils import flag_anomalies
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+METRICS = MachineReadingStats.METRICS
+COPY_SQL = (
+    'COPY machine_readings (machine_id, timestamp, temperature, vibration_level, oil_pressure, runtime_hours, '
+    'custom_readings, notes, is_anomaly, anomaly_reason, scored_at) FROM STDIN'
+)
+PARQUET_BATCH_SIZE = 65536
+REPORTED_SKIPS = 10
+
+
+class Command(BaseCommand):
+    help = ('Bulk-load historical readings from CSV or Parquet files with COPY, then flag anomalies '
+            'and rebuild baselines and rollups for the affected machines')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='CSV or Parquet files (by extension)')
+        parser.add_argument('--machine-column', default='machine_id', help='Column holding the machine code')
+        parser.add_argument('--timestamp-column', default='timestamp',
+                            help='Column holding the reading time; naive times are read in TIME_ZONE')
+        parser.add_argument('--drop-indexes', action='store_true',
+                            help='Drop secondary indexes and foreign keys during the load and rebuild them afterwards. '
+                                 'Queries on machine_readings are slow until the rebuild finishes.')
+        parser.add_argument('--skip-anomalies', action='store_true', help='Leave imported readings unflagged')
+        parser.add_argument('--skip-rollups', action='store_true', help='Do not rebuild rollups for the imported range')
+    
+    def handle(self, *args, **options):
+        for path in options['files']:
+            if path.endswith('.parquet') and pq is None:
+                raise CommandError('Reading Parquet files requires pyarrow')
+            if not path.endswith(('.csv', '.parquet')):
+                raise CommandError(f'{path}: expected a .csv or .parquet file')
+        
+        self.tz = ZoneInfo(settings.TIME_ZONE)
+        self.machines = dict(Machine.objects.values_list('machine_id', 'pk'))
+        self.imported_at = timezone.now()
+        self.spans = {}
+        self.skipped = 0
+        # Months with a partition to COPY into; None when the table is not partitioned.
+        self.months = set(partitions.list_partitions()) if partitions.is_partitioned() else None
+        started = time.monotonic()
+        
+        index_definitions = self._drop_indexes() if options['drop_indexes'] else []
+        try:
+            total = sum(self._copy_file(path, options) for path in options['files'])
+        finally:
+            if index_definitions:
+                self._step('Rebuilt indexes', partitions.restore_indexes, index_definitions)
+        
+        self.stdout.write(f'Copied {total} readings, skipped {self.skipped}')
+        if not total:
+            return
+        
+        if not options['skip_anomalies']:
+            flagged = self._step('Flagged anomalies', self._flag_anomalies)
+            self.stdout.write(f'  {flagged} anomalies')
+        
+        codes = [code for code, pk in self.machines.items() if pk in self.spans]
+        self._step('Rebuilt baselines', call_command, 'rebuild_reading_stats', *codes, stdout=self.stdout)
+        
+        if not options['skip_rollups']:
+            start = min(span[0] for span in self.spans.values())
+            end = max(span[1] for span in self.spans.values()) + timedelta(microseconds=1)
+            self._step('Rebuilt rollups', rebuild_rollups, start, end, machine_pks=list(self.spans))
+        
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE machine_readings')
+        
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total} readings in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s overall)'
+        ))
+    
+    def _step(self, label, func, *args, **kwargs):
+        started = time.monotonic()
+        result = func(*args, **kwargs)
+        self.stdout.write(f'{label} in {time.monotonic() - started:.1f}s')
+        return result
+    
+    def _skip(self, path, position, reason):
+        self.skipped += 1
+        if self.skipped <= REPORTED_SKIPS:
+            self.stderr.write(f'{path}:{position}: skipped, {reason}')
+    
+    def _csv_rows(self, path):
+        with open(path, newline='', encoding='utf-8-sig') as handle:
+            for record in csv.DictReader(handle):
+                yield {key: value if value != '' else None for key, value in record.items()}
+    
+    def _parquet_rows(self, path):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=PARQUET_BATCH_SIZE):
+            yield from batch.to_pylist()
+    
+    def _parse(self, record, options):
+        """Return ``(machine_pk, timestamp, *metrics, runtime_hours)`` or raise ValueError."""
+        code = record.get(options['machine_column'])
+        machine_pk = self.machines.get(code)
+        if machine_pk is None:
+            raise ValueError(f'unknown machine {code!r}')
+        
+        timestamp = record.get(options['timestamp_column'])
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        if not isinstance(timestamp, datetime):
+            raise ValueError('missing timestamp')
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=self.tz)
+        
+        metrics = [None if record.get(metric) is None else float(record[metric]) for metric in METRICS]
+        runtime_hours = record.get('runtime_hours')
+        return (machine_pk, timestamp, *metrics, None if runtime_hours is None else int(runtime_hours))
+    
+    def _copy_file(self, path, options):
+        """COPY one file in its own transaction and return the number of rows written.
+        
+        A row from a month without a partition ends the current COPY; the
+        month's partition is created and a new COPY picks up from that row, so
+        no row is written to the default partition only to be moved later.
+        """
+        rows = enumerate(self._parquet_rows(path) if path.endswith('.parquet') else self._csv_rows(path), start=1)
+        copied = 0
+        started = time.monotonic()
+        month_range = None
+        pending = None
+        
+        with transaction.atomic(), connection.cursor() as cursor:
+            while True:
+                with cursor.copy(COPY_SQL) as copy:
+                    if pending is not None:
+                        copy.write_row(pending)
+                        copied += 1
+                        pending = None
+                    for position, record in rows:
+                        try:
+                            machine_pk, timestamp, *values = self._parse(record, options)
+                        except (TypeError, ValueError) as exc:
+                            self._skip(path, position, exc)
+                            continue
+                        
+                        span = self.spans.get(machine_pk)
+                        if span is None:
+                            self.spans[machine_pk] = [timestamp, timestamp]
+                        elif timestamp < span[0]:
+                            span[0] = timestamp
+                        elif timestamp > span[1]:
+                            span[1] = timestamp
+                        
+                        row = (machine_pk, timestamp, *values, '{}', '', False, '', self.imported_at)
+                        if self.months is not None and (month_range is None
+                                                        or not month_range[0] <= timestamp < month_range[1]):
+                            month = partitions.month_start(timestamp)
+                            month_range = (month, partitions.add_months(month, 1))
+                            if month not in self.months:
+                                pending = row
+                                break
+                        copy.write_row(row)
+                        copied += 1
+                if pending is None:
+                    break
+                self._create_partition(cursor, month_range[0])
+        
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'{path}: {copied} rows in {elapsed:.1f}s ({copied / max(elapsed, 1e-9):,.0f} rows/s)')
+        return copied
+    
+    def _create_partition(self, cursor, month):
+        # Postgres refuses to alter a table with deferred foreign key checks
+        # queued, so run the checks of the rows copied so far first.
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        name = partitions.create_partition(month)
+        cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+        self.months.add(month)
+        self.stdout.write(f'Created partition {name}')
+    
+    def _drop_indexes(self):
+        definitions = partitions.drop_indexes()
+        self.stdout.write(f'Dropped {len(definitions)} indexes and foreign keys')
+        return definitions
+    
+    def _flag_anomalies(self):
+        """Score the imported readings of each machine against their surrounding history."""
+        horizon = timedelta(days=MachineReadingStats.BASELINE_DAYS)
+        flagged = 0
+        latest = {}
+        anomalies = []
+        for machine_pk, (start, end) in self.spans.items():
+            with connection.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT id, timestamp, EXTRACT(EPOCH FROM timestamp), {', '.join(METRICS)},
+                           is_anomaly, scored_at = %s
+                    FROM machine_readings
+                    WHERE machine_id = %s AND timestamp >= %s AND timestamp <= %s
+                    ORDER BY timestamp, id
+                """, [self.imported_at, machine_pk, start - horizon, end])
+                rows = cursor.fetchall()
+            
+            columns = list(zip(*rows))
+            imported = np.array(columns[-1], dtype=bool)
+            values = {metric: np.array(columns[3 + i], dtype=float) for i, metric in enumerate(METRICS)}
+            epochs = np.array(columns[2], dtype=float)
+            
+            # Imported readings all join the baseline; existing ones only if
+            # they were not flagged, as in live scoring.
+            eligible = imported | ~np.array(columns[-2], dtype=bool)
+            flags, reasons = flag_anomalies(epochs, values, eligible)
+            
+            hits = np.flatnonzero(flags & imported)
+            if not len(hits):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE machine_readings AS r SET is_anomaly = true, anomaly_reason = u.reason
+                    FROM unnest(%s::bigint[], %s::timestamptz[], %s::text[]) AS u(id, timestamp, reason)
+                    WHERE r.id = u.id AND r.timestamp = u.timestamp
+                """, [
+                    [rows[i][0] for i in hits],
+                    [rows[i][1] for i in hits],
+                    [reasons[int(i)] for i in hits],
+                ])
+            flagged += len(hits)
+            latest[machine_pk] = rows[hits[-1]][1]
+            anomalies.extend((machine_pk, rows[i][0], rows[i][1], reasons[int(i)]) for i in hits)
+        
+        record_anomalies(latest)
+        anomalies_flagged.send(sender=MachineReading, anomalies=anomalies)
+        return flagged
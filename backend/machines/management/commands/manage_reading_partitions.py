@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from machines import partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly machine_readings partitions and expire old ones'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=settings.READING_PARTITION_MONTHS_AHEAD,
+                            help='Months after the current one to create partitions for')
+        parser.add_argument('--retention-months', type=int, default=settings.READING_RETENTION_MONTHS,
+                            help='Full months of history to keep before the current month (0 keeps everything)')
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument('--detach', dest='mode', action='store_const', const='detach',
+                          help='Detach expired partitions, leaving them as standalone tables')
+        mode.add_argument('--drop', dest='mode', action='store_const', const='drop',
+                          help='Drop expired partitions')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without changing it')
+        parser.set_defaults(mode=settings.READING_RETENTION_MODE)
+    
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            raise CommandError('machine_readings is not partitioned; run migrations first')
+        if options['mode'] not in ('detach', 'drop'):
+            raise CommandError("READING_RETENTION_MODE must be 'detach' or 'drop'")
+        
+        dry_run = options['dry_run']
+        current = partitions.month_start(timezone.now())
+        existing = partitions.list_partitions()
+        
+        for offset in range(options['months_ahead'] + 1):
+            month = partitions.add_months(current, offset)
+            if month in existing:
+                continue
+            if not dry_run:
+                partitions.create_partition(month)
+            self.stdout.write(f'Created {partitions.partition_name(month)}')
+        
+        if options['retention_months'] > 0:
+            cutoff = partitions.add_months(current, -options['retention_months'])
+            detach = options['mode'] == 'detach'
+            for month, name in sorted(existing.items()):
+                if partitions.add_months(month, 1) > cutoff:
+                    continue
+                if not dry_run:
+                    partitions.expire_partition(name, detach=detach)
+                self.stdout.write(f"{'Detached' if detach else 'Dropped'} {name}")
+            
+            if not detach and not dry_run:
+                purged = partitions.purge_default_partition(cutoff)
+                if purged:
+                    self.stdout.write(f'Deleted {purged} expired readings from {partitions.DEFAULT_PARTITION}')
+        
+        self.stdout.write(self.style.SUCCESS('Reading partitions are up to date'))
@@ -0,0 +1,47 @@
+from datetime import datetime, time, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from machines.models import Machine, MachineReading
+from machines.rollups import GRANULARITIES, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Backfill minute/hour/day reading rollups from machine_readings'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('machine_ids', nargs='*', help='Machine codes to rebuild (default: all machines)')
+        parser.add_argument('--since', help='First day to rebuild (YYYY-MM-DD, default: oldest reading)')
+        parser.add_argument('--until', help='Last day to rebuild, inclusive (YYYY-MM-DD, default: today)')
+        parser.add_argument('--granularity', action='append', choices=GRANULARITIES,
+                            help='Granularity to rebuild; repeatable (default: all)')
+    
+    def _day(self, value, option):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'--{option} must be a date in YYYY-MM-DD format')
+        return timezone.make_aware(datetime.combine(day, time.min))
+    
+    def handle(self, *args, **options):
+        machine_pks = None
+        if options['machine_ids']:
+            machines = dict(Machine.objects.filter(machine_id__in=options['machine_ids']).values_list('machine_id', 'pk'))
+            unknown = set(options['machine_ids']) - machines.keys()
+            if unknown:
+                raise CommandError(f"Unknown machines: {', '.join(sorted(unknown))}")
+            machine_pks = list(machines.values())
+        
+        bounds = MachineReading.objects.aggregate(oldest=Min('timestamp'), newest=Max('timestamp'))
+        if bounds['oldest'] is None:
+            self.stdout.write('No readings to roll up')
+            return
+        
+        start = self._day(options['since'], 'since') if options['since'] else bounds['oldest']
+        if options['until']:
+            end = self._day(options['until'], 'until') + timedelta(days=1)
+        else:
+            end = max(bounds['newest'], timezone.now())
+        
+        rows = rebuild_rollups(start, end, granularities=options['granularity'], machine_pks=machine_pks)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup buckets from {start:%Y-%m-%d} to {end:%Y-%m-%d}'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from machines.models import Machine, MachineReadingStats
+from machines.utils import build_reading_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the running anomaly baselines from reading history'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('machine_ids', nargs='*', help='Machine codes to rebuild (default: all machines)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Machines rebuilt per query')
+    
+    def handle(self, *args, **options):
+        machines = Machine.objects.order_by('pk')
+        if options['machine_ids']:
+            machines = machines.filter(machine_id__in=options['machine_ids'])
+            unknown = set(options['machine_ids']) - set(machines.values_list('machine_id', flat=True))
+            if unknown:
+                raise CommandError(f"Unknown machines: {', '.join(sorted(unknown))}")
+        
+        machine_pks = list(machines.values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        
+        for start in range(0, len(machine_pks), batch_size):
+            batch = machine_pks[start:start + batch_size]
+            stats = build_reading_stats(batch)
+            with transaction.atomic():
+                MachineReadingStats.objects.filter(machine_id__in=batch).delete()
+                MachineReadingStats.objects.bulk_create(stats.values())
+        
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt baselines for {len(machine_pks)} machines'))
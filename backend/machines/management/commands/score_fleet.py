@@ -0,0 +1,31 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from machines.fleet import score_fleet
+from machines.models import Machine
+
+
+class Command(BaseCommand):
+    help = 'Refit health models and store health scores for the whole fleet'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('machine_ids', nargs='*', help='Machine codes to score (default: all machines)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes (default: one per core; 1 runs in-process)')
+    
+    def handle(self, *args, **options):
+        machine_pks = None
+        if options['machine_ids']:
+            machines = dict(Machine.objects.filter(machine_id__in=options['machine_ids']).values_list('machine_id', 'pk'))
+            unknown = set(options['machine_ids']) - machines.keys()
+            if unknown:
+                raise CommandError(f"Unknown machines: {', '.join(sorted(unknown))}")
+            machine_pks = list(machines.values())
+        
+        started = time.monotonic()
+        scored = score_fleet(machine_pks, workers=options['workers'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {scored} machines in {elapsed:.1f}s with {options['workers']} workers "
+            f"({scored / max(elapsed, 1e-9):.1f} machines/s)"
+        ))
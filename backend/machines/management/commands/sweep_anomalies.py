@@ -0,0 +1,44 @@
+import time
+from datetime import datetime, time as dt_time, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from machines.models import Machine
+from machines.sweep import sweep_anomalies
+
+
+class Command(BaseCommand):
+    help = 'Re-apply the anomaly rule to a window of recent readings for the whole fleet in one pass'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('machine_ids', nargs='*', help='Machine codes to sweep (default: all machines)')
+        parser.add_argument('--hours', type=int, default=settings.ANOMALY_SWEEP_HOURS,
+                            help='Sweep readings from the last N hours (default: ANOMALY_SWEEP_HOURS)')
+        parser.add_argument('--since', help='Sweep from this day instead (YYYY-MM-DD)')
+    
+    def handle(self, *args, **options):
+        machine_pks = None
+        if options['machine_ids']:
+            machines = dict(Machine.objects.filter(machine_id__in=options['machine_ids']).values_list('machine_id', 'pk'))
+            unknown = set(options['machine_ids']) - machines.keys()
+            if unknown:
+                raise CommandError(f"Unknown machines: {', '.join(sorted(unknown))}")
+            machine_pks = list(machines.values())
+        
+        end = timezone.now()
+        if options['since']:
+            day = parse_date(options['since'])
+            if day is None:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+            start = timezone.make_aware(datetime.combine(day, dt_time.min))
+        else:
+            start = end - timedelta(hours=options['hours'])
+        
+        started = time.monotonic()
+        swept, flagged = sweep_anomalies(start, end, machine_pks)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Swept {swept} readings in {elapsed:.1f}s ({swept / max(elapsed, 1e-9):,.0f} readings/s), '
+            f'flagged {flagged} new anomalies'
+        ))
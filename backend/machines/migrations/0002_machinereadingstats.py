@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-18 11:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineReadingStats',
+            fields=[
+                ('machine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reading_stats', serialize=False, to='machines.machine')),
+                ('window', models.JSONField(default=list)),
+                ('pushes', models.IntegerField(default=0)),
+                ('temperature_count', models.IntegerField(default=0)),
+                ('temperature_mean', models.FloatField(default=0)),
+                ('temperature_m2', models.FloatField(default=0)),
+                ('vibration_level_count', models.IntegerField(default=0)),
+                ('vibration_level_mean', models.FloatField(default=0)),
+                ('vibration_level_m2', models.FloatField(default=0)),
+                ('oil_pressure_count', models.IntegerField(default=0)),
+                ('oil_pressure_mean', models.FloatField(default=0)),
+                ('oil_pressure_m2', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'machine_reading_stats',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0002_machinereadingstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machinereading',
+            name='scored_at',
+            field=models.DateTimeField(blank=True, help_text='When anomaly scoring completed; null while pending', null=True),
+        ),
+    ]
@@ -0,0 +1,125 @@
+"""Convert ``machine_readings`` into a table range-partitioned by month.
+
+Partition bounds follow ``settings.TIME_ZONE`` so a month partition holds a
+calendar month of plant time. The migration creates one partition per month
+that already holds data (through the current month) plus a DEFAULT partition
+that catches anything outside them; ``manage.py manage_reading_partitions``
+creates future months and applies the retention policy.
+
+Postgres requires the partition key in every unique constraint, so the
+primary key becomes ``(id, timestamp)``. Django keeps treating ``id`` as the
+primary key; ids stay unique because they come from a single sequence.
+Indexes and foreign keys are recreated on the parent under their existing
+names, so later schema migrations keep working.
+"""
+import re
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import migrations
+
+
+def _month_start(value, tz):
+    value = value.astimezone(tz)
+    return datetime(value.year, value.month, 1, tzinfo=tz)
+
+
+def _next_month(value):
+    if value.month == 12:
+        return value.replace(year=value.year + 1, month=1)
+    return value.replace(month=value.month + 1)
+
+
+def _detach_old_table(cursor, table):
+    """Rename ``table`` out of the way and return its index and foreign key definitions."""
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+    cursor.execute(f'ALTER TABLE {table}_old RENAME CONSTRAINT {table}_pkey TO {table}_old_pkey')
+    cursor.execute("""
+        SELECT indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s
+    """, [f'{table}_old', f'{table}_old_pkey'])
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+    """, [f'{table}_old'])
+    return indexes, cursor.fetchall()
+
+
+def _copy_from_old_table(cursor, table, indexes, foreign_keys):
+    """Move rows into the new ``table``, then restore its sequence, indexes and foreign keys."""
+    cursor.execute(f'INSERT INTO {table} SELECT * FROM {table}_old')
+    cursor.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}_old')
+    next_id = cursor.fetchone()[0]
+    # LIKE ... INCLUDING DEFAULTS may have copied a default bound to the old sequence.
+    cursor.execute(f'ALTER TABLE {table} ALTER COLUMN id DROP DEFAULT')
+    cursor.execute(f'DROP TABLE {table}_old')
+
+    cursor.execute(f'CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id')
+    cursor.execute(f"SELECT setval('{table}_id_seq', %s, false)", [next_id])
+    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')")
+
+    for definition in indexes:
+        # Indexes of a partitioned table are reported as ``ON ONLY``; recreate
+        # them recursively so every partition gets one.
+        cursor.execute(re.sub(rf' ON (ONLY )?(\S+\.)?{table}_old ', rf' ON \g<2>{table} ', definition))
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+
+
+def partition_readings(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    tz = ZoneInfo(settings.TIME_ZONE)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MIN(timestamp), NOW() FROM machine_readings')
+        oldest, now = cursor.fetchone()
+
+        indexes, foreign_keys = _detach_old_table(cursor, 'machine_readings')
+        cursor.execute("""
+            CREATE TABLE machine_readings (
+                LIKE machine_readings_old INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS,
+                CONSTRAINT machine_readings_pkey PRIMARY KEY (id, "timestamp")
+            ) PARTITION BY RANGE ("timestamp")
+        """)
+
+        month = _month_start(oldest or now, tz)
+        last = _month_start(now, tz)
+        while month <= last:
+            upper = _next_month(month)
+            cursor.execute(
+                f'CREATE TABLE machine_readings_p{month:%Y_%m} PARTITION OF machine_readings '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+            month = upper
+        cursor.execute('CREATE TABLE machine_readings_default PARTITION OF machine_readings DEFAULT')
+
+        _copy_from_old_table(cursor, 'machine_readings', indexes, foreign_keys)
+
+
+def unpartition_readings(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = _detach_old_table(cursor, 'machine_readings')
+        cursor.execute("""
+            CREATE TABLE machine_readings (
+                LIKE machine_readings_old INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS,
+                CONSTRAINT machine_readings_pkey PRIMARY KEY (id)
+            )
+        """)
+        _copy_from_old_table(cursor, 'machine_readings', indexes, foreign_keys)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0003_machinereading_scored_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_readings, unpartition_readings),
+    ]
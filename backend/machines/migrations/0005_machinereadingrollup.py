@@ -0,0 +1,44 @@
+# Generated by Django 5.1 on 2026-10-18 11:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0004_partition_machine_readings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineReadingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('reading_count', models.IntegerField(default=0)),
+                ('temperature_count', models.IntegerField(default=0)),
+                ('temperature_min', models.FloatField(blank=True, null=True)),
+                ('temperature_max', models.FloatField(blank=True, null=True)),
+                ('temperature_sum', models.FloatField(default=0)),
+                ('temperature_sum_sq', models.FloatField(default=0)),
+                ('vibration_level_count', models.IntegerField(default=0)),
+                ('vibration_level_min', models.FloatField(blank=True, null=True)),
+                ('vibration_level_max', models.FloatField(blank=True, null=True)),
+                ('vibration_level_sum', models.FloatField(default=0)),
+                ('vibration_level_sum_sq', models.FloatField(default=0)),
+                ('oil_pressure_count', models.IntegerField(default=0)),
+                ('oil_pressure_min', models.FloatField(blank=True, null=True)),
+                ('oil_pressure_max', models.FloatField(blank=True, null=True)),
+                ('oil_pressure_sum', models.FloatField(default=0)),
+                ('oil_pressure_sum_sq', models.FloatField(default=0)),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='machines.machine')),
+            ],
+            options={
+                'db_table': 'machine_reading_rollups',
+                'ordering': ['bucket_start'],
+                'constraints': [models.UniqueConstraint(fields=('machine', 'granularity', 'bucket_start'), name='unique_rollup_bucket')],
+            },
+        ),
+    ]
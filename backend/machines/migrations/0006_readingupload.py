@@ -0,0 +1,34 @@
+# Generated by Django 5.1 on 2026-10-18 11:41
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0005_machinereadingrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('format', models.CharField(choices=[('ndjson', 'NDJSON'), ('csv', 'CSV')], max_length=10)),
+                ('acknowledged_offset', models.BigIntegerField(default=0)),
+                ('created_count', models.BigIntegerField(default=0)),
+                ('failed_count', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('uploaded_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reading_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'machine_reading_uploads',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 11:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0006_readingupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='health_status',
+            field=models.CharField(choices=[('GREEN', 'Green'), ('YELLOW', 'Yellow'), ('RED', 'Red'), ('CRITICAL', 'Critical'), ('UNKNOWN', 'Unknown')], db_index=True, default='UNKNOWN', help_text='Maintained from maintenance dates and last_anomaly_at', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='machine',
+            name='last_anomaly_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
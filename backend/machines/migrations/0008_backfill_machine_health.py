@@ -0,0 +1,36 @@
+"""Fill in ``last_anomaly_at`` and ``health_status`` for existing machines."""
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import Case, Max, OuterRef, Subquery, Value, When
+from django.utils import timezone
+
+
+def backfill_health(apps, schema_editor):
+    Machine = apps.get_model('machines', 'Machine')
+    MachineReading = apps.get_model('machines', 'MachineReading')
+    now = timezone.now()
+    today = timezone.localdate(now)
+
+    Machine.objects.update(last_anomaly_at=Subquery(
+        MachineReading.objects.filter(machine=OuterRef('pk'), is_anomaly=True)
+        .values('machine').annotate(latest=Max('timestamp')).values('latest')
+    ))
+    Machine.objects.update(health_status=Case(
+        When(next_maintenance_date__isnull=True, then=Value('UNKNOWN')),
+        When(last_anomaly_at__gte=now - timedelta(days=7), then=Value('CRITICAL')),
+        When(next_maintenance_date__lt=today, then=Value('RED')),
+        When(next_maintenance_date__lte=today + timedelta(days=7), then=Value('YELLOW')),
+        default=Value('GREEN'),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0007_machine_health_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_health, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1 on 2026-10-18 11:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0008_backfill_machine_health'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineHealthModel',
+            fields=[
+                ('machine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='health_model', serialize=False, to='machines.machine')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('model_data', models.BinaryField()),
+                ('sklearn_version', models.CharField(max_length=20)),
+                ('window_start', models.DateTimeField()),
+                ('window_end', models.DateTimeField()),
+                ('training_rows', models.IntegerField()),
+                ('score_min', models.FloatField()),
+                ('score_max', models.FloatField()),
+                ('trained_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'machine_health_models',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-18 11:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0009_machinehealthmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineHealthScore',
+            fields=[
+                ('machine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='health_score', serialize=False, to='machines.machine')),
+                ('health_score', models.IntegerField(db_index=True)),
+                ('status', models.CharField(choices=[('HEALTHY', 'Healthy'), ('WARNING', 'Warning'), ('CRITICAL', 'Critical')], db_index=True, max_length=10)),
+                ('trend', models.CharField(choices=[('IMPROVING', 'Improving'), ('DECLINING', 'Declining')], max_length=10)),
+                ('readings_analyzed', models.IntegerField()),
+                ('anomalies_detected', models.IntegerField()),
+                ('model_version', models.PositiveIntegerField()),
+                ('scored_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'machine_health_scores',
+                'ordering': ['health_score'],
+            },
+        ),
+    ]
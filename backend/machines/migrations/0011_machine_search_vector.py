@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-18 12:18
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0010_machinehealthscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector(models.Func(models.F('machine_id'), models.Value('[^[:alnum:]]+'), models.Value(' '), models.Value('g'), function='regexp_replace'), config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector(models.Func(models.F('machine_name'), models.Value('[^[:alnum:]]+'), models.Value(' '), models.Value('g'), function='regexp_replace'), config='simple', weight='B'), django.contrib.postgres.search.SearchConfig('simple')), '||', django.contrib.postgres.search.SearchVector(models.Func(models.F('manufacturer'), models.Value('[^[:alnum:]]+'), models.Value(' '), models.Value('g'), function='regexp_replace'), config='simple', weight='C'), django.contrib.postgres.search.SearchConfig('simple')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='machine',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='machines_search__18a31e_gin'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0011_machine_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machinehealthmodel',
+            name='anomalies_detected',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='machinehealthmodel',
+            name='trend',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+    ]
@@ -1,7 +1,11 @@
+import uuid
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 from datetime import timedelta
 from authentication.models import CustomUser
+from factory_maintenance.search import search_vector
 
 class Machine(models.Model):
     STATUS_CHOICES = [
@@ -10,6 +14,15 @@ class Machine(models.Model):
         ('DOWN', 'Down'),
         ('DECOMMISSIONED', 'Decommissioned'),
     ]
+    HEALTH_CHOICES = [
+        ('GREEN', 'Green'),
+        ('YELLOW', 'Yellow'),
+        ('RED', 'Red'),
+        ('CRITICAL', 'Critical'),
+        ('UNKNOWN', 'Unknown'),
+    ]
+    # A machine stays CRITICAL for this long after its latest anomaly.
+    ANOMALY_WINDOW_DAYS = 7
     
     machine_id = models.CharField(max_length=50, unique=True, db_index=True)
     machine_name = models.CharField(max_length=100)
@@ -27,6 +40,10 @@ class Machine(models.Model):
     last_maintenance_date = models.DateField(null=True, blank=True)
     next_maintenance_date = models.DateField(null=True, blank=True, db_index=True)
     
+    health_status = models.CharField(max_length=10, choices=HEALTH_CHOICES, default='UNKNOWN', db_index=True,
+                                     help_text="Maintained from maintenance dates and last_anomaly_at")
+    last_anomaly_at = models.DateTimeField(null=True, blank=True)
+    
     specifications = models.JSONField(default=dict, blank=True)
     
     manual_document = models.FileField(upload_to='machine_manuals/', null=True, blank=True)
@@ -37,6 +54,11 @@ class Machine(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='created_machines')
     
+    search_vector = models.GeneratedField(
+        expression=search_vector(A='machine_id', B='machine_name', C='manufacturer'),
+        output_field=SearchVectorField(), db_persist=True,
+    )
+    
     class Meta:
         db_table = 'machines'
         ordering = ['machine_id']
@@ -44,6 +66,7 @@ class Machine(models.Model):
             models.Index(fields=['machine_id']),
             models.Index(fields=['next_maintenance_date']),
             models.Index(fields=['status']),
+            GinIndex(fields=['search_vector']),
         ]
     
     def __str__(self):
@@ -54,14 +77,28 @@ class Machine(models.Model):
             self.next_maintenance_date = self.last_maintenance_date + timedelta(days=self.maintenance_frequency_days)
             self.save(update_fields=['next_maintenance_date'])
     
-    def get_health_status(self):
+    def save(self, *args, **kwargs):
+        previous = self.health_status
+        self.health_status = self.compute_health_status()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and (self.health_status != previous
+                                          or {'next_maintenance_date', 'last_anomaly_at'} & set(update_fields)):
+            kwargs['update_fields'] = set(update_fields) | {'health_status'}
+        super().save(*args, **kwargs)
+    
+    def compute_health_status(self, now=None):
+        """Derive the health status from maintenance dates and the latest anomaly.
+        
+        ``machines.health.health_status_expression`` is the SQL equivalent used
+        for bulk updates; keep the two in step.
+        """
         if not self.next_maintenance_date:
             return 'UNKNOWN'
         
-        today = timezone.now().date()
-        days_until = (self.next_maintenance_date - today).days
+        now = now or timezone.now()
+        days_until = (self.next_maintenance_date - timezone.localdate(now)).days
         
-        if self.readings.filter(is_anomaly=True, timestamp__gte=timezone.now() - timedelta(days=7)).exists():
+        if self.last_anomaly_at and self.last_anomaly_at >= now - timedelta(days=self.ANOMALY_WINDOW_DAYS):
             return 'CRITICAL'
         
         if days_until < 0:
@@ -89,6 +126,7 @@ class MachineReading(models.Model):
     
     is_anomaly = models.BooleanField(default=False, db_index=True)
     anomaly_reason = models.TextField(blank=True)
+    scored_at = models.DateTimeField(null=True, blank=True, help_text="When anomaly scoring completed; null while pending")
     
     class Meta:
         db_table = 'machine_readings'
@@ -101,3 +139,260 @@ class MachineReading(models.Model):
     
     def __str__(self):
         return f"{self.machine.machine_id} - {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+class MachineReadingStats(models.Model):
+    """Running anomaly baseline for one machine.
+    
+    Holds the machine's most recent non-anomalous readings (at most
+    ``BASELINE_WINDOW`` of them, none older than ``BASELINE_DAYS``) together
+    with Welford count/mean/M2 accumulators for every metric over that window.
+    Scoring a reading and sliding the window are both O(1), so ingest never
+    has to scan ``machine_readings``.
+    """
+    METRICS = ['temperature', 'vibration_level', 'oil_pressure']
+    BASELINE_WINDOW = 50
+    BASELINE_DAYS = 30
+    
+    machine = models.OneToOneField(Machine, on_delete=models.CASCADE, primary_key=True, related_name='reading_stats')
+    
+    # [[epoch_seconds, temperature, vibration_level, oil_pressure], ...], oldest first
+    window = models.JSONField(default=list)
+    # Pushes since the accumulators were last recomputed exactly from ``window``
+    pushes = models.IntegerField(default=0)
+    
+    temperature_count = models.IntegerField(default=0)
+    temperature_mean = models.FloatField(default=0)
+    temperature_m2 = models.FloatField(default=0)
+    vibration_level_count = models.IntegerField(default=0)
+    vibration_level_mean = models.FloatField(default=0)
+    vibration_level_m2 = models.FloatField(default=0)
+    oil_pressure_count = models.IntegerField(default=0)
+    oil_pressure_mean = models.FloatField(default=0)
+    oil_pressure_m2 = models.FloatField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'machine_reading_stats'
+    
+    def __str__(self):
+        return f"{self.machine_id} baseline ({len(self.window)} readings)"
+    
+    def baseline(self, metric):
+        """Return ``(count, mean, std)`` of ``metric`` over the window."""
+        count = getattr(self, f'{metric}_count')
+        if not count:
+            return 0, 0.0, 0.0
+        m2 = max(getattr(self, f'{metric}_m2'), 0.0)
+        return count, getattr(self, f'{metric}_mean'), (m2 / count) ** 0.5
+    
+    def expire(self, now=None):
+        """Drop readings that have aged out of the baseline period."""
+        now = now or timezone.now()
+        cutoff = (now - timedelta(days=self.BASELINE_DAYS)).timestamp()
+        while self.window and self.window[0][0] < cutoff:
+            self._remove(self.window.pop(0))
+    
+    def push(self, timestamp, reading):
+        """Add a non-anomalous reading, evicting the oldest one if the window is full."""
+        entry = [timestamp.timestamp()] + [reading.get(metric) for metric in self.METRICS]
+        self.window.append(entry)
+        self._add(entry)
+        while len(self.window) > self.BASELINE_WINDOW:
+            self._remove(self.window.pop(0))
+        
+        # Sliding updates accumulate rounding error; recompute exactly from the
+        # window once per window length, which keeps updates amortised O(1).
+        self.pushes += 1
+        if self.pushes >= self.BASELINE_WINDOW:
+            self.recompute()
+    
+    def recompute(self):
+        for metric in self.METRICS:
+            setattr(self, f'{metric}_count', 0)
+            setattr(self, f'{metric}_mean', 0.0)
+            setattr(self, f'{metric}_m2', 0.0)
+        for entry in self.window:
+            self._add(entry)
+        self.pushes = 0
+    
+    def _add(self, entry):
+        for metric, value in zip(self.METRICS, entry[1:]):
+            # Zero and missing values never count towards the baseline.
+            if not value:
+                continue
+            count = getattr(self, f'{metric}_count') + 1
+            mean = getattr(self, f'{metric}_mean')
+            delta = value - mean
+            mean += delta / count
+            setattr(self, f'{metric}_count', count)
+            setattr(self, f'{metric}_mean', mean)
+            setattr(self, f'{metric}_m2', getattr(self, f'{metric}_m2') + delta * (value - mean))
+    
+    def _remove(self, entry):
+        for metric, value in zip(self.METRICS, entry[1:]):
+            if not value:
+                continue
+            count = getattr(self, f'{metric}_count') - 1
+            if count <= 0:
+                setattr(self, f'{metric}_count', 0)
+                setattr(self, f'{metric}_mean', 0.0)
+                setattr(self, f'{metric}_m2', 0.0)
+                continue
+            mean = getattr(self, f'{metric}_mean')
+            new_mean = mean - (value - mean) / count
+            setattr(self, f'{metric}_count', count)
+            setattr(self, f'{metric}_mean', new_mean)
+            setattr(self, f'{metric}_m2', getattr(self, f'{metric}_m2') - (value - mean) * (value - new_mean))
+
+class MachineReadingRollup(models.Model):
+    """Per-machine aggregates of readings over a minute, hour or day.
+    
+    Buckets are aligned to ``settings.TIME_ZONE`` so daily rollups follow plant
+    days. Counts, sums and sums of squares are stored rather than means so
+    that partial aggregates can be merged incrementally.
+    """
+    GRANULARITY_CHOICES = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    METRICS = ['temperature', 'vibration_level', 'oil_pressure']
+    
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE, related_name='rollups')
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    
+    reading_count = models.IntegerField(default=0)
+    
+    temperature_count = models.IntegerField(default=0)
+    temperature_min = models.FloatField(null=True, blank=True)
+    temperature_max = models.FloatField(null=True, blank=True)
+    temperature_sum = models.FloatField(default=0)
+    temperature_sum_sq = models.FloatField(default=0)
+    vibration_level_count = models.IntegerField(default=0)
+    vibration_level_min = models.FloatField(null=True, blank=True)
+    vibration_level_max = models.FloatField(null=True, blank=True)
+    vibration_level_sum = models.FloatField(default=0)
+    vibration_level_sum_sq = models.FloatField(default=0)
+    oil_pressure_count = models.IntegerField(default=0)
+    oil_pressure_min = models.FloatField(null=True, blank=True)
+    oil_pressure_max = models.FloatField(null=True, blank=True)
+    oil_pressure_sum = models.FloatField(default=0)
+    oil_pressure_sum_sq = models.FloatField(default=0)
+    
+    class Meta:
+        db_table = 'machine_reading_rollups'
+        ordering = ['bucket_start']
+        constraints = [
+            models.UniqueConstraint(fields=['machine', 'granularity', 'bucket_start'], name='unique_rollup_bucket'),
+        ]
+    
+    def __str__(self):
+        return f"{self.machine_id} {self.granularity} {self.bucket_start:%Y-%m-%d %H:%M}"
+    
+    def summary(self, metric):
+        """Return count/min/max/mean/stddev (population) of ``metric`` in this bucket."""
+        count = getattr(self, f'{metric}_count')
+        if not count:
+            return {'count': 0, 'min': None, 'max': None, 'mean': None, 'stddev': None}
+        mean = getattr(self, f'{metric}_sum') / count
+        variance = max(getattr(self, f'{metric}_sum_sq') / count - mean * mean, 0.0)
+        return {
+            'count': count,
+            'min': getattr(self, f'{metric}_min'),
+            'max': getattr(self, f'{metric}_max'),
+            'mean': mean,
+            'stddev': variance ** 0.5,
+        }
+
+
+class ReadingUpload(models.Model):
+    """Progress of a streamed reading upload.
+    
+    ``acknowledged_offset`` counts the rows of the upload that have been
+    committed (inserted or rejected). It advances in the same transaction as
+    each chunk's readings, so a client that resumes from it never loses or
+    duplicates a row.
+    """
+    FORMAT_CHOICES = [
+        ('ndjson', 'NDJSON'),
+        ('csv', 'CSV'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    uploaded_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='reading_uploads')
+    acknowledged_offset = models.BigIntegerField(default=0)
+    created_count = models.BigIntegerField(default=0)
+    failed_count = models.BigIntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'machine_reading_uploads'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.format} upload {self.id} at row {self.acknowledged_offset}"
+
+
+class MachineHealthModel(models.Model):
+    """A fitted IsolationForest for a machine's health score.
+    
+    ``score_min``/``score_max`` are the decision-function range over the
+    training readings and scale new scores to 0-100. ``trend`` and
+    ``anomalies_detected`` summarize the training readings, so requests only
+    score the newest reading. ``version`` increases on every refit.
+    """
+    machine = models.OneToOneField(Machine, on_delete=models.CASCADE, primary_key=True, related_name='health_model')
+    version = models.PositiveIntegerField(default=1)
+    model_data = models.BinaryField()
+    sklearn_version = models.CharField(max_length=20)
+    
+    window_start = models.DateTimeField()
+    window_end = models.DateTimeField()
+    training_rows = models.IntegerField()
+    score_min = models.FloatField()
+    score_max = models.FloatField()
+    # Blank on models fitted before these were stored, until their next refit.
+    trend = models.CharField(max_length=10, blank=True)
+    anomalies_detected = models.IntegerField(null=True, blank=True)
+    
+    trained_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'machine_health_models'
+    
+    def __str__(self):
+        return f"{self.machine_id} health model v{self.version}"
+
+
+class MachineHealthScore(models.Model):
+    """The latest fleet-wide health score of a machine, written by ``score_fleet``."""
+    STATUS_CHOICES = [
+        ('HEALTHY', 'Healthy'),
+        ('WARNING', 'Warning'),
+        ('CRITICAL', 'Critical'),
+    ]
+    TREND_CHOICES = [
+        ('IMPROVING', 'Improving'),
+        ('DECLINING', 'Declining'),
+    ]
+    
+    machine = models.OneToOneField(Machine, on_delete=models.CASCADE, primary_key=True, related_name='health_score')
+    health_score = models.IntegerField(db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, db_index=True)
+    trend = models.CharField(max_length=10, choices=TREND_CHOICES)
+    readings_analyzed = models.IntegerField()
+    anomalies_detected = models.IntegerField()
+    model_version = models.PositiveIntegerField()
+    scored_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'machine_health_scores'
+        ordering = ['health_score']
+    
+    def __str__(self):
+        return f"{self.machine_id} {self.health_score} ({self.status})"
@@ -0,0 +1,131 @@
+"""Monthly range partitions of ``machine_readings``.
+
+Partitions are named ``machine_readings_pYYYY_MM`` and bounded by calendar
+months in ``settings.TIME_ZONE``. Rows outside every month partition land in
+``machine_readings_default``.
+"""
+import re
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from django.db import connection, transaction
+
+PARENT_TABLE = 'machine_readings'
+DEFAULT_PARTITION = 'machine_readings_default'
+PARTITION_NAME = re.compile(r'^machine_readings_p(\d{4})_(\d{2})$')
+
+def month_start(value):
+    value = value.astimezone(ZoneInfo(settings.TIME_ZONE))
+    return datetime(value.year, value.month, 1, tzinfo=value.tzinfo)
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+def partition_name(month):
+    return f'{PARENT_TABLE}_p{month:%Y_%m}'
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [PARENT_TABLE])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+def list_partitions():
+    """Return ``{month_start: table_name}`` for the attached month partitions."""
+    tz = ZoneInfo(settings.TIME_ZONE)
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+        """, [PARENT_TABLE])
+        names = [row[0] for row in cursor.fetchall()]
+    
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime(int(match[1]), int(match[2]), 1, tzinfo=tz)] = name
+    return partitions
+
+def create_partition(month):
+    """Create and attach the partition for ``month``.
+    
+    Rows for that month already sitting in the default partition are moved
+    into the new partition in the same transaction, since Postgres refuses to
+    attach a range the default partition still holds rows for.
+    """
+    name = partition_name(month)
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING STORAGE)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s RETURNING *) '
+            f'INSERT INTO {name} SELECT * FROM moved',
+            [lower, upper]
+        )
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+    return name
+
+def create_partitions(start, end):
+    """Create the missing month partitions between ``start`` and ``end``; returns their names."""
+    if not is_partitioned():
+        return []
+    existing = list_partitions()
+    created = []
+    month = month_start(start)
+    while month <= month_start(end):
+        if month not in existing:
+            created.append(create_partition(month))
+        month = add_months(month, 1)
+    return created
+
+def drop_indexes():
+    """Drop the secondary indexes and foreign keys of ``machine_readings`` for a bulk load.
+    
+    Without them a COPY neither maintains every index row by row nor queues
+    a deferred foreign key check per row for the commit. Returns the
+    statements that restore them, for ``restore_indexes()``; the foreign
+    keys are then validated in one pass each.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT indexname, indexdef FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s
+        """, [PARENT_TABLE, f'{PARENT_TABLE}_pkey'])
+        indexes = cursor.fetchall()
+        cursor.execute("""
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+        """, [PARENT_TABLE])
+        foreign_keys = cursor.fetchall()
+        # Inside a transaction, Postgres refuses to alter a table that still
+        # has deferred checks queued, so run them now.
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        for name, _ in foreign_keys:
+            cursor.execute(f'ALTER TABLE {PARENT_TABLE} DROP CONSTRAINT {name}')
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {name}')
+    return [definition.replace(' ON ONLY ', ' ON ') for _, definition in indexes] + [
+        f'ALTER TABLE {PARENT_TABLE} ADD CONSTRAINT {name} {definition}' for name, definition in foreign_keys
+    ]
+
+def restore_indexes(statements):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+def expire_partition(name, detach=True):
+    """Detach (keeping the table for archiving) or drop an expired partition."""
+    with connection.cursor() as cursor:
+        if detach:
+            cursor.execute(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}')
+        else:
+            cursor.execute(f'DROP TABLE {name}')
+
+def purge_default_partition(cutoff):
+    """Delete rows older than ``cutoff`` that ended up in the default partition."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < %s', [cutoff])
+        return cursor.rowcount
@@ -0,0 +1,157 @@
+"""Minute/hour/day rollups of machine readings.
+
+Readings are folded into ``machine_reading_rollups`` as they are scored, and
+``rebuild_rollups`` recomputes any time range from ``machine_readings`` with a
+single ``GROUP BY`` per granularity and month. Bucket boundaries are computed
+in ``settings.TIME_ZONE``.
+
+Min and max cannot be subtracted from a bucket, so readings that are edited
+or deleted have their days rebuilt by ``refresh_rollups``. Rollups outlive
+the readings: expiring a partition leaves them alone, and only minute
+rollups expire, after ``ROLLUP_MINUTE_RETENTION_DAYS``, while hour and day
+rollups keep the long-term history.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import MachineReadingRollup
+from .partitions import add_months, month_start
+
+GRANULARITIES = [choice for choice, _ in MachineReadingRollup.GRANULARITY_CHOICES]
+METRICS = MachineReadingRollup.METRICS
+
+_COLUMNS = ['reading_count'] + [
+    f'{metric}_{part}' for metric in METRICS for part in ('count', 'min', 'max', 'sum', 'sum_sq')
+]
+
+def bucket_start(value, granularity):
+    """Truncate ``value`` to the start of its bucket in the project time zone."""
+    local = timezone.localtime(value)
+    if granularity == 'minute':
+        return local.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return local.replace(minute=0, second=0, microsecond=0)
+    return local.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _merge_sql():
+    updates = ['reading_count = r.reading_count + EXCLUDED.reading_count']
+    for metric in METRICS:
+        updates += [
+            f'{metric}_count = r.{metric}_count + EXCLUDED.{metric}_count',
+            f'{metric}_min = LEAST(r.{metric}_min, EXCLUDED.{metric}_min)',
+            f'{metric}_max = GREATEST(r.{metric}_max, EXCLUDED.{metric}_max)',
+            f'{metric}_sum = r.{metric}_sum + EXCLUDED.{metric}_sum',
+            f'{metric}_sum_sq = r.{metric}_sum_sq + EXCLUDED.{metric}_sum_sq',
+        ]
+    columns = ', '.join(['machine_id', 'granularity', 'bucket_start'] + _COLUMNS)
+    placeholders = ', '.join(['%s'] * (len(_COLUMNS) + 3))
+    return (
+        f'INSERT INTO machine_reading_rollups AS r ({columns}) VALUES ({placeholders}) '
+        f'ON CONFLICT (machine_id, granularity, bucket_start) DO UPDATE SET {", ".join(updates)}'
+    )
+
+def update_rollups(readings):
+    """Fold ``readings`` into their minute, hour and day buckets.
+
+    Partial aggregates are computed in memory and merged into existing rows
+    with one upsert statement per touched bucket. Each reading must be folded
+    in exactly once; the scoring task guarantees that.
+    """
+    buckets = defaultdict(lambda: [0] + [0, None, None, 0.0, 0.0] * len(METRICS))
+    for reading in readings:
+        for granularity in GRANULARITIES:
+            acc = buckets[(reading.machine_id, granularity, bucket_start(reading.timestamp, granularity))]
+            acc[0] += 1
+            for index, metric in enumerate(METRICS):
+                value = getattr(reading, metric)
+                if value is None:
+                    continue
+                base = 1 + index * 5
+                acc[base] += 1
+                acc[base + 1] = value if acc[base + 1] is None else min(acc[base + 1], value)
+                acc[base + 2] = value if acc[base + 2] is None else max(acc[base + 2], value)
+                acc[base + 3] += value
+                acc[base + 4] += value * value
+
+    if not buckets:
+        return 0
+
+    # Sorted so concurrent workers lock bucket rows in the same order.
+    rows = [list(key) + values for key, values in sorted(buckets.items())]
+    with connection.cursor() as cursor:
+        cursor.executemany(_merge_sql(), rows)
+    return len(rows)
+
+def _rebuild_sql(granularity, machine_filter):
+    selects = ['COUNT(*)']
+    for metric in METRICS:
+        selects += [
+            f'COUNT({metric})',
+            f'MIN({metric})',
+            f'MAX({metric})',
+            f'COALESCE(SUM({metric}), 0)',
+            f'COALESCE(SUM({metric} * {metric}), 0)',
+        ]
+    columns = ', '.join(['machine_id', 'granularity', 'bucket_start'] + _COLUMNS)
+    return f"""
+        INSERT INTO machine_reading_rollups ({columns})
+        SELECT machine_id, '{granularity}', date_trunc('{granularity}', timestamp, %(tz)s), {', '.join(selects)}
+        FROM machine_readings
+        WHERE timestamp >= %(start)s AND timestamp < %(end)s {machine_filter}
+        GROUP BY machine_id, date_trunc('{granularity}', timestamp, %(tz)s)
+    """
+
+def rebuild_rollups(start, end, granularities=None, machine_pks=None):
+    """Recompute rollups for readings in ``[start, end)`` from ``machine_readings``.
+
+    ``start`` and ``end`` are widened to whole days so no bucket is rebuilt
+    from a partial range. Work is split into calendar months, matching the
+    reading partitions, each in its own transaction.
+    """
+    granularities = granularities or GRANULARITIES
+    start = bucket_start(start, 'day')
+    end_day = bucket_start(end, 'day')
+    end = end_day if end_day == end else end_day + timedelta(days=1)
+
+    machine_filter = 'AND machine_id = ANY(%(machines)s)' if machine_pks else ''
+    rebuilt = 0
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(add_months(month_start(chunk_start), 1), end)
+        params = {'tz': settings.TIME_ZONE, 'start': chunk_start, 'end': chunk_end, 'machines': list(machine_pks or [])}
+        with transaction.atomic():
+            existing = MachineReadingRollup.objects.filter(
+                granularity__in=granularities,
+                bucket_start__gte=chunk_start,
+                bucket_start__lt=chunk_end,
+            )
+            if machine_pks:
+                existing = existing.filter(machine_id__in=machine_pks)
+            existing.delete()
+            with connection.cursor() as cursor:
+                for granularity in granularities:
+                    cursor.execute(_rebuild_sql(granularity, machine_filter), params)
+                    rebuilt += cursor.rowcount
+        chunk_start = chunk_end
+    return rebuilt
+
+def refresh_rollups(readings):
+    """Rebuild the buckets of ``readings``, ``(machine_pk, timestamp)`` pairs, after they were edited or deleted.
+
+    Each reading's whole day is rebuilt for its machine, one ``rebuild_rollups``
+    call per day.
+    """
+    days = defaultdict(set)
+    for machine_pk, timestamp in readings:
+        days[bucket_start(timestamp, 'day')].add(machine_pk)
+    rebuilt = 0
+    for day, machine_pks in sorted(days.items()):
+        rebuilt += rebuild_rollups(day, day + timedelta(days=1), machine_pks=sorted(machine_pks))
+    return rebuilt
+
+def purge_rollups(granularity, before):
+    """Delete ``granularity`` rollups whose bucket starts before ``before``."""
+    deleted, _ = MachineReadingRollup.objects.filter(granularity=granularity, bucket_start__lt=before).delete()
+    return deleted
@@ -1,53 +1,101 @@
 from rest_framework import serializers
-from .models import Machine, MachineReading
+from .models import Machine, MachineReading, MachineReadingRollup, ReadingUpload
 from django.utils import timezone
 
 class MachineReadingSerializer(serializers.ModelSerializer):
     logged_by_username = serializers.CharField(source='logged_by.username', read_only=True)
+    # Scoring runs after the reading is saved; until then ``is_anomaly`` is not a verdict.
+    scored = serializers.SerializerMethodField()
     
     class Meta:
         model = MachineReading
         fields = '__all__'
-        read_only_fields = ['logged_by', 'timestamp', 'is_anomaly', 'anomaly_reason']
+        read_only_fields = ['logged_by', 'timestamp', 'is_anomaly', 'anomaly_reason', 'scored_at']
+    
+    def get_scored(self, obj):
+        return obj.scored_at is not None
 
-class MachineSerializer(serializers.ModelSerializer):
+class RecentReadingsMixin:
+    """Serializes the readings ``MachineViewSet`` prefetches into ``recent_readings``.
+    
+    ``recent_readings`` (newest first) is only included when the request asked
+    for it with ``?readings=N``.
+    """
+    
+    def get_latest_reading(self, obj):
+        if hasattr(obj, 'recent_readings'):
+            latest = obj.recent_readings[0] if obj.recent_readings else None
+        else:
+            latest = obj.readings.first()
+        if latest:
+            return MachineReadingSerializer(latest).data
+        return None
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if self.context.get('include_recent_readings'):
+            data['recent_readings'] = MachineReadingSerializer(instance.recent_readings, many=True).data
+        return data
+
+class MachineSerializer(RecentReadingsMixin, serializers.ModelSerializer):
     days_until_maintenance = serializers.SerializerMethodField()
-    health_status = serializers.SerializerMethodField()
     latest_reading = serializers.SerializerMethodField()
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     
     class Meta:
         model = Machine
-        fields = '__all__'
-        read_only_fields = ['created_by', 'created_at', 'updated_at', 'qr_code']
+        exclude = ['search_vector']
+        read_only_fields = ['created_by', 'created_at', 'updated_at', 'qr_code', 'health_status', 'last_anomaly_at']
     
     def get_days_until_maintenance(self, obj):
         if obj.next_maintenance_date:
             return (obj.next_maintenance_date - timezone.now().date()).days
         return None
     
-    def get_health_status(self, obj):
-        return obj.get_health_status()
-    
-    def get_latest_reading(self, obj):
-        latest = obj.readings.first()
-        if latest:
-            return MachineReadingSerializer(latest).data
-        return None
 
-class MachineListSerializer(serializers.ModelSerializer):
+class MachineListSerializer(RecentReadingsMixin, serializers.ModelSerializer):
     days_until_maintenance = serializers.SerializerMethodField()
-    health_status = serializers.SerializerMethodField()
+    latest_reading = serializers.SerializerMethodField()
     
     class Meta:
         model = Machine
         fields = ['id', 'machine_id', 'machine_name', 'machine_type', 'location', 
-                  'status', 'next_maintenance_date', 'days_until_maintenance', 'health_status']
+                  'status', 'next_maintenance_date', 'days_until_maintenance', 'health_status',
+                  'last_anomaly_at', 'latest_reading']
     
     def get_days_until_maintenance(self, obj):
         if obj.next_maintenance_date:
             return (obj.next_maintenance_date - timezone.now().date()).days
         return None
+
+class BulkMachineReadingSerializer(MachineReadingSerializer):
+    """Validates one row of a bulk upload; the caller resolves ``machine``."""
     
-    def get_health_status(self, obj):
-        return obj.get_health_status()
+    class Meta(MachineReadingSerializer.Meta):
+        read_only_fields = MachineReadingSerializer.Meta.read_only_fields + ['machine']
+
+class MachineReadingRollupSerializer(serializers.ModelSerializer):
+    temperature = serializers.SerializerMethodField()
+    vibration_level = serializers.SerializerMethodField()
+    oil_pressure = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = MachineReadingRollup
+        fields = ['granularity', 'bucket_start', 'reading_count', 'temperature', 'vibration_level', 'oil_pressure']
+    
+    def get_temperature(self, obj):
+        return obj.summary('temperature')
+    
+    def get_vibration_level(self, obj):
+        return obj.summary('vibration_level')
+    
+    def get_oil_pressure(self, obj):
+        return obj.summary('oil_pressure')
+
+class ReadingUploadSerializer(serializers.ModelSerializer):
+    upload_id = serializers.UUIDField(source='id', read_only=True)
+    
+    class Meta:
+        model = ReadingUpload
+        fields = ['upload_id', 'format', 'acknowledged_offset', 'created_count', 'failed_count',
+                  'created_at', 'updated_at']
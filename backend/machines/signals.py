@@ -0,0 +1,12 @@
+from django.dispatch import Signal
+
+# Sent with ``machine_pks`` after health statuses change through a bulk
+# update, which bypasses the model save signals.
+health_changed = Signal()
+
+# Sent with ``anomalies``, a list of ``(machine_pk, reading_pk, timestamp,
+# reason)``, after readings are flagged in bulk.
+anomalies_flagged = Signal()
+
+# Sent with ``readings`` when readings are ingested and queued for scoring.
+readings_ingested = Signal()
@@ -0,0 +1,48 @@
+"""Fleet snapshot: every machine with its health and latest reading, for the dashboard."""
+import hashlib
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+
+MACHINE_FIELDS = ['id', 'machine_id', 'machine_name', 'machine_type', 'location', 'status', 'health_status',
+                  'next_maintenance_date', 'last_anomaly_at']
+READING_FIELDS = ['id', 'timestamp', 'temperature', 'vibration_level', 'oil_pressure', 'runtime_hours',
+                  'is_anomaly', 'anomaly_reason']
+
+def latest_readings(machine_pks):
+    """Return ``{machine_pk: reading}`` for the newest reading of each machine, in one query.
+
+    The lateral join reads one row per machine from the ``(machine, -timestamp)``
+    index instead of sorting every reading as ``DISTINCT ON`` would.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT m.id, {', '.join(f'r.{field}' for field in READING_FIELDS)}
+            FROM unnest(%s::bigint[]) AS m(id)
+            CROSS JOIN LATERAL (
+                SELECT * FROM machine_readings
+                WHERE machine_id = m.id
+                ORDER BY timestamp DESC LIMIT 1
+            ) AS r
+        """, [list(machine_pks)])
+        return {row[0]: dict(zip(READING_FIELDS, row[1:])) for row in cursor.fetchall()}
+
+def build_snapshot(machines):
+    """Add ``days_until_maintenance`` and ``latest_reading`` to machine dicts with ``MACHINE_FIELDS``."""
+    today = timezone.now().date()
+    readings = latest_readings([machine['id'] for machine in machines])
+    return [
+        {
+            **machine,
+            'days_until_maintenance': (machine['next_maintenance_date'] - today).days
+            if machine['next_maintenance_date'] else None,
+            'latest_reading': readings.get(machine['id']),
+        }
+        for machine in machines
+    ]
+
+def snapshot_etag(data):
+    """A strong ETag over the snapshot content."""
+    encoded = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()
+    return f'"{hashlib.sha256(encoded).hexdigest()[:32]}"'
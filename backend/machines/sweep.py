@@ -0,0 +1,110 @@
+"""Fleet-wide anomaly sweep over a window of recent readings.
+
+Live scoring only sees readings as they are ingested, so rows added through
+the admin or by other tools are never scored, and a reading is never looked at
+again once its baseline has moved on. The sweep loads a window of readings for
+every machine, plus the baseline history just before it, into NumPy arrays and
+re-applies the 2-sigma rule to all of them in one vectorized pass.
+
+The sweep only adds flags: readings it finds anomalous are flagged, readings
+already flagged stay flagged. Scoring timestamps, baselines and rollups are
+left to the live pipeline; rollups hold no anomaly counts, so flags do not
+make them stale.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+import numpy as np
+from django.db import connection, transaction
+from .health import record_anomalies
+from .models import MachineReading, MachineReadingStats
+from .signals import anomalies_flagged
+from .utils import flag_anomalies
+
+METRICS = MachineReadingStats.METRICS
+FETCH_SIZE = 50000
+UPDATE_BATCH_SIZE = 20000
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+def load_window(start, end, machine_pks=None):
+    """Return column arrays for the readings in ``[start, end]`` and the baseline history before ``start``.
+    
+    History is each machine's last ``BASELINE_WINDOW`` unflagged readings
+    within ``BASELINE_DAYS`` before ``start``. Rows are sorted by machine and
+    timestamp; ``in_window`` tells the swept rows from the history rows.
+    """
+    history_filter = 'WHERE m.id = ANY(%(machines)s)' if machine_pks is not None else ''
+    window_filter = 'AND machine_id = ANY(%(machines)s)' if machine_pks is not None else ''
+    columns = f"id, machine_id, (EXTRACT(EPOCH FROM timestamp) * 1000000)::bigint, {', '.join(METRICS)}, is_anomaly"
+    params = {
+        'start': start,
+        'end': end,
+        'horizon': start - timedelta(days=MachineReadingStats.BASELINE_DAYS),
+        'window': MachineReadingStats.BASELINE_WINDOW,
+        'machines': list(machine_pks) if machine_pks is not None else None,
+    }
+    
+    names = ['id', 'machine_id', 'micros', *METRICS, 'is_anomaly', 'in_window']
+    dtypes = [np.int64, np.int64, np.int64, *[float] * len(METRICS), bool, bool]
+    chunks = []
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(f"""
+            SELECT * FROM (
+                SELECT history.*, false AS in_window FROM machines m
+                CROSS JOIN LATERAL (
+                    SELECT {columns} FROM machine_readings
+                    WHERE machine_id = m.id AND timestamp >= %(horizon)s AND timestamp < %(start)s
+                      AND NOT is_anomaly
+                    ORDER BY timestamp DESC LIMIT %(window)s
+                ) AS history
+                {history_filter}
+                UNION ALL
+                SELECT {columns}, true FROM machine_readings
+                WHERE timestamp >= %(start)s AND timestamp <= %(end)s {window_filter}
+            ) AS readings
+            ORDER BY 2, 3, 1
+        """, params)
+        while rows := cursor.fetchmany(FETCH_SIZE):
+            # None becomes NaN in the float columns.
+            chunks.append([np.array(column, dtype=dtype) for column, dtype in zip(zip(*rows), dtypes)])
+    
+    return {
+        name: np.concatenate([chunk[i] for chunk in chunks]) if chunks else np.zeros(0, dtype=dtype)
+        for i, (name, dtype) in enumerate(zip(names, dtypes))
+    }
+
+def sweep_anomalies(start, end, machine_pks=None):
+    """Flag anomalous readings between ``start`` and ``end`` that are not flagged yet.
+    
+    Returns ``(readings_swept, readings_flagged)``.
+    """
+    data = load_window(start, end, machine_pks)
+    flags, reasons = flag_anomalies(
+        data['micros'] / 1e6,
+        {metric: data[metric] for metric in METRICS},
+        ~data['is_anomaly'],
+        groups=data['machine_id'],
+    )
+    hits = np.flatnonzero(flags & data['in_window'] & ~data['is_anomaly'])
+    
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for lower in range(0, len(hits), UPDATE_BATCH_SIZE):
+                batch = hits[lower:lower + UPDATE_BATCH_SIZE]
+                cursor.execute("""
+                    UPDATE machine_readings AS r SET is_anomaly = true, anomaly_reason = u.reason
+                    FROM unnest(%s::bigint[], %s::bigint[], %s::text[]) AS u(id, micros, reason)
+                    WHERE r.id = u.id AND r.timestamp = 'epoch'::timestamptz + u.micros * interval '1 microsecond'
+                """, [
+                    data['id'][batch].tolist(),
+                    data['micros'][batch].tolist(),
+                    [reasons[int(i)] for i in batch],
+                ])
+        
+        timestamps = [EPOCH + timedelta(microseconds=micros) for micros in data['micros'][hits].tolist()]
+        machine_pks = data['machine_id'][hits].tolist()
+        # Rows are sorted by timestamp within each machine, so the last hit wins.
+        record_anomalies(dict(zip(machine_pks, timestamps)))
+        anomalies_flagged.send(sender=MachineReading, anomalies=list(zip(
+            machine_pks, data['id'][hits].tolist(), timestamps, [reasons[int(i)] for i in hits]
+        )))
+    
+    return int(data['in_window'].sum()), len(hits)
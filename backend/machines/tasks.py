@@ -0,0 +1,101 @@
+from celery import shared_task
+from datetime import timedelta
+from django.conf import settings
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+from . import fleet
+from .forest import fit_health_model, machines_due_for_refit
+from .health import record_anomalies, refresh_health_statuses
+from .models import MachineReading, MachineReadingStats
+from .rollups import purge_rollups, update_rollups
+from .signals import anomalies_flagged, readings_ingested
+from .utils import detect_anomalies_bulk
+
+@shared_task
+def score_readings(reading_ids):
+    """Flag anomalies for freshly ingested readings and fold them into rollups.
+    
+    Readings are scored in timestamp order against their machines' running
+    baselines. Already scored readings and readings locked by another worker
+    are skipped, so redelivered or duplicate tasks are harmless.
+    """
+    with transaction.atomic():
+        readings = list(
+            MachineReading.objects.select_for_update(skip_locked=True)
+            .filter(pk__in=reading_ids, scored_at__isnull=True)
+            .order_by('timestamp', 'pk')
+        )
+        if not readings:
+            return 0
+        
+        verdicts = detect_anomalies_bulk([
+            (reading.machine_id, {metric: getattr(reading, metric) for metric in MachineReadingStats.METRICS})
+            for reading in readings
+        ], exclude_pks=[reading.pk for reading in readings])
+        
+        flagged = []
+        for reading, (is_anomaly, anomaly_reason) in zip(readings, verdicts):
+            if is_anomaly:
+                reading.is_anomaly = True
+                reading.anomaly_reason = anomaly_reason
+                flagged.append(reading)
+        
+        MachineReading.objects.bulk_update(flagged, ['is_anomaly', 'anomaly_reason'], batch_size=1000)
+        record_anomalies({reading.machine_id: reading.timestamp for reading in flagged})
+        anomalies_flagged.send(sender=MachineReading, anomalies=[
+            (reading.machine_id, reading.pk, reading.timestamp, reading.anomaly_reason) for reading in flagged
+        ])
+        MachineReading.objects.filter(pk__in=[reading.pk for reading in readings]).update(scored_at=timezone.now())
+        update_rollups(readings)
+    
+    return len(readings)
+
+def enqueue_scoring(readings):
+    """Schedule scoring for ``readings`` once the current transaction commits."""
+    reading_ids = [reading.pk for reading in readings]
+    if reading_ids:
+        transaction.on_commit(lambda: score_readings.delay(reading_ids))
+        readings_ingested.send(sender=MachineReading, readings=readings)
+
+@shared_task
+def manage_reading_partitions():
+    """Daily: create upcoming reading partitions and apply the retention policy."""
+    call_command('manage_reading_partitions')
+
+@shared_task
+def purge_minute_rollups():
+    """Daily: drop minute rollups older than ``ROLLUP_MINUTE_RETENTION_DAYS``."""
+    return purge_rollups('minute', timezone.now() - timedelta(days=settings.ROLLUP_MINUTE_RETENTION_DAYS))
+
+@shared_task
+def refresh_machine_health():
+    """Daily, just after midnight: move health statuses across maintenance due dates."""
+    return refresh_health_statuses()
+
+@shared_task
+def refit_health_model(machine_pk):
+    health_model = fit_health_model(machine_pk)
+    return health_model.version if health_model else None
+
+@shared_task
+def refit_health_models():
+    """Every 15 minutes: queue a refit for each machine whose health model is due."""
+    machine_pks = machines_due_for_refit()
+    for machine_pk in machine_pks:
+        refit_health_model.delay(machine_pk)
+    return len(machine_pks)
+
+@shared_task
+def score_fleet():
+    """Nightly: refit every health model and store fleet health scores.
+    
+    Runs in the worker process: Celery's prefork workers are daemonic and may
+    not start a process pool. ``manage.py score_fleet`` uses every core.
+    """
+    return fleet.score_fleet(workers=1)
+
+@shared_task
+def sweep_anomalies():
+    """Hourly: flag anomalies among the last ``ANOMALY_SWEEP_HOURS`` of readings that live scoring missed."""
+    call_command('sweep_anomalies')
@@ -1,3 +1,1075 @@
-from django.test import TestCase
+import csv
+import json
+import random
+import tempfile
+import tracemalloc
+import uuid
+from unittest import mock
+from io import StringIO
+from datetime import date, timedelta
+import numpy as np
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from authentication.models import CustomUser
+from factory_maintenance.testing import create_machine
+from maintenance.models import SparePart, WorkOrder
+from . import partitions, tasks
+from .fleet import score_fleet
+from .forest import fit_health_model, machines_due_for_refit
+from .health import record_anomalies, refresh_health_statuses
+from .ingest import ingest_stream
+from .isolation import fit_and_score, score_latest
+from .sweep import sweep_anomalies
+from .models import (Machine, MachineHealthModel, MachineHealthScore, MachineReading, MachineReadingRollup,
+                     MachineReadingStats, ReadingUpload)
+from .tasks import refit_health_models, score_readings
+from .timeseries import MAX_RAW_ROWS, aggregated_series, build_series, lttb
+from .utils import detect_anomaly, flag_anomalies, score_reading
 
-# Create your tests here.
+
+def legacy_detect_anomaly(machine, new_reading):
+    """The original z-score rule: scan the last 50 clean readings on every call."""
+    recent = list(machine.readings.filter(
+        timestamp__gte=timezone.now() - timedelta(days=30),
+        is_anomaly=False
+    ).order_by('-timestamp')[:50])
+    if len(recent) < 3:
+        return False
+    for metric in MachineReadingStats.METRICS:
+        value = new_reading.get(metric)
+        history = [getattr(r, metric) for r in recent if getattr(r, metric)]
+        if value and history and abs(value - np.mean(history)) > 2 * np.std(history):
+            return True
+    return False
+
+
+class ReadingStatsTests(TestCase):
+    def setUp(self):
+        self.machine = create_machine()
+
+    def log(self, reading):
+        is_anomaly, reason = detect_anomaly(self.machine, reading)
+        MachineReading.objects.create(machine=self.machine, is_anomaly=is_anomaly, anomaly_reason=reason, **reading)
+        return is_anomaly
+
+    def random_reading(self, rng):
+        return {
+            'temperature': rng.gauss(70, 3),
+            'vibration_level': rng.choice([None, rng.gauss(2, 0.4)]),
+            'oil_pressure': rng.gauss(45, 2) if rng.random() > 0.1 else None,
+        }
+
+    def test_verdicts_match_legacy_rule(self):
+        rng = random.Random(3)
+        flagged = 0
+        for _ in range(200):
+            reading = self.random_reading(rng)
+            expected = legacy_detect_anomaly(self.machine, reading)
+            self.assertEqual(self.log(reading), expected)
+            flagged += expected
+        self.assertTrue(0 < flagged < 200)
+
+    def test_running_moments_match_window(self):
+        rng = random.Random(5)
+        stats = MachineReadingStats(machine=self.machine)
+        for _ in range(137):
+            stats.push(timezone.now(), self.random_reading(rng))
+
+        self.assertEqual(len(stats.window), MachineReadingStats.BASELINE_WINDOW)
+        for index, metric in enumerate(MachineReadingStats.METRICS, start=1):
+            values = [entry[index] for entry in stats.window if entry[index]]
+            count, mean, std = stats.baseline(metric)
+            self.assertEqual(count, len(values))
+            self.assertAlmostEqual(mean, np.mean(values), places=9)
+            self.assertAlmostEqual(std, np.std(values), places=9)
+
+    def test_flat_baseline_does_not_flag_same_value(self):
+        for _ in range(80):
+            self.assertFalse(self.log({'temperature': 70.1, 'vibration_level': 2.3, 'oil_pressure': 45.7}))
+
+    def test_expired_readings_leave_the_baseline(self):
+        rng = random.Random(9)
+        for _ in range(10):
+            self.log(self.random_reading(rng))
+        MachineReading.objects.update(timestamp=timezone.now() - timedelta(days=31))
+        MachineReadingStats.objects.all().delete()
+        call_command('rebuild_reading_stats', stdout=StringIO())
+
+        stats = MachineReadingStats.objects.get(machine=self.machine)
+        self.assertEqual(stats.window, [])
+        self.assertEqual(self.log({'temperature': 500}), False)
+
+    def test_rebuild_matches_incremental_state(self):
+        rng = random.Random(11)
+        for _ in range(75):
+            self.log(self.random_reading(rng))
+        incremental = MachineReadingStats.objects.get(machine=self.machine)
+
+        call_command('rebuild_reading_stats', 'CNC-001', stdout=StringIO())
+        rebuilt = MachineReadingStats.objects.get(machine=self.machine)
+
+        self.assertEqual(len(rebuilt.window), len(incremental.window))
+        for metric in MachineReadingStats.METRICS:
+            for expected, actual in zip(incremental.baseline(metric), rebuilt.baseline(metric)):
+                self.assertAlmostEqual(expected, actual, places=6)
+
+
+class ScoringPipelineTests(TestCase):
+    def setUp(self):
+        self.machine = create_machine()
+        self.user = CustomUser.objects.create_user(username='tech', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_ingest_returns_before_scoring_and_task_flags_anomalies(self):
+        readings = [{'machine_id': 'CNC-001', 'temperature': 70 + i % 3} for i in range(10)]
+        readings.append({'machine_id': 'CNC-001', 'temperature': 150})
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/readings/bulk/', {'readings': readings}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(all(r['scored_at'] is None for r in response.json()['readings']))
+        self.assertFalse(MachineReading.objects.filter(scored_at__isnull=False).exists())
+
+        for callback in callbacks:
+            callback()
+
+        self.assertFalse(MachineReading.objects.filter(scored_at__isnull=True).exists())
+        flagged = MachineReading.objects.get(is_anomaly=True)
+        self.assertEqual(flagged.temperature, 150)
+        self.assertIn('Temperature anomaly', flagged.anomaly_reason)
+
+        lag = self.client.get('/api/readings/scoring-lag/').json()
+        self.assertEqual((lag['scored'], lag['pending']), (11, 0))
+        self.assertGreaterEqual(lag['lag_seconds']['max'], 0)
+
+    def test_logged_reading_is_marked_unscored_until_scoring_runs(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/readings/log/', {'machine_id': 'CNC-001', 'temperature': 70},
+                                        format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['scored'], response.json()['scored_at']), (False, None))
+
+        self.assertTrue(self.client.get(f"/api/readings/{response.json()['id']}/").json()['scored'])
+
+    def test_first_scoring_does_not_count_the_batch_twice(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/readings/bulk/', {'readings': [
+                {'machine_id': 'CNC-001', 'temperature': 70 + index} for index in range(3)
+            ]}, format='json')
+        self.assertEqual(len(MachineReadingStats.objects.get(machine=self.machine).window), 3)
+
+    def test_rescoring_is_a_no_op(self):
+        reading = MachineReading.objects.create(machine=self.machine, temperature=70)
+        self.assertEqual(score_readings([reading.pk]), 1)
+        self.assertEqual(score_readings([reading.pk]), 0)
+
+
+class BulkIngestTests(TestCase):
+    def setUp(self):
+        self.machine = create_machine()
+        self.other = create_machine('CNC-002')
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+
+    def bulk(self, readings):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/readings/bulk/', {'readings': readings}, format='json')
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        counts = []
+        for size in (5, 50):
+            readings = [{'machine_id': code, 'temperature': 70} for code in ['CNC-001', 'CNC-002'] * size]
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks():
+                response = self.client.post('/api/readings/bulk/', {'readings': readings}, format='json')
+            self.assertEqual(response.json()['created'], 2 * size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_rejected_rows_are_reported_by_index(self):
+        response = self.bulk([
+            {'machine_id': 'CNC-001', 'temperature': 70},
+            {'machine_id': 'NOPE-1', 'temperature': 70},
+            'not a reading',
+            {'machine_id': 'CNC-002', 'temperature': 'hot'},
+            {'machine_id': 'CNC-002', 'temperature': 71},
+        ])
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual((data['created'], data['failed']), (2, 3))
+        self.assertEqual([(error['index'], error['machine_id']) for error in data['errors']],
+                         [(1, 'NOPE-1'), (2, None), (3, 'CNC-002')])
+        self.assertEqual(data['errors'][0]['error'], 'Machine not found')
+        self.assertIn('temperature', data['errors'][2]['errors'])
+        self.assertEqual(MachineReading.objects.count(), 2)
+
+    def test_a_batch_of_unknown_machines_creates_nothing(self):
+        response = self.bulk([{'machine_id': 'NOPE-1', 'temperature': 70}, {'temperature': 70}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['failed'], 2)
+        self.assertFalse(MachineReading.objects.exists())
+
+    def test_verdicts_match_one_by_one_ingestion(self):
+        rng = random.Random(7)
+        values = [{'temperature': rng.gauss(70, 2), 'oil_pressure': rng.gauss(45, 1)} for _ in range(40)]
+        values[25]['temperature'] = 150
+        values[33]['oil_pressure'] = 5
+
+        for value in values:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/api/readings/log/', {'machine_id': 'CNC-001', **value}, format='json')
+        self.bulk([{'machine_id': 'CNC-002', **value} for value in values])
+
+        one_by_one = list(self.machine.readings.order_by('pk').values_list('is_anomaly', flat=True))
+        batched = list(self.other.readings.order_by('pk').values_list('is_anomaly', flat=True))
+        self.assertEqual(batched, one_by_one)
+        self.assertTrue(one_by_one[25] and one_by_one[33])
+
+
+class ReadingPartitionTests(TestCase):
+    def setUp(self):
+        self.machine = create_machine()
+
+    def test_command_creates_upcoming_partitions(self):
+        call_command('manage_reading_partitions', '--months-ahead', '2', stdout=StringIO())
+        current = partitions.month_start(timezone.now())
+        expected = {partitions.add_months(current, offset) for offset in range(3)}
+        self.assertTrue(expected <= partitions.list_partitions().keys())
+
+    def test_new_partition_takes_over_rows_from_default(self):
+        month = partitions.add_months(partitions.month_start(timezone.now()), 24)
+        reading = MachineReading.objects.create(machine=self.machine, temperature=70)
+        MachineReading.objects.filter(pk=reading.pk).update(timestamp=month + timedelta(days=3))
+
+        name = partitions.create_partition(month)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM machine_readings WHERE id = %s', [reading.pk])
+            self.assertEqual(cursor.fetchone()[0], name)
+        self.assertEqual(MachineReading.objects.get(pk=reading.pk).temperature, 70)
+
+    def test_expiring_a_partition_keeps_its_rollups(self):
+        month = partitions.add_months(partitions.month_start(timezone.now()), -24)
+        if month not in partitions.list_partitions():
+            partitions.create_partition(month)
+        reading = MachineReading.objects.create(machine=self.machine, temperature=70)
+        MachineReading.objects.filter(pk=reading.pk).update(timestamp=month + timedelta(days=3))
+        score_readings([reading.pk])
+        self.assertEqual(MachineReadingRollup.objects.count(), 3)
+
+        call_command('manage_reading_partitions', '--retention-months', '12', '--detach', stdout=StringIO())
+
+        self.assertFalse(MachineReading.objects.exists())
+        self.assertEqual(MachineReadingRollup.objects.count(), 3)
+        resolution, _, data = build_series(self.machine, 'temperature', month, partitions.add_months(month, 1), 100)
+        self.assertEqual(resolution, 'hour_aggregate')
+        self.assertEqual([point['value'] for point in data], [70])
+
+
+class ReadingRollupTests(TestCase):
+    def setUp(self):
+        self.machine = create_machine()
+
+    def add_readings(self, values):
+        readings = MachineReading.objects.bulk_create([
+            MachineReading(machine=self.machine, temperature=t, vibration_level=v) for t, v in values
+        ])
+        score_readings([reading.pk for reading in readings])
+
+    def snapshot(self):
+        return {
+            (r.granularity, r.bucket_start): (r.reading_count, r.summary('temperature'), r.summary('vibration_level'))
+            for r in MachineReadingRollup.objects.all()
+        }
+
+    def test_incremental_rollups_match_rebuild(self):
+        rng = random.Random(2)
+        for _ in range(3):
+            self.add_readings([(rng.gauss(70, 3), rng.choice([None, rng.gauss(2, 0.3)])) for _ in range(20)])
+        incremental = self.snapshot()
+
+        call_command('rebuild_reading_rollups', stdout=StringIO())
+        rebuilt = self.snapshot()
+
+        self.assertEqual(incremental.keys(), rebuilt.keys())
+        for key, (count, temperature, vibration) in incremental.items():
+            self.assertEqual(count, rebuilt[key][0])
+            for summary, expected in ((temperature, rebuilt[key][1]), (vibration, rebuilt[key][2])):
+                self.assertEqual(summary['count'], expected['count'])
+                self.assertEqual((summary['min'], summary['max']), (expected['min'], expected['max']))
+                if summary['count']:
+                    self.assertAlmostEqual(summary['mean'], expected['mean'], places=6)
+                    self.assertAlmostEqual(summary['stddev'], expected['stddev'], places=4)
+
+        day = MachineReadingRollup.objects.get(granularity='day')
+        self.assertEqual(day.reading_count, 60)
+
+    def test_editing_and_deleting_readings_rebuild_their_buckets(self):
+        self.add_readings([(70, 2.0), (72, 2.1), (74, None)])
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+        first, second, _ = self.machine.readings.order_by('pk')
+
+        self.assertEqual(client.patch(f'/api/readings/{first.pk}/', {'temperature': 90}, format='json').status_code, 200)
+        self.assertEqual(client.delete(f'/api/readings/{second.pk}/').status_code, 204)
+
+        day = MachineReadingRollup.objects.get(granularity='day')
+        self.assertEqual(day.reading_count, 2)
+        self.assertEqual((day.temperature_max, day.vibration_level_count), (90, 1))
+        incremental = self.snapshot()
+        call_command('rebuild_reading_rollups', stdout=StringIO())
+        self.assertEqual(incremental, self.snapshot())
+        self.assertEqual(timezone.localtime(day.bucket_start).hour, 0)
+        self.assertEqual(timezone.localtime(day.bucket_start).utcoffset(), timedelta(hours=5, minutes=30))
+
+
+class SeriesTests(TestCase):
+    def setUp(self):
+        self.machine = create_machine()
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+
+    def insert_history(self, count, spacing_seconds):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO machine_readings
+                    (machine_id, timestamp, temperature, custom_readings, notes, is_anomaly, anomaly_reason)
+                SELECT %s, NOW() - make_interval(secs => g * %s), 70 + 5 * sin(g / 50.0), '{}', '', false, ''
+                FROM generate_series(1, %s) AS g
+            """, [self.machine.pk, spacing_seconds, count])
+
+    def test_aggregates_never_exceed_the_requested_points(self):
+        self.insert_history(5000, 60)
+        call_command('rebuild_reading_rollups', stdout=StringIO())
+        end = self.machine.readings.latest('timestamp').timestamp + timedelta(seconds=1)
+        for points in (7, 33, 100):
+            # A range of exactly ``points`` buckets, whatever its alignment.
+            start = end - timedelta(seconds=points * 2593)
+            source, _, data = aggregated_series(self.machine, 'temperature', start, end, points)
+            self.assertEqual(source, 'minute')
+            self.assertLessEqual(len(data), points)
+
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        x = np.arange(1000, dtype=float)
+        y = np.zeros(1000)
+        y[437] = 50
+        keep = lttb(x, y, 50)
+        self.assertEqual(len(keep), 50)
+        self.assertEqual((keep[0], keep[-1]), (0, 999))
+        self.assertIn(437, keep)
+        self.assertTrue(np.all(np.diff(keep) > 0))
+
+    def test_fine_range_is_downsampled_with_lttb(self):
+        self.insert_history(2000, 30)
+        response = self.client.get(f'/api/machines/{self.machine.pk}/series/?metric=temperature&points=200')
+        body = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body['resolution'], 'lttb')
+        self.assertEqual(len(body['points']), 200)
+
+    def test_coarse_range_is_aggregated_from_rollups(self):
+        self.insert_history(MAX_RAW_ROWS + 1000, 60)
+        call_command('rebuild_reading_rollups', stdout=StringIO())
+        start = (timezone.now() - timedelta(days=20)).date().isoformat()
+
+        response = self.client.get(f'/api/machines/{self.machine.pk}/series/?from={start}&points=100')
+        body = response.json()
+        self.assertEqual(body['resolution'], 'hour_aggregate')
+        self.assertLessEqual(len(body['points']), 100)
+        self.assertEqual(sum(p['count'] for p in body['points']), MAX_RAW_ROWS + 1000)
+
+
+@mock.patch('machines.ingest.STREAM_CHUNK_SIZE', 3)
+class StreamingIngestTests(TestCase):
+    def setUp(self):
+        create_machine()
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+        self.lines = [
+            '{"machine_id": "CNC-001", "temperature": 70.5}',
+            '{"machine_id": "CNC-001", "temperature": 71.0, "oil_pressure": 45}',
+            '{"machine_id": "CNC-001", "temperature"',
+            '{"machine_id": "CNC-001", "vibration_level": 2.1}',
+            '{"machine_id": "MISSING", "temperature": 70}',
+            '{"machine_id": "CNC-001", "temperature": 72.2}',
+            '{"machine_id": "CNC-001", "temperature": 69.8}',
+        ]
+
+    def upload(self, lines, content_type='application/x-ndjson', **params):
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        body = '\n'.join(lines) + '\n'
+        return self.client.post(f'/api/readings/stream/?{query}', data=body.encode(), content_type=content_type)
+
+    def acks(self, response):
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_ndjson_is_committed_and_acknowledged_per_chunk(self):
+        response = self.upload(self.lines)
+        self.assertEqual(response.status_code, 200)
+        head, *chunks, done = self.acks(response)
+
+        self.assertEqual(head['acknowledged_offset'], 0)
+        self.assertEqual([chunk['offset'] for chunk in chunks], [3, 6, 7])
+        self.assertEqual([error['index'] for chunk in chunks for error in chunk['errors']], [2, 4])
+        self.assertEqual((done['done'], done['acknowledged_offset'], done['created'], done['failed']), (True, 7, 5, 2))
+        self.assertEqual(MachineReading.objects.count(), 5)
+
+        status = self.client.get(f"/api/readings/stream/{head['upload_id']}/").json()
+        self.assertEqual((status['acknowledged_offset'], status['created_count']), (7, 5))
+
+    def test_upload_id_is_sent_before_the_body_is_read(self):
+        response = self.upload(self.lines)
+        lines = iter(response.streaming_content)
+
+        head = json.loads(next(lines))
+        self.assertTrue(ReadingUpload.objects.filter(pk=head['upload_id'], acknowledged_offset=0).exists())
+        self.assertFalse(MachineReading.objects.exists())
+
+        self.assertEqual(json.loads(next(lines))['offset'], 3)
+        self.assertEqual(MachineReading.objects.count(), 2)
+
+    def test_resume_skips_acknowledged_rows(self):
+        upload_id = uuid.uuid4()
+        self.acks(self.upload(self.lines[:4], upload_id=upload_id))
+        self.assertEqual(ReadingUpload.objects.get(pk=upload_id).acknowledged_offset, 4)
+
+        done = self.acks(self.upload(self.lines[2:], upload_id=upload_id, offset=2))[-1]
+        self.assertEqual(done['acknowledged_offset'], 7)
+        self.assertEqual(MachineReading.objects.count(), 5)
+
+        gap = self.upload(self.lines, upload_id=upload_id, offset=8)
+        self.assertEqual(gap.status_code, 409)
+        self.assertEqual(gap.json()['acknowledged_offset'], 7)
+
+    def test_negative_offsets_are_rejected(self):
+        upload_id = uuid.uuid4()
+        self.acks(self.upload(self.lines[:4], upload_id=upload_id))
+
+        response = self.upload(self.lines[4:], upload_id=upload_id, offset=-2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ReadingUpload.objects.get(pk=upload_id).acknowledged_offset, 4)
+        with self.assertRaises(ValueError):
+            next(ingest_stream(ReadingUpload.objects.get(pk=upload_id), iter([]), -2, None))
+
+    def test_csv_upload(self):
+        lines = ['machine_id,temperature,vibration_level,oil_pressure', 'CNC-001,70.1,,44', 'CNC-001,71.3,2.2,']
+        response = self.upload(lines, content_type='text/csv')
+
+        self.assertEqual(self.acks(response)[-1]['created'], 2)
+        reading = MachineReading.objects.get(temperature=70.1)
+        self.assertEqual((reading.vibration_level, reading.oil_pressure), (None, 44))
+
+
+class ImportReadingsTests(TestCase):
+    def setUp(self):
+        self.machine = create_machine()
+
+    def history(self, count, rng):
+        start = timezone.now() - timedelta(days=400)
+        return [
+            (start + timedelta(hours=i), rng.gauss(70, 3), rng.choice([None, rng.gauss(2, 0.3)]), rng.gauss(45, 2))
+            for i in range(count)
+        ]
+
+    def test_vectorized_rule_reproduces_live_verdicts(self):
+        rows = self.history(1500, random.Random(4))
+        stats = MachineReadingStats(machine=self.machine, window=[])
+        verdicts = []
+        for timestamp, *values in rows:
+            reading = dict(zip(MachineReadingStats.METRICS, values))
+            stats.expire(timestamp)
+            is_anomaly, _ = score_reading(stats, reading)
+            if not is_anomaly:
+                stats.push(timestamp, reading)
+            verdicts.append(is_anomaly)
+
+        epochs = np.array([row[0].timestamp() for row in rows])
+        values = {
+            metric: np.array([row[index] for row in rows], dtype=float)
+            for index, metric in enumerate(MachineReadingStats.METRICS, start=1)
+        }
+        flags, reasons = flag_anomalies(epochs, values, ~np.array(verdicts))
+        self.assertEqual(flags.tolist(), verdicts)
+        self.assertEqual(sorted(reasons), np.flatnonzero(flags).tolist())
+
+    def test_import_copies_rows_and_flags_anomalies(self):
+        rows = self.history(200, random.Random(8))
+        rows[150] = (rows[150][0], 150.0, None, 45.0)
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(['machine_id', 'timestamp', 'temperature', 'vibration_level', 'oil_pressure'])
+            writer.writerows([('CNC-001', t.isoformat(), *(v if v is not None else '' for v in values))
+                              for t, *values in rows])
+            writer.writerow(['UNKNOWN', rows[0][0].isoformat(), 70, '', ''])
+            handle.flush()
+            call_command('import_readings', handle.name, stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(MachineReading.objects.count(), 200)
+        spike = MachineReading.objects.get(temperature=150)
+        self.assertTrue(spike.is_anomaly)
+        self.assertIn('Temperature anomaly', spike.anomaly_reason)
+        self.assertFalse(MachineReading.objects.filter(scored_at__isnull=True).exists())
+        self.assertEqual(
+            sum(r.reading_count for r in MachineReadingRollup.objects.filter(granularity='day')), 200
+        )
+
+    def test_import_creates_partitions_before_copying_into_them(self):
+        first = partitions.add_months(partitions.month_start(timezone.now()), -30)
+        months = [partitions.add_months(first, offset) for offset in (0, 1, 0, 2, 1)]
+        stdout = StringIO()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(['machine_id', 'timestamp', 'temperature'])
+            writer.writerows([('CNC-001', (month + timedelta(days=day)).isoformat(), 70)
+                              for month in months for day in range(3)])
+            handle.flush()
+            call_command('import_readings', handle.name, '--skip-anomalies', stdout=stdout, stderr=StringIO())
+
+        self.assertEqual(stdout.getvalue().count('Created partition'), 3)
+        self.assertTrue(set(months) <= partitions.list_partitions().keys())
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {partitions.DEFAULT_PARTITION}')
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(MachineReading.objects.count(), 15)
+
+
+class GenerateFactoryTests(TestCase):
+    def generate(self, *args):
+        call_command('generate_factory', '--machines', '6', '--readings-per-machine', '400', '--parts', '16',
+                     '--end', '2026-10-01T00:00', *args, stdout=StringIO())
+
+    def schema(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'machine_readings'")
+            indexes = {row[0] for row in cursor.fetchall()}
+            cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = 'machine_readings'::regclass")
+            return indexes | {row[0] for row in cursor.fetchall()}
+
+    def test_generates_readings_parts_and_work_orders(self):
+        schema = self.schema()
+        self.generate('--fault-rate', '1', '--work-orders', '30', '--drop-indexes')
+        self.assertEqual(self.schema(), schema)
+
+        self.assertEqual(Machine.objects.count(), 6)
+        readings = MachineReading.objects.filter(machine__machine_id='GEN-CNC-00000').order_by('timestamp')
+        self.assertEqual(readings.count(), 400)
+        first, last = readings.first(), readings.last()
+        self.assertEqual(last.timestamp - first.timestamp, timedelta(minutes=15 * 399))
+        self.assertLess(abs(first.temperature - 68), 10)
+        self.assertEqual(first.scored_at, first.timestamp)
+        anomalies = MachineReading.objects.filter(is_anomaly=True)
+        self.assertTrue(anomalies.exists())
+        self.assertFalse(anomalies.filter(anomaly_reason='').exists())
+        self.assertFalse(MachineReading.objects.filter(is_anomaly=False).exclude(anomaly_reason='').exists())
+        self.assertEqual(MachineReadingStats.objects.count(), 6)
+
+        self.assertEqual(WorkOrder.objects.count(), 30)
+        # Every machine has a fault, and each fault a corrective work order.
+        self.assertEqual(WorkOrder.objects.filter(priority__in=['HIGH', 'CRITICAL']).count(), 6)
+        self.assertEqual(WorkOrder.objects.filter(status='PENDING').count(), 6)
+        for order in WorkOrder.objects.filter(status='COMPLETED').prefetch_related('parts_used__spare_part'):
+            self.assertEqual(order.parts_cost, sum(usage.spare_part.unit_cost * usage.quantity_used
+                                                   for usage in order.parts_used.all()))
+            for usage in order.parts_used.all():
+                self.assertIn(order.machine, usage.spare_part.compatible_machines.all())
+
+    def test_output_depends_only_on_seed(self):
+        self.generate('--prefix', 'ONE', '--skip-derived')
+        self.generate('--prefix', 'TWO', '--skip-derived')
+        self.generate('--prefix', 'NEW', '--seed', '7', '--skip-derived')
+
+        def temperatures(prefix):
+            return list(MachineReading.objects.filter(machine__machine_id__startswith=prefix)
+                        .order_by('machine__machine_id', 'timestamp').values_list('temperature', flat=True))
+
+        self.assertEqual(temperatures('ONE-'), temperatures('TWO-'))
+        self.assertNotEqual(temperatures('ONE-'), temperatures('NEW-'))
+        with self.assertRaises(CommandError):
+            self.generate('--prefix', 'ONE')
+
+
+class HealthStatusTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+
+    def make_machine(self, code, days_until=None):
+        return create_machine(
+            code, machine_name=code,
+            next_maintenance_date=None if days_until is None else timezone.localdate() + timedelta(days=days_until),
+        )
+
+    def test_status_follows_maintenance_dates_and_anomalies(self):
+        machine = self.make_machine('CNC-001', days_until=20)
+        self.assertEqual(machine.health_status, 'GREEN')
+
+        machine.last_maintenance_date = timezone.localdate() - timedelta(days=25)
+        machine.save(update_fields=['last_maintenance_date'])
+        machine.calculate_next_maintenance()
+        self.assertEqual(Machine.objects.get(pk=machine.pk).health_status, 'YELLOW')
+
+        for value in [70, 71, 70, 71, 70, 150]:
+            score_readings([MachineReading.objects.create(machine=machine, temperature=value).pk])
+        machine.refresh_from_db()
+        self.assertEqual(machine.health_status, 'CRITICAL')
+        self.assertIsNotNone(machine.last_anomaly_at)
+
+    def test_saving_other_fields_writes_a_changed_status(self):
+        machine = self.make_machine('CNC-001', days_until=20)
+        Machine.objects.filter(pk=machine.pk).update(next_maintenance_date=timezone.localdate() - timedelta(days=1))
+        machine = Machine.objects.get(pk=machine.pk)
+
+        machine.status = 'DOWN'
+        machine.save(update_fields=['status'])
+        self.assertEqual(Machine.objects.get(pk=machine.pk).health_status, 'RED')
+
+    def test_deleting_anomalies_moves_last_anomaly_at_back(self):
+        machine = self.make_machine('CNC-001', days_until=20)
+        older, newer = [
+            MachineReading.objects.create(machine=machine, temperature=150, is_anomaly=True) for _ in range(2)
+        ]
+        MachineReading.objects.filter(pk=older.pk).update(timestamp=timezone.now() - timedelta(days=10))
+        record_anomalies({machine.pk: newer.timestamp})
+        self.assertEqual(Machine.objects.get(pk=machine.pk).health_status, 'CRITICAL')
+
+        self.assertEqual(self.client.delete(f'/api/readings/{newer.pk}/').status_code, 204)
+        machine.refresh_from_db()
+        self.assertEqual(machine.last_anomaly_at, MachineReading.objects.get(pk=older.pk).timestamp)
+        self.assertEqual(machine.health_status, 'GREEN')
+
+        self.client.delete(f'/api/readings/{older.pk}/')
+        self.assertIsNone(Machine.objects.get(pk=machine.pk).last_anomaly_at)
+
+    def test_daily_refresh_moves_statuses_across_due_dates(self):
+        machine = self.make_machine('CNC-001', days_until=3)
+        self.make_machine('CNC-002')
+
+        self.assertEqual(refresh_health_statuses(), 0)
+        self.assertEqual(refresh_health_statuses(now=timezone.now() + timedelta(days=5)), 1)
+        self.assertEqual(Machine.objects.get(pk=machine.pk).health_status, 'RED')
+
+    def test_list_filters_and_sorts_by_health_without_per_row_queries(self):
+        for index, days_until in enumerate([30, -2, 5, None, 40]):
+            self.make_machine(f'CNC-00{index}', days_until)
+        Machine.objects.filter(machine_id='CNC-004').update(last_anomaly_at=timezone.now())
+        refresh_health_statuses()
+
+        # Count, page and the latest-reading prefetch, whatever the fleet size.
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/machines/?ordering=health_rank')
+        statuses = [m['health_status'] for m in response.json()['results']]
+        self.assertEqual(statuses, ['CRITICAL', 'RED', 'YELLOW', 'GREEN', 'UNKNOWN'])
+
+        red = self.client.get('/api/machines/?health_status=RED').json()
+        self.assertEqual([m['machine_id'] for m in red['results']], ['CNC-001'])
+
+        summary = self.client.get('/api/machines/dashboard/').json()['summary']
+        self.assertEqual(summary['health_status'], {'CRITICAL': 1, 'RED': 1, 'YELLOW': 1, 'GREEN': 1, 'UNKNOWN': 1})
+
+
+class HealthModelTests(TestCase):
+    def setUp(self):
+        self.machine = create_machine()
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+
+    def add_readings(self, count, rng):
+        MachineReading.objects.bulk_create([
+            MachineReading(machine=self.machine, temperature=rng.gauss(70, 2), vibration_level=rng.gauss(2, 0.2))
+            for _ in range(count)
+        ])
+
+    def test_endpoint_scores_with_the_stored_model(self):
+        url = f'/api/machines/{self.machine.pk}/health-score/'
+        self.add_readings(5, random.Random(1))
+        self.assertEqual(self.client.get(url).json()['status'], 'INSUFFICIENT_DATA')
+
+        self.add_readings(40, random.Random(2))
+        pending = self.client.get(url).json()
+        self.assertEqual(pending['status'], 'MODEL_PENDING')
+        self.assertTrue(MachineHealthModel.objects.filter(machine=self.machine).exists())
+
+        with mock.patch('sklearn.ensemble.IsolationForest.fit') as fit:
+            body = self.client.get(url).json()
+        fit.assert_not_called()
+        self.assertTrue(0 <= body['health_score'] <= 100)
+        self.assertEqual((body['model']['version'], body['model']['training_rows']), (1, 45))
+        self.assertEqual(body['readings_analyzed'], 45)
+        stored = MachineHealthModel.objects.get(machine=self.machine)
+        self.assertEqual((body['trend'], body['anomalies_detected']), (stored.trend, stored.anomalies_detected))
+
+        # Only the newest reading is loaded and scored.
+        with CaptureQueriesContext(connection) as queries, \
+                mock.patch('machines.views.score_latest', wraps=score_latest) as scored:
+            self.client.get(url)
+        self.assertEqual(len(scored.call_args.args[3]), 1)
+        reading_queries = [query['sql'] for query in queries if 'FROM "machine_readings"' in query['sql']]
+        self.assertEqual(len(reading_queries), 1)
+        self.assertIn('LIMIT 1', reading_queries[0])
+
+    @override_settings(HEALTH_MODEL_REFIT_READINGS=20)
+    def test_refit_after_enough_new_readings(self):
+        rng = random.Random(3)
+        self.add_readings(30, rng)
+        self.assertEqual(machines_due_for_refit(), [self.machine.pk])
+
+        fit_health_model(self.machine.pk)
+        self.assertEqual(machines_due_for_refit(), [])
+
+        self.add_readings(20, rng)
+        self.assertEqual(machines_due_for_refit(), [self.machine.pk])
+        self.assertEqual(refit_health_models(), 1)
+        self.assertEqual(MachineHealthModel.objects.get(machine=self.machine).version, 2)
+
+
+class FleetScoringTests(TestCase):
+    def setUp(self):
+        rng = random.Random(4)
+        self.machines = []
+        for index, spread in enumerate([0.1, 0.1, 5.0]):
+            machine = create_machine(f'CNC-{index}')
+            MachineReading.objects.bulk_create([
+                MachineReading(machine=machine, temperature=rng.gauss(70, spread), vibration_level=rng.gauss(2, 0.2))
+                for _ in range(30)
+            ])
+            self.machines.append(machine)
+        quiet = create_machine('CNC-Q')
+        MachineReading.objects.create(machine=quiet, temperature=70)
+
+    def test_scores_match_the_per_machine_endpoint(self):
+        self.assertEqual(score_fleet(workers=1), 3)
+        self.assertEqual(MachineHealthScore.objects.count(), 3)
+
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+        for machine in self.machines:
+            stored = MachineHealthScore.objects.get(machine=machine)
+            body = client.get(f'/api/machines/{machine.pk}/health-score/').json()
+            self.assertEqual((stored.health_score, stored.trend, stored.model_version),
+                             (body['health_score'], body['trend'], body['model']['version']))
+
+    def test_process_pool_matches_inline_scoring(self):
+        score_fleet(workers=1)
+        inline = dict(MachineHealthScore.objects.values_list('machine_id', 'health_score'))
+
+        self.assertEqual(score_fleet(workers=2), 3)
+        self.assertEqual(dict(MachineHealthScore.objects.values_list('machine_id', 'health_score')), inline)
+        self.assertEqual(set(MachineHealthModel.objects.values_list('version', flat=True)), {2})
+
+    def test_a_refit_during_the_run_gets_its_own_version(self):
+        machine = self.machines[0]
+
+        def refit_first(machine_pk, X):
+            if machine_pk == machine.pk:
+                self.assertEqual(fit_health_model(machine.pk).version, 1)
+            return fit_and_score(machine_pk, X)
+
+        with mock.patch('machines.fleet.fit_and_score', side_effect=refit_first):
+            score_fleet(workers=1)
+        health_model = MachineHealthModel.objects.get(machine=machine)
+        self.assertEqual(health_model.version, 2)
+        self.assertEqual(health_model.trained_at, MachineHealthScore.objects.get(machine=machine).scored_at)
+        self.assertEqual(MachineHealthScore.objects.get(machine=machine).model_version, 2)
+
+    def test_nightly_task_scores_in_process(self):
+        with mock.patch('machines.fleet.ProcessPoolExecutor') as pool:
+            self.assertEqual(tasks.score_fleet.delay().get(), 3)
+        pool.assert_not_called()
+        self.assertEqual(MachineHealthScore.objects.count(), 3)
+
+    def test_health_scores_endpoint_lists_worst_first(self):
+        score_fleet(workers=1)
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+
+        with self.assertNumQueries(2):
+            results = client.get('/api/analytics/health-scores/').json()['results']
+        scores = [row['health_score'] for row in results]
+        self.assertEqual(scores, sorted(scores))
+        self.assertEqual({row['machine_id'] for row in results}, {'CNC-0', 'CNC-1', 'CNC-2'})
+
+
+class AnomalySweepTests(TestCase):
+    def setUp(self):
+        self.machines = [
+            create_machine(f'CNC-{index}')
+            for index in range(2)
+        ]
+
+    def test_grouped_pass_matches_per_machine_passes(self):
+        rng = np.random.default_rng(5)
+        epochs, values, eligible, groups = [], {m: [] for m in MachineReadingStats.METRICS}, [], []
+        expected = []
+        for group, (mean, count) in enumerate([(70, 300), (20, 5), (500, 400)]):
+            machine_epochs = np.sort(rng.uniform(0, 90 * 86400, count)) + 1.7e9
+            machine_values = {
+                metric: np.where(rng.random(count) < 0.1, np.nan, rng.normal(mean, mean / 20, count))
+                for metric in MachineReadingStats.METRICS
+            }
+            machine_eligible = rng.random(count) < 0.95
+            expected.append(flag_anomalies(machine_epochs, machine_values, machine_eligible)[0])
+            epochs.append(machine_epochs)
+            for metric in values:
+                values[metric].append(machine_values[metric])
+            eligible.append(machine_eligible)
+            groups.append(np.full(count, group * 7))
+
+        flags, reasons = flag_anomalies(
+            np.concatenate(epochs), {m: np.concatenate(v) for m, v in values.items()},
+            np.concatenate(eligible), groups=np.concatenate(groups),
+        )
+        self.assertEqual(flags.tolist(), np.concatenate(expected).tolist())
+        self.assertEqual(sorted(reasons), np.flatnonzero(flags).tolist())
+
+    def test_sweep_flags_unscored_readings_once(self):
+        now = timezone.now()
+        for machine in self.machines:
+            MachineReading.objects.bulk_create([
+                MachineReading(machine=machine, temperature=69 + 2 * (i % 2)) for i in range(20)
+            ])
+        MachineReading.objects.update(timestamp=now - timedelta(days=2))
+        MachineReading.objects.bulk_create([
+            MachineReading(machine=machine, temperature=70.5) for machine in self.machines for _ in range(5)
+        ] + [MachineReading(machine=self.machines[0], temperature=95.0)])
+
+        self.assertEqual(sweep_anomalies(now - timedelta(hours=1), timezone.now()), (11, 1))
+        spike = MachineReading.objects.get(is_anomaly=True)
+        self.assertEqual(spike.temperature, 95.0)
+        self.assertIn('Temperature anomaly', spike.anomaly_reason)
+        self.machines[0].refresh_from_db()
+        self.assertEqual(self.machines[0].last_anomaly_at, spike.timestamp)
+
+        self.assertEqual(sweep_anomalies(now - timedelta(hours=1), timezone.now(), [self.machines[0].pk]), (6, 0))
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+        self.machines = [
+            create_machine(f'CNC-00{index}', next_maintenance_date=timezone.localdate() + timedelta(days=10))
+            for index in range(3)
+        ]
+        for value in (70, 71, 72):
+            MachineReading.objects.create(machine=self.machines[0], temperature=value)
+        MachineReading.objects.create(machine=self.machines[1], temperature=50)
+
+    def test_latest_readings_in_two_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/machines/snapshot/?ordering=machine_id')
+        machines = response.json()['machines']
+        self.assertEqual([m['machine_id'] for m in machines], ['CNC-000', 'CNC-001', 'CNC-002'])
+        self.assertEqual([m['latest_reading'] and m['latest_reading']['temperature'] for m in machines],
+                         [72, 50, None])
+        self.assertEqual(machines[0]['days_until_maintenance'], 10)
+
+    def test_unchanged_fleet_returns_not_modified(self):
+        etag = self.client.get('/api/machines/snapshot/')['ETag']
+        response = self.client.get('/api/machines/snapshot/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        MachineReading.objects.create(machine=self.machines[2], temperature=60)
+        response = self.client.get('/api/machines/snapshot/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ReadingPrefetchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+        self.machines = [create_machine(f'CNC-00{index}') for index in range(3)]
+
+    def add_readings(self, count):
+        start = timezone.now() - timedelta(days=30)
+        readings = []
+        for machine in self.machines:
+            offset = machine.readings.count()
+            readings.extend(
+                MachineReading(machine=machine, temperature=offset + index)
+                for index in range(count)
+            )
+        created = MachineReading.objects.bulk_create(readings)
+        # Give every machine strictly increasing timestamps, newest = highest temperature.
+        for reading in created:
+            reading.timestamp = start + timedelta(seconds=reading.temperature)
+        MachineReading.objects.bulk_update(created, ['timestamp'])
+
+    def list_peak_memory(self):
+        tracemalloc.start()
+        try:
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/machines/?ordering=machine_id')
+            return response, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_list_fetches_only_the_latest_reading(self):
+        self.add_readings(10)
+        self.list_peak_memory()
+        response, small = self.list_peak_memory()
+        self.assertEqual([m['latest_reading']['temperature'] for m in response.json()['results']], [9, 9, 9])
+
+        self.add_readings(2000)
+        response, large = self.list_peak_memory()
+        self.assertEqual([m['latest_reading']['temperature'] for m in response.json()['results']], [2009] * 3)
+        self.assertLess(large, small * 1.5)
+
+    def test_readings_param_returns_a_bounded_window(self):
+        self.add_readings(5)
+        machine = self.machines[0]
+
+        with self.assertNumQueries(2):
+            data = self.client.get(f'/api/machines/{machine.pk}/?readings=3').json()
+        self.assertEqual([r['temperature'] for r in data['recent_readings']], [4, 3, 2])
+        self.assertEqual(data['latest_reading']['temperature'], 4)
+
+        data = self.client.get(f'/api/machines/{machine.pk}/').json()
+        self.assertNotIn('recent_readings', data)
+        self.assertEqual(data['latest_reading']['temperature'], 4)
+
+        empty = create_machine('CNC-009')
+        data = self.client.get(f'/api/machines/{empty.pk}/?readings=3').json()
+        self.assertIsNone(data['latest_reading'])
+        self.assertEqual(data['recent_readings'], [])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+        self.machine = create_machine()
+        self.other = create_machine('CNC-002')
+        start = timezone.now() - timedelta(days=1)
+        readings = MachineReading.objects.bulk_create(
+            MachineReading(machine=self.machine if index % 3 else self.other, temperature=70)
+            for index in range(45)
+        )
+        for index, reading in enumerate(readings):
+            # Pairs of readings share a timestamp so the id tiebreaker matters.
+            reading.timestamp = start + timedelta(minutes=index // 2, microseconds=7)
+        MachineReading.objects.bulk_update(readings, ['timestamp'])
+        self.expected = [r.pk for r in sorted(readings, key=lambda r: (r.timestamp, r.pk), reverse=True)]
+
+    def walk(self, url, queries=1):
+        pages = []
+        while url:
+            with self.assertNumQueries(queries):
+                body = self.client.get(url).json()
+            pages.append(body)
+            url = body['next']
+        return pages
+
+    def test_pages_follow_timestamp_and_id_without_counting(self):
+        pages = self.walk('/api/readings/?page_size=10')
+        self.assertEqual([len(page['results']) for page in pages], [10, 10, 10, 10, 5])
+        self.assertEqual([r['id'] for page in pages for r in page['results']], self.expected)
+        self.assertNotIn('count', pages[0])
+        self.assertIsNone(pages[0]['previous'])
+
+        back = self.client.get(pages[2]['previous']).json()
+        self.assertEqual(back['results'], pages[1]['results'])
+        self.assertEqual(self.client.get(back['previous']).json()['results'], pages[0]['results'])
+
+    def test_filters_orderings_and_estimated_count(self):
+        # The filter looks the machine up once per page.
+        pages = self.walk(f'/api/readings/?machine={self.other.pk}&page_size=4', queries=2)
+        ids = [r['id'] for page in pages for r in page['results']]
+        self.assertEqual(ids, [pk for pk in self.expected if pk in set(ids)])
+        self.assertEqual(len(ids), 15)
+
+        pages = self.walk('/api/readings/?ordering=timestamp&page_size=20')
+        self.assertEqual([r['id'] for page in pages for r in page['results']], self.expected[::-1])
+
+        body = self.client.get('/api/readings/?count=estimate').json()
+        self.assertIsInstance(body['estimated_count'], int)
+        self.assertEqual(self.client.get('/api/readings/?cursor=bogus').status_code, 404)
+
+    def test_work_orders_page_on_created_at(self):
+        WorkOrder.objects.bulk_create(
+            WorkOrder(work_order_id=f'WO-{index:03}', machine=self.machine, title='Service',
+                      description='Routine service', scheduled_date=date(2025, 1, 1))
+            for index in range(25)
+        )
+        first = self.client.get('/api/work-orders/').json()
+        second = self.client.get(first['next']).json()
+        ids = [w['work_order_id'] for w in first['results'] + second['results']]
+        self.assertEqual(ids, [f'WO-{index:03}' for index in reversed(range(25))])
+        self.assertIsNone(second['next'])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(username='tech', password='pass'))
+        self.lathe = self.make_machine('CNC-001', 'CNC Lathe', 'Haas Automation')
+        self.press = self.make_machine('PRS-014', 'Hydraulic Press', 'Schuler')
+        self.mill = self.make_machine('MIL-003', 'Vertical Mill', 'CNC Masters')
+
+    def make_machine(self, code, name, manufacturer):
+        return create_machine(code, machine_name=name, manufacturer=manufacturer)
+
+    def search(self, url):
+        return [row.get('machine_id') or row.get('work_order_id') or row.get('part_id')
+                for row in self.client.get(url).json()['results']]
+
+    def test_machines_match_word_prefixes_best_first(self):
+        self.assertEqual(self.search('/api/machines/?search=001'), ['CNC-001'])
+        self.assertEqual(self.search('/api/machines/?search=cnc-0'), ['CNC-001'])
+        self.assertEqual(self.search('/api/machines/?search=hydr'), ['PRS-014'])
+        self.assertEqual(self.search('/api/machines/?search=press schul'), ['PRS-014'])
+        # A code match outranks a manufacturer match.
+        self.assertEqual(self.search('/api/machines/?search=cnc'), ['CNC-001', 'MIL-003'])
+        self.assertEqual(self.search('/api/machines/?search=cnc&ordering=-machine_id'), ['MIL-003', 'CNC-001'])
+        # No words to look up: falls back to plain substring matching.
+        self.assertEqual(self.search('/api/machines/?search=---'), [])
+
+    def test_work_orders_match_their_machine_and_page_by_rank(self):
+        for index in range(25):
+            machine = self.press if index % 5 else self.lathe
+            WorkOrder.objects.create(work_order_id=f'WO-{index:03}', machine=machine, title='Seal replacement',
+                                     description='Replace seals', scheduled_date=date(2025, 1, 1))
+        WorkOrder.objects.create(work_order_id='WO-PRS', machine=self.lathe, title='Check press guard',
+                                 description='Guard inspection', scheduled_date=date(2025, 1, 1))
+
+        self.assertEqual(len(self.search('/api/work-orders/?search=cnc-001')), 6)
+
+        url, found = '/api/work-orders/?search=prs&page_size=7', []
+        while url:
+            body = self.client.get(url).json()
+            found.extend(row['work_order_id'] for row in body['results'])
+            url = body['next']
+        # Its own code and title outrank orders matched only through the machine.
+        self.assertEqual(found[0], 'WO-PRS')
+        self.assertEqual(len(found), len(set(found)), 21)
+
+    def test_broad_machine_matches_are_passed_as_a_subquery(self):
+        for machine in (self.lathe, self.press, self.mill):
+            WorkOrder.objects.create(work_order_id=f'WO-{machine.machine_id}', machine=machine, title='Service',
+                                     description='', scheduled_date=date(2025, 1, 1))
+        with CaptureQueriesContext(connection) as literal:
+            self.assertEqual(sorted(self.search('/api/work-orders/?search=cnc')), ['CNC-001', 'MIL-003'])
+        with mock.patch('factory_maintenance.search.MAX_RELATED_PKS', 1), \
+                CaptureQueriesContext(connection) as subquery:
+            self.assertEqual(sorted(self.search('/api/work-orders/?search=cnc')), ['CNC-001', 'MIL-003'])
+
+        def orders_sql(captured):
+            return [query['sql'] for query in captured if query['sql'].startswith('SELECT "work_orders"')][-1]
+        self.assertNotIn('IN (SELECT', orders_sql(literal))
+        self.assertIn('"machine_id" IN (SELECT', orders_sql(subquery))
+
+    def test_parts_search_and_plain_search_fallback(self):
+        SparePart.objects.create(part_id='BRG-6204', part_name='Ball Bearing', supplier_name='SKF', unit_cost=12)
+        SparePart.objects.create(part_id='FLT-001', part_name='Oil Filter', supplier_name='Bosch', unit_cost=8)
+        self.assertEqual(self.search('/api/parts/?search=6204'), ['BRG-6204'])
+        self.assertEqual(self.search('/api/parts/?search=bos'), ['FLT-001'])
+
+        MachineReading.objects.create(machine=self.lathe, temperature=70)
+        self.assertEqual(len(self.client.get('/api/readings/?search=anything').json()['results']), 1)
@@ -0,0 +1,150 @@
+"""Bounded-size time series of a machine metric for charting.
+
+Fine ranges are served from raw readings, downsampled with
+Largest-Triangle-Three-Buckets when there are more rows than requested
+points. Coarse ranges, and ranges whose readings have expired, are
+aggregated in the database, from the rollup tables when a granularity fits
+and from raw readings otherwise, into at most ``points`` buckets.
+"""
+import math
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from .models import MachineReading
+
+# Above this many raw rows in range, aggregate in the database instead of
+# pulling rows into Python.
+MAX_RAW_ROWS = 20000
+
+ROLLUP_WIDTHS = [
+    ('day', timedelta(days=1)),
+    ('hour', timedelta(hours=1)),
+    ('minute', timedelta(minutes=1)),
+]
+
+def lttb(x, y, threshold):
+    """Downsample ``(x, y)`` to ``threshold`` points with Largest-Triangle-Three-Buckets.
+
+    ``x`` must be sorted ascending. Returns the indexes of the kept points;
+    the first and last points are always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < threshold - 1:
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        selected[i + 1] = previous
+
+    return selected
+
+def _count_rows(machine, metric, start, end, limit):
+    """Count raw rows in range, stopping at ``limit`` so the check stays cheap."""
+    return MachineReading.objects.filter(
+        machine=machine,
+        timestamp__gte=start,
+        timestamp__lt=end,
+        **{f'{metric}__isnull': False}
+    ).values('pk')[:limit].count()
+
+def raw_series(machine, metric, start, end, points):
+    rows = MachineReading.objects.filter(
+        machine=machine,
+        timestamp__gte=start,
+        timestamp__lt=end,
+        **{f'{metric}__isnull': False}
+    ).order_by('timestamp').values_list('timestamp', metric)
+
+    timestamps, values = zip(*rows) if rows else ((), ())
+    if len(timestamps) <= points:
+        return 'raw', [{'t': t, 'value': v} for t, v in zip(timestamps, values)]
+
+    x = np.fromiter((t.timestamp() for t in timestamps), dtype=float, count=len(timestamps))
+    keep = lttb(x, np.asarray(values, dtype=float), points)
+    return 'lttb', [{'t': timestamps[i], 'value': values[i]} for i in keep]
+
+def aggregated_series(machine, metric, start, end, points):
+    """Aggregate into at most ``points`` buckets of equal width in the database."""
+    width = timedelta(seconds=math.ceil((end - start).total_seconds() / points))
+    minute_cutoff = timezone.now() - timedelta(days=settings.ROLLUP_MINUTE_RETENTION_DAYS)
+
+    source = 'raw'
+    for granularity, granularity_width in ROLLUP_WIDTHS:
+        if granularity_width <= width and (granularity != 'minute' or start >= minute_cutoff):
+            source = granularity
+            break
+
+    params = {
+        'width': width,
+        # Binning from ``start`` gives at most ``points`` buckets; a fixed origin could split off one more.
+        'origin': start,
+        'machine': machine.pk,
+        'start': start,
+        'end': end,
+    }
+    if source == 'raw':
+        sql = f"""
+            SELECT date_bin(%(width)s, timestamp, %(origin)s) AS bucket,
+                   AVG({metric}), MIN({metric}), MAX({metric}), COUNT({metric})
+            FROM machine_readings
+            WHERE machine_id = %(machine)s AND timestamp >= %(start)s AND timestamp < %(end)s
+              AND {metric} IS NOT NULL
+            GROUP BY bucket ORDER BY bucket
+        """
+    else:
+        params['granularity'] = source
+        sql = f"""
+            SELECT date_bin(%(width)s, bucket_start, %(origin)s) AS bucket,
+                   SUM({metric}_sum) / SUM({metric}_count), MIN({metric}_min), MAX({metric}_max),
+                   SUM({metric}_count)
+            FROM machine_reading_rollups
+            WHERE machine_id = %(machine)s AND granularity = %(granularity)s
+              AND bucket_start >= %(start)s AND bucket_start < %(end)s
+            GROUP BY bucket HAVING SUM({metric}_count) > 0 ORDER BY bucket
+        """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    return source, width, [
+        {'t': bucket, 'value': mean, 'min': low, 'max': high, 'count': count}
+        for bucket, mean, low, high, count in rows
+    ]
+
+def build_series(machine, metric, start, end, points):
+    """Return ``(resolution, bucket_width, points)`` for ``metric`` between ``start`` and ``end``.
+
+    ``resolution`` is ``raw`` or ``lttb`` for row-level data, otherwise the
+    source that was aggregated (``minute``, ``hour``, ``day`` rollups or
+    ``raw`` readings) and ``bucket_width`` is the bucket size.
+    """
+    # No raw rows may mean expired partitions, whose rollups are kept.
+    if 0 < _count_rows(machine, metric, start, end, MAX_RAW_ROWS + 1) <= MAX_RAW_ROWS:
+        resolution, data = raw_series(machine, metric, start, end, points)
+        return resolution, None, data
+
+    source, width, data = aggregated_series(machine, metric, start, end, points)
+    return f'{source}_aggregate', width, data
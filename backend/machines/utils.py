@@ -4,7 +4,11 @@ from django.core.files import File
 from django.conf import settings
 import numpy as np
 from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
+from .models import MachineReading, MachineReadingStats
 
 def generate_qr_code(machine):
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
@@ -25,42 +29,193 @@ def generate_qr_code(machine):
     machine.qr_code.save(filename, File(buffer), save=True)
     return machine.qr_code.url
 
-def detect_anomaly(machine, new_reading):
-    recent_readings = machine.readings.filter(
-        timestamp__gte=timezone.now() - timedelta(days=30),
-        is_anomaly=False
-    ).order_by('-timestamp')[:50]
-    
-    if recent_readings.count() < 3:
+ANOMALY_METRICS = [
+    ('temperature', "Temperature anomaly: {value}°C (normal: {mean:.1f}±{std:.1f})"),
+    ('vibration_level', "Vibration anomaly: {value} (normal: {mean:.1f}±{std:.1f})"),
+    ('oil_pressure', "Oil pressure anomaly: {value} (normal: {mean:.1f}±{std:.1f})"),
+]
+
+# Relative slack on the 2-sigma bound so rounding in the running mean can
+# never flag a reading that sits exactly on a flat baseline.
+ANOMALY_TOLERANCE = 1e-9
+
+def score_reading(stats, new_reading):
+    """Apply the 2-sigma rule to ``new_reading`` against a machine's running baseline."""
+    if len(stats.window) < 3:
         return False, ""
     
     anomalies = []
     
-    if new_reading.get('temperature'):
-        temps = [r.temperature for r in recent_readings if r.temperature]
-        if temps:
-            mean_temp = np.mean(temps)
-            std_temp = np.std(temps)
-            if abs(new_reading['temperature'] - mean_temp) > 2 * std_temp:
-                anomalies.append(f"Temperature anomaly: {new_reading['temperature']}°C (normal: {mean_temp:.1f}±{std_temp:.1f})")
-    
-    if new_reading.get('vibration_level'):
-        vibs = [r.vibration_level for r in recent_readings if r.vibration_level]
-        if vibs:
-            mean_vib = np.mean(vibs)
-            std_vib = np.std(vibs)
-            if abs(new_reading['vibration_level'] - mean_vib) > 2 * std_vib:
-                anomalies.append(f"Vibration anomaly: {new_reading['vibration_level']} (normal: {mean_vib:.1f}±{std_vib:.1f})")
-    
-    if new_reading.get('oil_pressure'):
-        pressures = [r.oil_pressure for r in recent_readings if r.oil_pressure]
-        if pressures:
-            mean_pressure = np.mean(pressures)
-            std_pressure = np.std(pressures)
-            if abs(new_reading['oil_pressure'] - mean_pressure) > 2 * std_pressure:
-                anomalies.append(f"Oil pressure anomaly: {new_reading['oil_pressure']} (normal: {mean_pressure:.1f}±{std_pressure:.1f})")
+    for metric, message in ANOMALY_METRICS:
+        value = new_reading.get(metric)
+        if not value:
+            continue
+        count, mean, std = stats.baseline(metric)
+        if count and abs(value - mean) > 2 * std + ANOMALY_TOLERANCE * max(1.0, abs(mean)):
+            anomalies.append(message.format(value=value, mean=mean, std=std))
     
     if anomalies:
         return True, "; ".join(anomalies)
     
     return False, ""
+
+def flag_anomalies(timestamps, values, eligible, groups=None):
+    """Apply the 2-sigma rule to readings in one vectorized pass.
+    
+    ``timestamps`` are epoch seconds, ``values`` maps each metric to a float
+    array with NaN for missing values and ``eligible`` marks the rows allowed
+    into the baseline. ``groups`` labels the machine of each row (default: all
+    one machine); rows must be sorted by group, then timestamp. Each row is
+    scored against the last ``BASELINE_WINDOW`` eligible rows of its machine
+    before it within ``BASELINE_DAYS`` of its own timestamp. Unlike live
+    scoring, a row's verdict does not feed back into the baseline of the rows
+    after it: given the live verdicts as ``eligible`` it reproduces them exactly.
+    
+    Returns a boolean array of flags and ``{row_index: reason}`` for flagged rows.
+    """
+    n = len(timestamps)
+    if groups is None:
+        labels = np.zeros(n, dtype=np.int64)
+    else:
+        labels = np.cumsum(np.concatenate([[False], groups[1:] != groups[:-1]])).astype(np.int64)
+    first_rows = np.flatnonzero(np.concatenate([[True], labels[1:] != labels[:-1]])) if n else np.zeros(0, dtype=int)
+    
+    # Spread the machines apart on one time axis so a single sorted search
+    # finds every row's horizon; the search is clamped to the row's machine.
+    span = float(timestamps.max() - timestamps.min()) + 1.0 if n else 1.0
+    keys = timestamps + labels * span
+    
+    eligible_rows = np.flatnonzero(eligible)
+    before = np.searchsorted(eligible_rows, np.arange(n))
+    machine_start = np.searchsorted(eligible_rows, first_rows)[labels]
+    horizon = keys - timedelta(days=MachineReadingStats.BASELINE_DAYS).total_seconds()
+    lower = np.maximum.reduce([before - MachineReadingStats.BASELINE_WINDOW,
+                               np.searchsorted(keys[eligible_rows], horizon), machine_start])
+    lower = np.minimum(lower, before)
+    
+    flags = np.zeros(n, dtype=bool)
+    stats = {}
+    for metric, _ in ANOMALY_METRICS:
+        column = values[metric]
+        present = ~np.isnan(column) & (column != 0)
+        # Shift by each machine's mean so the cumulative sums keep their precision.
+        counts_by_machine = np.bincount(labels, weights=present, minlength=len(first_rows))
+        sums_by_machine = np.bincount(labels, weights=np.where(present, column, 0.0), minlength=len(first_rows))
+        offset = (sums_by_machine / np.maximum(counts_by_machine, 1))[labels]
+        shifted = np.where(present, column - offset, 0.0)[eligible_rows]
+        counts = np.concatenate([[0], np.cumsum(present[eligible_rows])])
+        sums = np.concatenate([[0.0], np.cumsum(shifted)])
+        squares = np.concatenate([[0.0], np.cumsum(shifted * shifted)])
+        
+        count = counts[before] - counts[lower]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (sums[before] - sums[lower]) / count
+            std = np.sqrt(np.maximum((squares[before] - squares[lower]) / count - mean * mean, 0.0))
+        mean += offset
+        
+        flagged = (
+            present & (count > 0) & (before - lower >= 3)
+            & (np.abs(column - mean) > 2 * std + ANOMALY_TOLERANCE * np.maximum(1.0, np.abs(mean)))
+        )
+        flags |= flagged
+        stats[metric] = (flagged, mean, std)
+    
+    reasons = {}
+    for index in np.flatnonzero(flags):
+        reasons[int(index)] = "; ".join(
+            message.format(value=values[metric][index], mean=stats[metric][1][index], std=stats[metric][2][index])
+            for metric, message in ANOMALY_METRICS
+            if stats[metric][0][index]
+        )
+    return flags, reasons
+
+def build_reading_stats(machine_pks, now=None, exclude_pks=()):
+    """Build baselines from reading history with one windowed query.
+    
+    Readings in ``exclude_pks`` are left out, so readings that are already
+    stored but still being scored do not end up in the baseline twice.
+    Returns unsaved ``MachineReadingStats`` keyed by machine pk.
+    """
+    now = now or timezone.now()
+    window = MachineReadingStats.BASELINE_WINDOW
+    stats = {pk: MachineReadingStats(machine_id=pk, window=[]) for pk in machine_pks}
+    
+    history = MachineReading.objects.filter(
+        machine_id__in=machine_pks,
+        timestamp__gte=now - timedelta(days=MachineReadingStats.BASELINE_DAYS),
+        is_anomaly=False
+    ).exclude(
+        pk__in=exclude_pks
+    ).annotate(
+        row_number=Window(RowNumber(), partition_by=[F('machine_id')], order_by=F('timestamp').desc())
+    ).filter(
+        row_number__lte=window
+    ).order_by('machine_id', 'timestamp').values_list('machine_id', 'timestamp', *MachineReadingStats.METRICS)
+    
+    for machine_pk, timestamp, *values in history:
+        stats[machine_pk].window.append([timestamp.timestamp(), *values])
+    
+    for machine_stats in stats.values():
+        machine_stats.recompute()
+    
+    return stats
+
+def load_reading_stats(machine_pks, exclude_pks=()):
+    """Lock and return the baselines of ``machine_pks``, building any that are missing.
+    
+    Must run inside a transaction; the row locks serialise concurrent ingest
+    for the same machine.
+    """
+    machine_pks = set(machine_pks)
+    stats = {
+        s.machine_id: s
+        for s in MachineReadingStats.objects.select_for_update().filter(machine_id__in=machine_pks)
+    }
+    missing = machine_pks - stats.keys()
+    if missing:
+        MachineReadingStats.objects.bulk_create(build_reading_stats(missing, exclude_pks=exclude_pks).values(),
+                                                ignore_conflicts=True)
+        stats.update({
+            s.machine_id: s
+            for s in MachineReadingStats.objects.select_for_update().filter(machine_id__in=missing)
+        })
+    return stats
+
+def detect_anomalies_bulk(readings, exclude_pks=()):
+    """Score a batch of ``(machine_pk, reading_dict)`` pairs in arrival order.
+    
+    Each non-anomalous reading joins its machine's baseline before the next one
+    is scored, exactly as if they had been inserted one by one, and the updated
+    baselines are written back with a single query. Call inside the
+    transaction that inserts the readings so the baseline row locks are held
+    until they commit. ``exclude_pks`` are the stored readings being scored,
+    kept out of any baseline that first has to be built from history.
+    """
+    now = timezone.now()
+    results = []
+    
+    with transaction.atomic():
+        stats = load_reading_stats((machine_pk for machine_pk, _ in readings), exclude_pks)
+        for machine_stats in stats.values():
+            machine_stats.expire(now)
+            machine_stats.updated_at = now
+        
+        for machine_pk, reading in readings:
+            machine_stats = stats[machine_pk]
+            is_anomaly, reason = score_reading(machine_stats, reading)
+            if not is_anomaly:
+                machine_stats.push(now, reading)
+            results.append((is_anomaly, reason))
+        
+        MachineReadingStats.objects.bulk_update(
+            stats.values(),
+            ['window', 'pushes', 'updated_at'] + [
+                f'{metric}_{part}' for metric in MachineReadingStats.METRICS for part in ('count', 'mean', 'm2')
+            ]
+        )
+    
+    return results
+
+def detect_anomaly(machine, new_reading):
+    """Score a single reading and record it in the machine's baseline."""
+    return detect_anomalies_bulk([(machine.pk, new_reading)])[0]
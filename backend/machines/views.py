@@ -4,25 +4,146 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
-from django.http import HttpResponse
-from datetime import timedelta
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connection, transaction
+from django.db.models import Count, Prefetch
+from datetime import datetime, timedelta
+from asgiref.sync import sync_to_async
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
 from io import BytesIO
-from .models import Machine, MachineReading
-from .serializers import MachineSerializer, MachineListSerializer, MachineReadingSerializer
-from .utils import generate_qr_code, detect_anomaly
+from factory_maintenance.pagination import KeysetPagination
+from factory_maintenance.renderers import ORJSONRenderer
+from factory_maintenance.search import RankedSearchFilter
+from .models import Machine, MachineReading, MachineReadingRollup, ReadingUpload
+from .rollups import GRANULARITIES, refresh_rollups
+from .timeseries import build_series
+from .health import health_rank_expression, refresh_last_anomalies
+from .snapshot import MACHINE_FIELDS, build_snapshot, snapshot_etag
+from .isolation import score_latest
+from .forest import MIN_TRAINING_ROWS, TRAINING_DAYS, get_health_model, latest_features
+from .serializers import (MachineSerializer, MachineListSerializer, MachineReadingSerializer,
+                          MachineReadingRollupSerializer, ReadingUploadSerializer)
+from .utils import generate_qr_code
+from .tasks import enqueue_scoring, refit_health_model
+from .ingest import UploadConflict, ingest_readings, ingest_stream, iter_csv_rows, iter_ndjson_rows
+
+MAX_SERIES_POINTS = 5000
+MAX_PREFETCHED_READINGS = 100
+
+STREAM_FORMATS = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+MAX_REPORTED_ERRORS = 100
+
+def ndjson_lines(items):
+    renderer = ORJSONRenderer()
+    for item in items:
+        yield renderer.render(item) + b'\n'
+
+async def iterate_in_thread(iterator):
+    """Step a synchronous iterator from the event loop, each step in the thread of the sync views.
+    
+    Without this, ASGI servers collect a synchronous streaming body in full
+    before sending any of it.
+    """
+    step = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    while (item := await step(iterator, done)) is not done:
+        yield item
+
+def ndjson_response(request, items):
+    """Stream ``items`` as newline-delimited JSON, sending each line as soon as it is produced."""
+    lines = ndjson_lines(items)
+    if isinstance(request._request, ASGIRequest):
+        lines = iterate_in_thread(lines)
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    # Stop nginx from holding acknowledgements back.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def upload_acks(upload, rows, offset, user):
+    """The upload id, then an acknowledgement per committed chunk, then the totals."""
+    yield {'upload_id': upload.id, 'acknowledged_offset': upload.acknowledged_offset}
+    created = failed = reported = 0
+    try:
+        for ack in ingest_stream(upload, rows, offset, user):
+            ack['errors'] = ack['errors'][:MAX_REPORTED_ERRORS - reported]
+            reported += len(ack['errors'])
+            created += ack['created']
+            failed += ack['failed']
+            yield ack
+    except UploadConflict as exc:
+        yield {'error': str(exc), 'acknowledged_offset': upload.acknowledged_offset}
+        return
+    yield {'done': True, 'acknowledged_offset': upload.acknowledged_offset, 'created': created, 'failed': failed}
+
+def parse_time_range(params, default_span):
+    """Read the ``from``/``to`` query params as aware datetimes.
+    
+    Accepts ISO dates or datetimes; ``to`` defaults to now and ``from`` to
+    ``default_span`` before ``to``. Raises ``ValueError`` on bad input.
+    """
+    def parse(name):
+        value = params.get(name)
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f'{name} must be an ISO date or datetime')
+            parsed = datetime.combine(day, datetime.min.time())
+        return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+    
+    end = parse('to') or timezone.now()
+    start = parse('from') or end - default_span
+    if start >= end:
+        raise ValueError('from must be before to')
+    return start, end
 
 class MachineViewSet(viewsets.ModelViewSet):
-    queryset = Machine.objects.select_related('created_by').prefetch_related('readings')
+    queryset = Machine.objects.select_related('created_by').annotate(
+        health_rank=health_rank_expression()
+    )
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['status', 'machine_type', 'location']
+    filter_backends = [DjangoFilterBackend, RankedSearchFilter, filters.OrderingFilter]
+    filterset_fields = ['status', 'machine_type', 'location', 'health_status']
     search_fields = ['machine_id', 'machine_name', 'manufacturer']
-    ordering_fields = ['next_maintenance_date', 'installation_date', 'machine_id']
+    ordering_fields = ['next_maintenance_date', 'installation_date', 'machine_id', 'health_rank', 'last_anomaly_at']
+    
+    def recent_readings_count(self):
+        """How many of each machine's newest readings to return: ``?readings=N``, 1 by default."""
+        try:
+            return min(max(int(self.request.query_params.get('readings', 1)), 1), MAX_PREFETCHED_READINGS)
+        except ValueError:
+            return 1
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'get_by_code'):
+            # A sliced prefetch is numbered per machine with ROW_NUMBER(), so
+            # only the newest readings are fetched, however many there are.
+            readings = MachineReading.objects.select_related('logged_by').order_by('-timestamp')
+            queryset = queryset.prefetch_related(
+                Prefetch('readings', queryset=readings[:self.recent_readings_count()], to_attr='recent_readings')
+            )
+        return queryset
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'retrieve', 'get_by_code') and 'readings' in self.request.query_params:
+            context['include_recent_readings'] = True
+        return context
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -62,7 +183,7 @@ class MachineViewSet(viewsets.ModelViewSet):
             ['Type:', machine.machine_type],
             ['Location:', machine.location],
             ['Status:', machine.status],
-            ['Health Status:', machine.get_health_status()],
+            ['Health Status:', machine.health_status],
             ['Last Maintenance:', str(machine.last_maintenance_date) if machine.last_maintenance_date else 'N/A'],
             ['Next Maintenance:', str(machine.next_maintenance_date) if machine.next_maintenance_date else 'N/A'],
         ]
@@ -153,13 +274,13 @@ class MachineViewSet(viewsets.ModelViewSet):
         if machine.next_maintenance_date:
             days_until = (machine.next_maintenance_date - timezone.now().date()).days
         
-        latest_reading = machine.readings.first()
+        latest_reading = machine.readings.select_related('logged_by').first()
         
         return Response({
             'machine_id': machine.machine_id,
             'machine_name': machine.machine_name,
             'status': machine.status,
-            'health_status': machine.get_health_status(),
+            'health_status': machine.health_status,
             'days_until_maintenance': days_until,
             'next_maintenance_date': machine.next_maintenance_date,
             'latest_reading': MachineReadingSerializer(latest_reading).data if latest_reading else None,
@@ -168,74 +289,117 @@ class MachineViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'], url_path='health-score')
     def health_score(self, request, pk=None):
-        from sklearn.ensemble import IsolationForest
-        import numpy as np
-        
         machine = self.get_object()
-        
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        readings = machine.readings.filter(timestamp__gte=thirty_days_ago).order_by('timestamp')
-        
-        if readings.count() < 10:
+        health_model, estimator = get_health_model(machine.pk)
+        since = timezone.now() - timedelta(days=TRAINING_DAYS)
+        # The model carries the trend and anomaly count of its training window;
+        # only the newest reading is scored here.
+        X = latest_features(machine.pk, since) if health_model is not None else None
+        
+        if health_model is None or not len(X):
+            readings_count = machine.readings.filter(timestamp__gte=since).count()
+            if readings_count < MIN_TRAINING_ROWS:
+                return Response({
+                    'machine_id': machine.machine_id,
+                    'health_score': None,
+                    'status': 'INSUFFICIENT_DATA',
+                    'message': f'Need at least {MIN_TRAINING_ROWS} readings for analysis',
+                    'readings_count': readings_count
+                })
+            refit_health_model.delay(machine.pk)
             return Response({
                 'machine_id': machine.machine_id,
                 'health_score': None,
-                'status': 'INSUFFICIENT_DATA',
-                'message': 'Need at least 10 readings for analysis',
-                'readings_count': readings.count()
+                'status': 'MODEL_PENDING',
+                'message': 'Health model is being trained; showing the rule-based health status',
+                'health_status': machine.health_status,
+                'readings_count': readings_count
             })
         
-        X = []
-        for r in readings:
-            X.append([r.temperature or 0, r.vibration_level or 0, r.oil_pressure or 0])
-        
-        X = np.array(X)
-        
-        model = IsolationForest(contamination=0.1, random_state=42)
-        model.fit(X)
-        
-        scores = model.decision_function(X)
-        latest_score = scores[-1]
-        
-        min_score, max_score = scores.min(), scores.max()
-        health_score = int(((latest_score - min_score) / (max_score - min_score)) * 100) if max_score != min_score else 100
-        
-        if health_score < 60:
-            status = 'CRITICAL'
-            message = 'Immediate maintenance recommended'
-            predicted_days = 3
-        elif health_score < 80:
-            status = 'WARNING'
-            message = 'Schedule maintenance soon'
-            predicted_days = 7
-        else:
-            status = 'HEALTHY'
-            message = 'Machine operating normally'
+        summary = score_latest(estimator, health_model.score_min, health_model.score_max, X)
+        predicted_days = summary['predicted_days']
+        if predicted_days is None:
             predicted_days = machine.maintenance_frequency_days if machine.next_maintenance_date else 30
-        
-        mid = len(scores) // 2
-        trend = 'IMPROVING' if np.mean(scores[mid:]) > np.mean(scores[:mid]) else 'DECLINING'
-        
         predicted_maintenance = timezone.now().date() + timedelta(days=predicted_days)
         
         return Response({
             'machine_id': machine.machine_id,
             'machine_name': machine.machine_name,
-            'health_score': health_score,
-            'status': status,
-            'message': message,
-            'trend': trend,
+            'health_score': summary['health_score'],
+            'status': summary['status'],
+            'message': summary['message'],
+            'trend': health_model.trend or None,
             'scheduled_maintenance': machine.next_maintenance_date,
             'predicted_maintenance': predicted_maintenance,
             'days_until_predicted': predicted_days,
-            'readings_analyzed': readings.count(),
-            'anomalies_detected': int((model.predict(X) == -1).sum())
+            'readings_analyzed': health_model.training_rows,
+            'anomalies_detected': health_model.anomalies_detected,
+            'model': {
+                'version': health_model.version,
+                'trained_at': health_model.trained_at,
+                'age_seconds': int((timezone.now() - health_model.trained_at).total_seconds()),
+                'training_rows': health_model.training_rows,
+                'window_start': health_model.window_start,
+                'window_end': health_model.window_end,
+            }
+        })
+    
+    @action(detail=True, methods=['get'], url_path='rollups')
+    def rollups(self, request, pk=None):
+        machine = self.get_object()
+        granularity = request.query_params.get('granularity', 'hour')
+        if granularity not in GRANULARITIES:
+            return Response({'error': f"granularity must be one of {', '.join(GRANULARITIES)}"},
+                          status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start, end = parse_time_range(request.query_params, default_span=timedelta(days=1))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        rollups = MachineReadingRollup.objects.filter(
+            machine=machine,
+            granularity=granularity,
+            bucket_start__gte=start,
+            bucket_start__lt=end,
+        )
+        
+        return Response({
+            'machine_id': machine.machine_id,
+            'granularity': granularity,
+            'from': start,
+            'to': end,
+            'buckets': MachineReadingRollupSerializer(rollups, many=True).data
+        })
+    
+    @action(detail=True, methods=['get'], url_path='series')
+    def series(self, request, pk=None):
+        machine = self.get_object()
+        metric = request.query_params.get('metric', 'temperature')
+        if metric not in MachineReadingRollup.METRICS:
+            return Response({'error': f"metric must be one of {', '.join(MachineReadingRollup.METRICS)}"},
+                          status=status.HTTP_400_BAD_REQUEST)
+        try:
+            points = min(max(int(request.query_params.get('points', 500)), 3), MAX_SERIES_POINTS)
+            start, end = parse_time_range(request.query_params, default_span=timedelta(days=1))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        resolution, bucket_width, data = build_series(machine, metric, start, end, points)
+        
+        return Response({
+            'machine_id': machine.machine_id,
+            'metric': metric,
+            'from': start,
+            'to': end,
+            'resolution': resolution,
+            'bucket_seconds': int(bucket_width.total_seconds()) if bucket_width else None,
+            'points': data
         })
     
     @action(detail=False, methods=['get'], url_path='by-code/(?P<machine_code>[^/.]+)')
     def get_by_code(self, request, machine_code=None):
         try:
-            machine = Machine.objects.get(machine_id=machine_code)
+            machine = self.get_queryset().get(machine_id=machine_code)
             serializer = self.get_serializer(machine)
             return Response(serializer.data)
         except Machine.DoesNotExist:
@@ -243,7 +407,7 @@ class MachineViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def dashboard(self, request):
-        machines = self.get_queryset()
+        machines = self.filter_queryset(self.get_queryset()).prefetch_related(None)
         
         dashboard_data = []
         for machine in machines:
@@ -254,7 +418,7 @@ class MachineViewSet(viewsets.ModelViewSet):
                 'machine_type': machine.machine_type,
                 'location': machine.location,
                 'status': machine.status,
-                'health_status': machine.get_health_status(),
+                'health_status': machine.health_status,
                 'next_maintenance_date': machine.next_maintenance_date,
                 'days_until_maintenance': (machine.next_maintenance_date - timezone.now().date()).days if machine.next_maintenance_date else None,
             })
@@ -264,37 +428,58 @@ class MachineViewSet(viewsets.ModelViewSet):
             'operational': machines.filter(status='OPERATIONAL').count(),
             'under_maintenance': machines.filter(status='UNDER_MAINTENANCE').count(),
             'down': machines.filter(status='DOWN').count(),
+            'health_status': dict(machines.order_by().values_list('health_status').annotate(count=Count('pk'))),
         }
         
         return Response({
             'machines': dashboard_data,
             'summary': summary
         })
+    
+    @action(detail=False, methods=['get'])
+    def snapshot(self, request):
+        """Every machine with its health and latest reading, in two queries; honours ``If-None-Match``."""
+        machines = self.filter_queryset(self.get_queryset()).select_related(None).prefetch_related(None)
+        data = build_snapshot(list(machines.values(*MACHINE_FIELDS)))
+        
+        etag = snapshot_etag(data)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response({'count': len(data), 'machines': data}, headers=headers)
+
+class ReadingPagination(KeysetPagination):
+    ordering = '-timestamp'
 
 class MachineReadingViewSet(viewsets.ModelViewSet):
     queryset = MachineReading.objects.select_related('machine', 'logged_by')
     serializer_class = MachineReadingSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ReadingPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['machine', 'is_anomaly', 'logged_by']
     ordering_fields = ['timestamp']
     
     def perform_create(self, serializer):
-        machine = serializer.validated_data['machine']
-        
-        reading_data = {
-            'temperature': serializer.validated_data.get('temperature'),
-            'vibration_level': serializer.validated_data.get('vibration_level'),
-            'oil_pressure': serializer.validated_data.get('oil_pressure'),
-        }
-        
-        is_anomaly, anomaly_reason = detect_anomaly(machine, reading_data)
-        
-        serializer.save(
-            logged_by=self.request.user,
-            is_anomaly=is_anomaly,
-            anomaly_reason=anomaly_reason
-        )
+        with transaction.atomic():
+            reading = serializer.save(logged_by=self.request.user)
+            enqueue_scoring([reading])
+    
+    def perform_update(self, serializer):
+        previous = (serializer.instance.machine_id, serializer.instance.timestamp)
+        was_anomaly = serializer.instance.is_anomaly
+        with transaction.atomic():
+            reading = serializer.save()
+            refresh_rollups({previous, (reading.machine_id, reading.timestamp)})
+            if was_anomaly and reading.machine_id != previous[0]:
+                refresh_last_anomalies({previous[0], reading.machine_id})
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            refresh_rollups([(instance.machine_id, instance.timestamp)])
+            if instance.is_anomaly:
+                refresh_last_anomalies([instance.machine_id])
     
     @action(detail=False, methods=['post'], url_path='log')
     def log_reading(self, request):
@@ -317,27 +502,96 @@ class MachineReadingViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'], url_path='bulk')
     def bulk_log(self, request):
         readings_data = request.data.get('readings', [])
-        created_readings = []
-        errors = []
-        
-        for reading_data in readings_data:
-            machine_id = reading_data.get('machine_id')
-            try:
-                machine = Machine.objects.get(machine_id=machine_id)
-                reading_data['machine'] = machine.id
-                
-                serializer = self.get_serializer(data=reading_data)
-                if serializer.is_valid():
-                    self.perform_create(serializer)
-                    created_readings.append(serializer.data)
-                else:
-                    errors.append({'machine_id': machine_id, 'errors': serializer.errors})
-            except Machine.DoesNotExist:
-                errors.append({'machine_id': machine_id, 'error': 'Machine not found'})
+        if not isinstance(readings_data, list):
+            return Response({'error': 'readings must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        created_readings, errors = ingest_readings(readings_data, request.user)
         
         return Response({
             'created': len(created_readings),
             'failed': len(errors),
-            'readings': created_readings,
+            'readings': MachineReadingSerializer(created_readings, many=True).data,
             'errors': errors
         }, status=status.HTTP_201_CREATED if created_readings else status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['post'], url_path='stream')
+    def stream_upload(self, request):
+        # Reads the raw body line by line; ``request.data`` must not be touched.
+        upload_format = STREAM_FORMATS.get(request.content_type.split(';')[0].strip())
+        if upload_format is None:
+            return Response({'error': f"Content-Type must be one of {', '.join(STREAM_FORMATS)}"},
+                          status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        
+        try:
+            offset = int(request.query_params.get('offset', 0))
+            if offset < 0:
+                raise ValueError(offset)
+            upload_id = request.query_params.get('upload_id')
+            if upload_id:
+                upload, _ = ReadingUpload.objects.get_or_create(
+                    pk=upload_id, defaults={'format': upload_format, 'uploaded_by': request.user}
+                )
+            else:
+                upload = ReadingUpload.objects.create(format=upload_format, uploaded_by=request.user)
+        except (ValueError, DjangoValidationError):
+            return Response({'error': 'offset must be a non-negative integer and upload_id a UUID'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        if upload.uploaded_by_id != request.user.id:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        if upload.format != upload_format:
+            return Response({'error': f'Upload {upload.id} is {upload.format}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if offset > upload.acknowledged_offset:
+            return Response({
+                'error': f'offset {offset} is past the acknowledged offset {upload.acknowledged_offset}',
+                'upload_id': upload.id,
+                'acknowledged_offset': upload.acknowledged_offset,
+            }, status=status.HTTP_409_CONFLICT)
+        
+        # The body is read as the response is sent, one chunk ahead of its acknowledgement.
+        stream = request.stream or []
+        rows = iter_csv_rows(stream) if upload_format == 'csv' else iter_ndjson_rows(stream)
+        return ndjson_response(request, upload_acks(upload, rows, offset, request.user))
+    
+    @action(detail=False, methods=['get'], url_path='stream/(?P<upload_id>[^/.]+)')
+    def stream_status(self, request, upload_id=None):
+        try:
+            upload = ReadingUpload.objects.get(pk=upload_id, uploaded_by=request.user)
+        except (ReadingUpload.DoesNotExist, DjangoValidationError):
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ReadingUploadSerializer(upload).data)
+    
+    @action(detail=False, methods=['get'], url_path='scoring-lag')
+    def scoring_lag(self, request):
+        try:
+            minutes = max(1, int(request.query_params.get('minutes', 60)))
+        except ValueError:
+            return Response({'error': 'minutes must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        since = timezone.now() - timedelta(minutes=minutes)
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT
+                    COUNT(scored_at),
+                    COUNT(*) - COUNT(scored_at),
+                    AVG(EXTRACT(EPOCH FROM scored_at - timestamp)),
+                    PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM scored_at - timestamp)),
+                    PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM scored_at - timestamp)),
+                    MAX(EXTRACT(EPOCH FROM scored_at - timestamp))
+                FROM machine_readings
+                WHERE timestamp >= %s
+            """, [since])
+            scored, pending, mean, p50, p95, worst = cursor.fetchone()
+        
+        return Response({
+            'window_minutes': minutes,
+            'scored': scored,
+            'pending': pending,
+            'lag_seconds': {
+                'mean': float(mean) if mean is not None else None,
+                'p50': p50,
+                'p95': p95,
+                'max': float(worst) if worst is not None else None,
+            }
+        })
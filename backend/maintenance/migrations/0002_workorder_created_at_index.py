@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workorder',
+            index=models.Index(fields=['-created_at', '-id'], name='work_orders_created_372de6_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1 on 2026-10-18 12:18
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0002_workorder_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sparepart',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector(models.Func(models.F('part_id'), models.Value('[^[:alnum:]]+'), models.Value(' '), models.Value('g'), function='regexp_replace'), config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector(models.Func(models.F('part_name'), models.Value('[^[:alnum:]]+'), models.Value(' '), models.Value('g'), function='regexp_replace'), config='simple', weight='B'), django.contrib.postgres.search.SearchConfig('simple')), '||', django.contrib.postgres.search.SearchVector(models.Func(models.F('supplier_name'), models.Value('[^[:alnum:]]+'), models.Value(' '), models.Value('g'), function='regexp_replace'), config='simple', weight='C'), django.contrib.postgres.search.SearchConfig('simple')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddField(
+            model_name='workorder',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector(models.Func(models.F('work_order_id'), models.Value('[^[:alnum:]]+'), models.Value(' '), models.Value('g'), function='regexp_replace'), config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector(models.Func(models.F('title'), models.Value('[^[:alnum:]]+'), models.Value(' '), models.Value('g'), function='regexp_replace'), config='simple', weight='B'), django.contrib.postgres.search.SearchConfig('simple')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='sparepart',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='spare_parts_search__99eeac_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='workorder',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='work_orders_search__e68cf6_gin'),
+        ),
+    ]
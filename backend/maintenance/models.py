@@ -1,7 +1,10 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 from machines.models import Machine
 from authentication.models import CustomUser
+from factory_maintenance.search import search_vector
 
 class WorkOrder(models.Model):
     STATUS_CHOICES = [
@@ -46,6 +49,11 @@ class WorkOrder(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    search_vector = models.GeneratedField(
+        expression=search_vector(A='work_order_id', B='title'),
+        output_field=SearchVectorField(), db_persist=True,
+    )
+    
     class Meta:
         db_table = 'work_orders'
         ordering = ['-created_at']
@@ -53,6 +61,8 @@ class WorkOrder(models.Model):
             models.Index(fields=['work_order_id']),
             models.Index(fields=['status']),
             models.Index(fields=['scheduled_date']),
+            models.Index(fields=['-created_at', '-id']),
+            GinIndex(fields=['search_vector']),
         ]
     
     def __str__(self):
@@ -79,9 +89,17 @@ class SparePart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    search_vector = models.GeneratedField(
+        expression=search_vector(A='part_id', B='part_name', C='supplier_name'),
+        output_field=SearchVectorField(), db_persist=True,
+    )
+    
     class Meta:
         db_table = 'spare_parts'
         ordering = ['part_name']
+        indexes = [
+            GinIndex(fields=['search_vector']),
+        ]
     
     def __str__(self):
         return f"{self.part_id} - {self.part_name}"
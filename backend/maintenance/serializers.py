@@ -19,7 +19,7 @@ class WorkOrderSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = WorkOrder
-        fields = '__all__'
+        exclude = ['search_vector']
         read_only_fields = ['created_by', 'created_at', 'updated_at', 'started_at', 'completed_at']
 
 class WorkOrderListSerializer(serializers.ModelSerializer):
@@ -38,8 +38,9 @@ class SparePartSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = SparePart
-        fields = '__all__'
+        exclude = ['search_vector']
         read_only_fields = ['created_at', 'updated_at']
     
     def get_compatible_machine_ids(self, obj):
-        return list(obj.compatible_machines.values_list('machine_id', flat=True))
+        # Reads the view's prefetch; values_list() would query once per part.
+        return [machine.machine_id for machine in obj.compatible_machines.all()]
@@ -4,19 +4,36 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
-from django.db.models import F
+from django.db.models import F, Prefetch
+from factory_maintenance.pagination import KeysetPagination
+from factory_maintenance.search import RankedSearchFilter
 from .models import WorkOrder, SparePart, SparePartUsage
 from .serializers import (WorkOrderSerializer, WorkOrderListSerializer, 
                           SparePartSerializer, SparePartUsageSerializer)
 
+class WorkOrderPagination(KeysetPagination):
+    ordering = '-created_at'
+
 class WorkOrderViewSet(viewsets.ModelViewSet):
-    queryset = WorkOrder.objects.select_related('machine', 'assigned_to', 'created_by').prefetch_related('parts_used')
+    queryset = WorkOrder.objects.select_related('machine', 'assigned_to', 'created_by')
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = WorkOrderPagination
+    filter_backends = [DjangoFilterBackend, RankedSearchFilter, filters.OrderingFilter]
     filterset_fields = ['status', 'priority', 'assigned_to', 'machine']
     search_fields = ['work_order_id', 'title', 'machine__machine_id']
+    search_related = ['machine']
     ordering_fields = ['scheduled_date', 'created_at', 'priority']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            # The list serializer has no parts; the detail one names each part.
+            queryset = queryset.prefetch_related(self.parts_used_prefetch())
+        return queryset
+    
+    def parts_used_prefetch(self):
+        return Prefetch('parts_used', queryset=SparePartUsage.objects.select_related('spare_part'))
+    
     def get_serializer_class(self):
         if self.action == 'list':
             return WorkOrderListSerializer
@@ -25,6 +42,13 @@ class WorkOrderViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
     
+    def perform_update(self, serializer):
+        work_order = serializer.save()
+        # UpdateModelMixin drops prefetched relations after saving, which
+        # would look up each part's name on its own; render a reloaded copy.
+        queryset = self.get_queryset().prefetch_related(self.parts_used_prefetch())
+        serializer.instance = queryset.get(pk=work_order.pk)
+    
     @action(detail=True, methods=['post'], url_path='start')
     def start_work(self, request, pk=None):
         work_order = self.get_object()
@@ -77,7 +101,7 @@ class WorkOrderViewSet(viewsets.ModelViewSet):
             else:
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        work_order.parts_cost = sum([p['spare_part'].unit_cost * p['quantity_used'] 
+        work_order.parts_cost = sum([p.spare_part.unit_cost * p.quantity_used 
                                      for p in SparePartUsage.objects.filter(work_order=work_order)
                                      .select_related('spare_part')])
         work_order.save(update_fields=['parts_cost'])
@@ -88,7 +112,7 @@ class SparePartViewSet(viewsets.ModelViewSet):
     queryset = SparePart.objects.prefetch_related('compatible_machines')
     serializer_class = SparePartSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, RankedSearchFilter, filters.OrderingFilter]
     search_fields = ['part_id', 'part_name', 'supplier_name']
     ordering_fields = ['part_name', 'quantity_in_stock', 'unit_cost']
     
@@ -71,8 +71,8 @@ r = requests.get(f"{BASE}/machines/{machine_id}/report/", headers=headers)
 print(f"✅ PDF: {r.status_code == 200}\n")
 
 print("10. Notifications...")
-r = requests.get(f"{BASE}/analytics/notifications/", headers=headers)
-print(f"✅ Alerts: {r.json()['total']}\n")
+r = requests.get(f"{BASE}/analytics/notifications/unread-count/", headers=headers)
+print(f"✅ Alerts: {r.json()['unread']}\n")
 
 print("11. QR Scan (Get by Code)...")
 r = requests.get(f"{BASE}/machines/by-code/{machine_code}/", headers=headers)
@@ -18,40 +18,20 @@ export default function DashboardPage() {
 
   const fetchDashboard = async () => {
     try {
-      const [machinesRes, analyticsRes] = await Promise.all([
-        api.get('/machines/dashboard/'),
+      const [snapshotRes, analyticsRes] = await Promise.all([
+        api.get('/machines/snapshot/'),
         api.get('/analytics/dashboard/')
       ])
       
-      const machineData = machinesRes.data.machines || []
-      const machinesWithReadings = await Promise.all(
-        machineData.map(async (m: any) => {
-          try {
-            const readingsRes = await api.get(`/machines/${m.id}/`)
-            const latestReading = readingsRes.data.latest_reading
-            return {
-              id: m.id,
-              name: m.machine_name,
-              location: m.location,
-              status: m.health_status === 'GREEN' ? 'healthy' : m.health_status === 'YELLOW' ? 'warning' : 'critical',
-              temp: latestReading?.temperature || 0,
-              vibration: latestReading?.vibration_level || 0,
-              nextMaint: m.next_maintenance_date
-            }
-          } catch (error) {
-            return {
-              id: m.id,
-              name: m.machine_name,
-              location: m.location,
-              status: m.health_status === 'GREEN' ? 'healthy' : m.health_status === 'YELLOW' ? 'warning' : 'critical',
-              temp: 0,
-              vibration: 0,
-              nextMaint: m.next_maintenance_date
-            }
-          }
-        })
-      )
-      setMachines(machinesWithReadings)
+      setMachines((snapshotRes.data.machines || []).map((m: any) => ({
+        id: m.id,
+        name: m.machine_name,
+        location: m.location,
+        status: m.health_status === 'GREEN' ? 'healthy' : m.health_status === 'YELLOW' ? 'warning' : 'critical',
+        temp: m.latest_reading?.temperature || 0,
+        vibration: m.latest_reading?.vibration_level || 0,
+        nextMaint: m.next_maintenance_date
+      })))
       
       const analytics = analyticsRes.data
       setStats({
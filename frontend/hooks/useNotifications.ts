@@ -4,14 +4,16 @@ import { useState, useEffect } from "react"
 import api from "@/lib/api"
 
 export interface Notification {
-  id: string
+  id: number
   title: string
   message: string
-  type: "anomaly" | "maintenance" | "low_stock" | "alert"
-  priority: "low" | "medium" | "high" | "critical"
+  type: "ANOMALY_DETECTED" | "OVERDUE_MAINTENANCE" | "UPCOMING_MAINTENANCE" | "LOW_STOCK" | "PENDING_WORK_ORDER"
+  severity: "LOW" | "MEDIUM" | "HIGH" | "CRITICAL"
   timestamp: string
-  read: boolean
-  machine_id?: string
+  is_read: boolean
+  machine_id?: string | null
+  part_id?: string | null
+  work_order_id?: string | null
 }
 
 export function useNotifications() {
@@ -21,17 +23,25 @@ export function useNotifications() {
 
   useEffect(() => {
     fetchNotifications()
-    const interval = setInterval(fetchNotifications, 10000)
+    const interval = setInterval(fetchUnreadCount, 10000)
     return () => clearInterval(interval)
   }, [])
 
+  const fetchUnreadCount = async () => {
+    try {
+      const response = await api.get("/analytics/notifications/unread-count/")
+      setUnreadCount(response.data.unread)
+    } catch (error) {
+      console.error("Failed to fetch unread count:", error)
+    }
+  }
+
   const fetchNotifications = async () => {
     try {
       setLoading(true)
-      const response = await api.get("/notifications/")
-      setNotifications(response.data)
-      const unread = response.data.filter((n: Notification) => !n.read).length
-      setUnreadCount(unread)
+      const response = await api.get("/analytics/notifications/")
+      setNotifications(response.data.results)
+      await fetchUnreadCount()
     } catch (error) {
       console.error("Failed to fetch notifications:", error)
     } finally {
@@ -39,11 +49,11 @@ export function useNotifications() {
     }
   }
 
-  const markAsRead = async (id: string) => {
+  const markAsRead = async (id: number) => {
     try {
-      await api.patch(`/notifications/${id}/`, { read: true })
-      setNotifications((notifs) => notifs.map((n) => (n.id === id ? { ...n, read: true } : n)))
-      setUnreadCount(Math.max(0, unreadCount - 1))
+      await api.post(`/analytics/notifications/${id}/read/`)
+      setNotifications((notifs) => notifs.map((n) => (n.id === id ? { ...n, is_read: true } : n)))
+      setUnreadCount((count) => Math.max(0, count - 1))
     } catch (error) {
       console.error("Failed to mark notification as read:", error)
     }
@@ -51,11 +61,11 @@ export function useNotifications() {
 
   const clearAll = async () => {
     try {
-      await api.post("/notifications/clear/")
-      setNotifications([])
+      await api.post("/analytics/notifications/read-all/")
+      setNotifications((notifs) => notifs.map((n) => ({ ...n, is_read: true })))
       setUnreadCount(0)
     } catch (error) {
-      console.error("Failed to clear notifications:", error)
+      console.error("Failed to mark notifications as read:", error)
     }
   }
 